@@ -8,7 +8,7 @@ from flask_cors import CORS
 mongo = PyMongo()
 
 api = Api(title="KPI Agent API", version="1.0", doc="/docs")  # <- enables Swagger at /docs
-def create_app():
+def create_app(config=None):
     load_dotenv()  # Load env variables
     app = Flask(__name__)
     CORS(
@@ -16,15 +16,226 @@ def create_app():
     resources={r"/*": {"origins": ["http://localhost:8081",  "https://Trishna2005Das.github.io"]}},
     supports_credentials=True,
     allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["X-Next-Cursor"],
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"]
 )
     
     app.config["MONGO_URI"] = os.getenv("MONGO_URI")
+    # Storage engine for tasks, logs and users: "mongo" or "memory" (no MongoDB at
+    # all; for tests and benchmarks - also switches the job queue and revocation list to memory)
+    app.config["STORAGE_BACKEND"] = os.getenv("STORAGE_BACKEND", "mongo")
     app.config["JWT_SECRET"] = os.getenv("JWT_SECRET")
     app.config["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
     app.config["GEMINI_API_KEY"] = os.getenv("GEMINI_API_KEY")
-    mongo.init_app(app)
+
+    # Verified-token cache and revocation list used by token_required
+    app.config["JWT_CACHE_ENABLED"] = os.getenv("JWT_CACHE_ENABLED", "true").lower() == "true"
+    app.config["JWT_CACHE_SIZE"] = int(os.getenv("JWT_CACHE_SIZE", 10000))
+    app.config["JWT_CACHE_TTL"] = int(os.getenv("JWT_CACHE_TTL", 60))
+    app.config["JWT_REVOCATION_BACKEND"] = os.getenv("JWT_REVOCATION_BACKEND", "mongo")  # mongo | memory
+
+    # Password hashing pool (signup/login); BCRYPT_ROUNDS changes are applied by rehash-on-login
+    app.config["BCRYPT_ROUNDS"] = int(os.getenv("BCRYPT_ROUNDS", 12))
+    app.config["BCRYPT_WORKERS"] = int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 1))
+    app.config["BCRYPT_MAX_QUEUE"] = int(os.getenv("BCRYPT_MAX_QUEUE", 4 * (os.cpu_count() or 1)))
+    app.config["BCRYPT_TIMEOUT"] = float(os.getenv("BCRYPT_TIMEOUT", 10))
+
+    # GET /tasks page size (default and upper bound for ?limit=)
+    app.config["TASKS_PAGE_SIZE"] = int(os.getenv("TASKS_PAGE_SIZE", 100))
+    app.config["TASKS_MAX_PAGE_SIZE"] = int(os.getenv("TASKS_MAX_PAGE_SIZE", 1000))
+
+    # GET /logs page size (NDJSON streaming mode is unbounded unless ?limit= is set)
+    app.config["LOGS_PAGE_SIZE"] = int(os.getenv("LOGS_PAGE_SIZE", 500))
+    app.config["LOGS_MAX_PAGE_SIZE"] = int(os.getenv("LOGS_MAX_PAGE_SIZE", 5000))
+
+    # Buffered log writer: batches log inserts off the request path
+    app.config["LOG_SINK_ENABLED"] = os.getenv("LOG_SINK_ENABLED", "true").lower() == "true"
+    app.config["LOG_SINK_BATCH_SIZE"] = int(os.getenv("LOG_SINK_BATCH_SIZE", 100))
+    app.config["LOG_SINK_FLUSH_INTERVAL"] = float(os.getenv("LOG_SINK_FLUSH_INTERVAL", 1.0))
+    app.config["LOG_SINK_MAX_QUEUE"] = int(os.getenv("LOG_SINK_MAX_QUEUE", 10000))
+    app.config["LOG_SINK_POLICY"] = os.getenv("LOG_SINK_POLICY", "block")  # block | drop_newest | drop_oldest | sync
+    app.config["LOG_SINK_ORDERED"] = os.getenv("LOG_SINK_ORDERED", "false").lower() == "true"
+    app.config["LOG_SINK_MAX_RETRIES"] = int(os.getenv("LOG_SINK_MAX_RETRIES", 3))
+
+    # Max rows per /tasks/bulk request
+    app.config["TASKS_BULK_MAX"] = int(os.getenv("TASKS_BULK_MAX", 10000))
+
+    # Agent job queue: "mongo" (shared by all processes) or "memory" (tests)
+    app.config["AI_JOB_BACKEND"] = os.getenv("AI_JOB_BACKEND", "mongo")
+    app.config["AI_WORKER_CONCURRENCY"] = int(os.getenv("AI_WORKER_CONCURRENCY", 4))
+    # false: run the workers in worker.py. The LLM circuit breaker is per process, so the API
+    # then only refuses run-ai with 503 "deferred" after its own streaming calls failed.
+    app.config["AI_WORKERS_IN_PROCESS"] = os.getenv("AI_WORKERS_IN_PROCESS", "true").lower() == "true"
+    # Workers renew a job's lease every third of it while the run is in progress; a job
+    # whose lease lapses is claimed again, up to AI_JOB_MAX_ATTEMPTS claims in all
+    app.config["AI_JOB_LEASE_SECONDS"] = int(os.getenv("AI_JOB_LEASE_SECONDS", 120))
+    app.config["AI_JOB_MAX_ATTEMPTS"] = int(os.getenv("AI_JOB_MAX_ATTEMPTS", 3))
+    app.config["AI_WORKER_POLL_INTERVAL"] = float(os.getenv("AI_WORKER_POLL_INTERVAL", 0.5))
+
+    # Gemini (app.utils.langchain_tools). GEMINI_MODEL_NAME is for reference only (and
+    # the response cache key); the streaming endpoint is derived from GEMINI_API_ENDPOINT
+    # (":streamGenerateContent?alt=sse") when GEMINI_STREAM_ENDPOINT is unset
+    app.config["GEMINI_API_ENDPOINT"] = os.getenv("GEMINI_API_ENDPOINT")
+    app.config["GEMINI_MODEL_NAME"] = os.getenv("GEMINI_MODEL_NAME")
+    app.config["GEMINI_STREAM_ENDPOINT"] = os.getenv("GEMINI_STREAM_ENDPOINT")
+    # Connection pool / timeout / retry tuning for the shared Gemini client
+    app.config["GEMINI_POOL_SIZE"] = int(os.getenv("GEMINI_POOL_SIZE", 10))
+    app.config["GEMINI_CONNECT_TIMEOUT"] = float(os.getenv("GEMINI_CONNECT_TIMEOUT", 3.05))
+    app.config["GEMINI_READ_TIMEOUT"] = float(os.getenv("GEMINI_READ_TIMEOUT", 20))
+    app.config["GEMINI_MAX_RETRIES"] = int(os.getenv("GEMINI_MAX_RETRIES", 2))
+    app.config["GEMINI_BACKOFF_BASE"] = float(os.getenv("GEMINI_BACKOFF_BASE", 0.5))
+    app.config["GEMINI_BACKOFF_MAX"] = float(os.getenv("GEMINI_BACKOFF_MAX", 8))
+    # Connections for the asyncio client (ASGI mode), where many runs wait on Gemini at once
+    app.config["GEMINI_ASYNC_POOL_SIZE"] = int(os.getenv("GEMINI_ASYNC_POOL_SIZE", 100))
+
+    # Prompt-level response cache (in-memory LRU, optionally backed by Mongo)
+    app.config["AI_CACHE_ENABLED"] = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+    app.config["AI_CACHE_MAX_ENTRIES"] = int(os.getenv("AI_CACHE_MAX_ENTRIES", 1024))
+    app.config["AI_CACHE_TTL_SECONDS"] = int(os.getenv("AI_CACHE_TTL_SECONDS", 86400))
+    app.config["AI_CACHE_MONGO"] = os.getenv("AI_CACHE_MONGO", "false").lower() == "true"
+
+    # Micro-batching (app.utils.micro_batch): uncached prompts of one user of at most
+    # AI_MICROBATCH_MAX_PROMPT_TOKENS that arrive within AI_MICROBATCH_WINDOW_MS of each
+    # other go to Gemini as one multi-part request, up to AI_MICROBATCH_MAX_PROMPTS
+    # prompts / AI_MICROBATCH_MAX_TOKENS tokens per request
+    app.config["AI_MICROBATCH_ENABLED"] = os.getenv("AI_MICROBATCH_ENABLED", "false").lower() == "true"
+    app.config["AI_MICROBATCH_MAX_PROMPT_TOKENS"] = int(os.getenv("AI_MICROBATCH_MAX_PROMPT_TOKENS", 256))
+    app.config["AI_MICROBATCH_MAX_PROMPTS"] = int(os.getenv("AI_MICROBATCH_MAX_PROMPTS", 8))
+    app.config["AI_MICROBATCH_MAX_TOKENS"] = int(os.getenv("AI_MICROBATCH_MAX_TOKENS", 2048))
+    app.config["AI_MICROBATCH_WINDOW_MS"] = float(os.getenv("AI_MICROBATCH_WINDOW_MS", 25))
+
+    # Admission control for Gemini calls (app.utils.llm_guard): AIMD limit on calls in
+    # flight (slower than the latency target counts as congestion), how long a call may
+    # wait for a slot, and the circuit breaker that fails fast while Gemini is unhealthy
+    app.config["LLM_CONCURRENCY_INITIAL"] = int(os.getenv("LLM_CONCURRENCY_INITIAL", 16))
+    app.config["LLM_CONCURRENCY_MIN"] = int(os.getenv("LLM_CONCURRENCY_MIN", 1))
+    app.config["LLM_CONCURRENCY_MAX"] = int(os.getenv("LLM_CONCURRENCY_MAX", 64))
+    app.config["LLM_LATENCY_TARGET_SECONDS"] = float(os.getenv("LLM_LATENCY_TARGET_SECONDS", 10))
+    app.config["LLM_QUEUE_TIMEOUT_SECONDS"] = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", 30))
+    app.config["LLM_QUEUE_MAX"] = int(os.getenv("LLM_QUEUE_MAX", 1000))
+    app.config["LLM_BREAKER_WINDOW"] = int(os.getenv("LLM_BREAKER_WINDOW", 20))
+    app.config["LLM_BREAKER_MIN_CALLS"] = int(os.getenv("LLM_BREAKER_MIN_CALLS", 10))
+    app.config["LLM_BREAKER_FAILURE_RATE"] = float(os.getenv("LLM_BREAKER_FAILURE_RATE", 0.5))
+    app.config["LLM_BREAKER_COOLDOWN_SECONDS"] = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", 30))
+
+    # Prompt size: task prompts are kept within AI_PROMPT_MAX_TOKENS (counted locally,
+    # see app.utils.prompt_budget); a description that does not fit is cut to its head
+    # and tail or summarised (AI_PROMPT_OVERFLOW = truncate | summarize)
+    app.config["AI_PROMPT_MAX_TOKENS"] = int(os.getenv("AI_PROMPT_MAX_TOKENS", 2048))
+    app.config["AI_PROMPT_TITLE_MAX_TOKENS"] = int(os.getenv("AI_PROMPT_TITLE_MAX_TOKENS", 64))
+    app.config["AI_PROMPT_OVERFLOW"] = os.getenv("AI_PROMPT_OVERFLOW", "truncate")
+
+    # Batch AI runs (POST /tasks/run-ai/batch)
+    app.config["AI_BATCH_MAX_TASKS"] = int(os.getenv("AI_BATCH_MAX_TASKS", 500))
+    app.config["AI_BATCH_RATE_PER_MINUTE"] = int(os.getenv("AI_BATCH_RATE_PER_MINUTE", 300))
+
+    # Agent pipeline run for each task (app.utils.langchain_tools.build_agent_pipelines):
+    # "default" (one Gemini answer) or "sections" (summary/action items/risks in parallel, merged)
+    app.config["AGENT_PIPELINE"] = os.getenv("AGENT_PIPELINE", "default")
+    # Steps that call Gemini: timeout per attempt and extra attempts (on top of the HTTP
+    # client's own retries of connection errors). The timeout applies to steps fanned out
+    # in one wave and in ASGI mode; a lone step runs inline, bounded by the HTTP timeouts.
+    # Timed-out attempts are not retried.
+    app.config["AGENT_LLM_STEP_TIMEOUT"] = float(os.getenv("AGENT_LLM_STEP_TIMEOUT", 90))
+    app.config["AGENT_LLM_STEP_RETRIES"] = int(os.getenv("AGENT_LLM_STEP_RETRIES", 1))
+    # Threads that run pipeline steps with a timeout or alongside other steps
+    app.config["AGENT_STEP_THREADS"] = int(os.getenv("AGENT_STEP_THREADS", 32))
+
+    # Scheduler for recurring tasks (schedule = daily/weekly), see app.utils.scheduler.
+    # Starts on the first request unless SCHEDULER_IN_PROCESS=false (then run worker.py).
+    # Recurring tasks saved before next_run_at existed: `flask backfill-task-schedules`.
+    app.config["SCHEDULER_ENABLED"] = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    app.config["SCHEDULER_IN_PROCESS"] = os.getenv("SCHEDULER_IN_PROCESS", "true").lower() == "true"
+    app.config["SCHEDULER_CONCURRENCY"] = int(os.getenv("SCHEDULER_CONCURRENCY", 4))
+    app.config["SCHEDULER_LEASE_SECONDS"] = int(os.getenv("SCHEDULER_LEASE_SECONDS", 300))
+    app.config["SCHEDULER_HORIZON_SECONDS"] = int(os.getenv("SCHEDULER_HORIZON_SECONDS", 300))
+    # auto_retry: failed scheduled runs retry after base * 2^n seconds (capped), up to AUTO_RETRY_MAX times
+    app.config["AUTO_RETRY_MAX"] = int(os.getenv("AUTO_RETRY_MAX", 5))
+    app.config["AUTO_RETRY_BASE_SECONDS"] = int(os.getenv("AUTO_RETRY_BASE_SECONDS", 30))
+    app.config["AUTO_RETRY_MAX_SECONDS"] = int(os.getenv("AUTO_RETRY_MAX_SECONDS", 3600))
+
+    # ASGI mode (asgi.py): threads for routes served through the WSGI bridge, agent runs
+    # in flight on the event loop, and how long shutdown waits for them
+    app.config["ASGI_WSGI_THREADS"] = int(os.getenv("ASGI_WSGI_THREADS", 32))
+    app.config["ASGI_AGENT_CONCURRENCY"] = int(os.getenv("ASGI_AGENT_CONCURRENCY", 1000))
+    app.config["ASGI_SHUTDOWN_TIMEOUT"] = float(os.getenv("ASGI_SHUTDOWN_TIMEOUT", 30))
+
+    # Conditional GETs: per-user version counters -> ETag / 304 on /tasks, /profile, /logs
+    app.config["ETAGS_ENABLED"] = os.getenv("ETAGS_ENABLED", "true").lower() == "true"
+    # Deleted task ids kept per user for GET /tasks?since=, and how far as_of trails the clock
+    app.config["TASK_TOMBSTONES_MAX"] = int(os.getenv("TASK_TOMBSTONES_MAX", 1000))
+    app.config["TASKS_SINCE_OVERLAP_SECONDS"] = int(os.getenv("TASKS_SINCE_OVERLAP_SECONDS", 5))
+
+    # GET /tasks/search: deepest result reachable by paging
+    app.config["TASK_SEARCH_MAX_RESULTS"] = int(os.getenv("TASK_SEARCH_MAX_RESULTS", 1000))
+    # Similar-task index (GET /tasks/<id>/similar, /tasks/search?mode=semantic): vector
+    # width and how many vectors (all users) stay in memory, ~1KB each at 256
+    app.config["SIMILAR_TASKS_ENABLED"] = os.getenv("SIMILAR_TASKS_ENABLED", "true").lower() == "true"
+    app.config["SIMILAR_TASKS_DIM"] = int(os.getenv("SIMILAR_TASKS_DIM", 256))
+    app.config["SIMILAR_TASKS_MAX_VECTORS"] = int(os.getenv("SIMILAR_TASKS_MAX_VECTORS", 500000))
+
+    # Per-process cache of user documents (GET /profile, login/signup lookups); writes
+    # update it. Other processes' writes are picked up from user_versions with a change
+    # stream (replica sets) or by polling it: USER_CACHE_INVALIDATION = auto | change_stream | poll | none
+    app.config["USER_CACHE_ENABLED"] = os.getenv("USER_CACHE_ENABLED", "true").lower() == "true"
+    app.config["USER_CACHE_MAX_ENTRIES"] = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+    app.config["USER_CACHE_TTL_SECONDS"] = int(os.getenv("USER_CACHE_TTL_SECONDS", 300))
+    app.config["USER_CACHE_INVALIDATION"] = os.getenv("USER_CACHE_INVALIDATION", "auto")
+    app.config["USER_CACHE_POLL_SECONDS"] = float(os.getenv("USER_CACHE_POLL_SECONDS", 2))
+
+    # Encode JSON responses with orjson when installed (same output, less CPU)
+    app.config["JSON_FAST_ENCODER"] = os.getenv("JSON_FAST_ENCODER", "true").lower() == "true"
+
+    # Prometheus metrics at /metrics (request timing, Mongo command monitoring)
+    app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # Explicit overrides (tests, worker.py) win over the environment
+    app.config.update(config or {})
+    if app.config["STORAGE_BACKEND"] == "memory":
+        app.config.update(AI_JOB_BACKEND="memory", JWT_REVOCATION_BACKEND="memory", USER_CACHE_INVALIDATION="none")
+    else:
+        from app.utils.metrics import mongo_event_listeners
+        mongo.init_app(app, event_listeners=mongo_event_listeners(app))
+
+    from app.repositories import init_repositories
+    init_repositories(app)
+
+    # Indexes are built by `flask ensure-indexes` (deploy step), not on every start-up
+    from app.models.indexes import register_index_commands
+    register_index_commands(app)
+
+    from app.models.stats_model import register_stats_commands
+    register_stats_commands(app)
+
+    from app.models.search_model import init_similar_index
+    init_similar_index(app)
+
+    from app.models.user_model import init_user_cache
+    init_user_cache(app)
+
+    from app.utils.password_hasher import init_password_hasher
+    init_password_hasher(app)
+
+    from app.utils.langchain_tools import init_gemini, init_agent_pipelines
+    init_gemini(app)
+    init_agent_pipelines(app)
+
+    from app.utils.log_sink import init_log_sink
+    init_log_sink(app)
+
+    from app.utils.job_queue import init_job_queue
+    init_job_queue(app)
+
+    from app.utils.scheduler import init_scheduler, register_scheduler_commands
+    init_scheduler(app)
+    register_scheduler_commands(app)
+
+    from app.utils.metrics import init_metrics
+    init_metrics(app)
     
+    from app.utils.serializers import init_json_provider
+    init_json_provider(app)
+
     api.init_app(app)  
     # Import and register blueprints
     from app.routes.auth_routes import auth_bp
@@ -32,11 +243,14 @@ def create_app():
     from app.routes.ai_routes import ai_bp
     from app.routes.logs_routes import logs_bp
     from app.routes.profile_routes import profile_bp
+    from app.routes.metrics_routes import metrics_bp
     app.register_blueprint(profile_bp, url_prefix="/profile")
     app.register_blueprint(auth_bp)
     app.register_blueprint(task_bp)
     app.register_blueprint(ai_bp)
     app.register_blueprint(logs_bp)
+    if app.config["METRICS_ENABLED"]:
+        app.register_blueprint(metrics_bp)
     
 
     return app
@@ -0,0 +1,401 @@
+"""
+ASGI serving mode: the same app, routes and models as run.py, on an ASGI
+server (e.g. `uvicorn asgi:app`).
+
+- Every route runs through a WSGI bridge on a bounded thread pool
+  (ASGI_WSGI_THREADS); responses, including NDJSON/SSE streams, are relayed
+  chunk by chunk with backpressure.
+- Agent runs are asyncio tasks: queued jobs (POST /tasks/<id>/run-ai) are
+  drained by AsyncAgentWorker and POST /tasks/<id>/run-ai/stream is served
+  natively, both awaiting Gemini on the asyncio HTTP client. A run waiting on
+  the model holds no thread, so ASGI_AGENT_CONCURRENCY runs can be in flight
+  at once; only their short repository calls borrow a worker thread.
+"""
+import asyncio
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from datetime import datetime
+from io import BytesIO
+from uuid import uuid4
+
+from flask import g
+from werkzeug.exceptions import HTTPException
+
+from app import create_app
+from app.routes.ai_routes import SSE_HEADERS, begin_stream_run, stream_event_to_sse
+from app.utils.job_queue import heartbeat_interval, maintain_leases
+from app.utils.langchain_tools import arun_agent_for_task, astream_agent_for_task, close_async_http_client, run_in_app
+from app.utils.logger import get_logger, log_event
+
+__all__ = ["AsyncAgentWorker", "ASGIApp", "create_asgi_app"]
+
+logger = get_logger(__name__)
+
+# Endpoint served natively instead of through the WSGI bridge
+_STREAM_ENDPOINT = "ai.run_ai_stream_route"
+
+
+# -------------------- Agent worker --------------------
+class AsyncAgentWorker:
+    """
+    asyncio counterpart of AgentWorkerPool: claims jobs from the same queue
+    and runs up to `concurrency` of them at once as tasks on the event loop.
+    """
+
+    def __init__(self, app, queue, executor, concurrency=1000, poll_timeout=1.0):
+        self.app = app
+        self.queue = queue
+        self.executor = executor
+        self.concurrency = max(1, int(concurrency))
+        self.poll_timeout = poll_timeout
+        self.worker_id = f"asgi-{uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._loop_task = None
+        self._heartbeat_task = None
+        self._jobs = set()
+        self._active = {}  # job_id -> worker_id, for lease renewal
+
+    @property
+    def running(self):
+        return self._loop_task is not None and not self._loop_task.done()
+
+    @property
+    def in_flight(self):
+        return len(self._jobs)
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self._loop_task = asyncio.get_running_loop().create_task(self._claim_loop())
+        if heartbeat_interval(self.queue):
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+        log_event(logger, logging.INFO, "agent_worker_started", mode="asyncio", concurrency=self.concurrency)
+        return self
+
+    async def stop(self, timeout=None):
+        self._stop.set()
+        if self._loop_task is not None:
+            await self._loop_task
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        if self._jobs:
+            # Unfinished jobs keep their lease and are claimed again after it expires
+            _, pending = await asyncio.wait(self._jobs, timeout=timeout)
+            for job in pending:
+                job.cancel()
+
+    def _claim(self):
+        with self.app.app_context():
+            return self.queue.claim(self.worker_id, timeout=self.poll_timeout)
+
+    async def _claim_loop(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        while not self._stop.is_set():
+            await slots.acquire()
+            try:
+                job = await loop.run_in_executor(self.executor, self._claim)
+            except Exception as e:
+                slots.release()
+                log_event(logger, logging.WARNING, "job_claim_failed", worker_id=self.worker_id, error=str(e))
+                await asyncio.sleep(self.poll_timeout)
+                continue
+            if job is None:
+                slots.release()
+                continue
+
+            self._active[job["job_id"]] = self.worker_id
+            task = loop.create_task(self._run_job(job))
+            self._jobs.add(task)
+            task.add_done_callback(self._jobs.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _heartbeat_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(heartbeat_interval(self.queue))
+            try:
+                await loop.run_in_executor(self.executor, self._maintain_leases)
+            except Exception as e:
+                log_event(logger, logging.WARNING, "job_heartbeat_failed", error=str(e))
+
+    def _maintain_leases(self):
+        with self.app.app_context():
+            maintain_leases(self.queue, self._active)
+
+    async def _run_job(self, job):
+        # Mirrors AgentWorkerPool._run_job
+        from app.models.task_model import set_task_status
+
+        app, queue, worker_id = self.app, self.queue, self.worker_id
+        job_id, task_id, user_id = job["job_id"], job["task_id"], job["user_id"]
+        try:
+            await run_in_app(app, set_task_status, task_id, user_id, "running", last_run=datetime.utcnow())
+            context = await arun_agent_for_task(app, task_id, user_id)
+
+            if context.get("error"):
+                await run_in_app(app, queue.fail, job_id, context["error"], worker_id)
+                return
+
+            await run_in_app(app, queue.complete, job_id, {
+                "ai_response": context.get("results"),
+                "steps_completed": context.get("steps_completed"),
+                "cached": context.get("cached", False),
+            }, worker_id)
+            log_event(logger, logging.INFO, "agent_job_completed", job_id=job_id, task_id=task_id, user_id=user_id,
+                      steps_completed=context.get("steps_completed"))
+
+        except Exception as e:
+            log_event(logger, logging.ERROR, "agent_job_failed", job_id=job_id, task_id=task_id, error=str(e))
+            try:
+                await run_in_app(app, set_task_status, task_id, user_id, "error")
+            finally:
+                await run_in_app(app, queue.fail, job_id, str(e), worker_id)
+        finally:
+            self._active.pop(job_id, None)
+
+
+# -------------------- WSGI bridge helpers --------------------
+def _wsgi_environ(scope, body):
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "asgi.scope": scope,
+    }
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin-1").upper().replace("-", "_"), value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _encode_headers(headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+# -------------------- ASGI app --------------------
+class ASGIApp:
+    def __init__(self, app, agent_worker=True):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get("ASGI_WSGI_THREADS", 32), thread_name_prefix="asgi-wsgi"
+        )
+        self.worker = None
+        if agent_worker:
+            self.worker = AsyncAgentWorker(
+                app,
+                app.extensions["ai_job_queue"],
+                self.executor,
+                concurrency=app.config.get("ASGI_AGENT_CONCURRENCY", 1000),
+            )
+            app.extensions["ai_async_worker"] = self.worker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        if self.worker is not None and not self.worker.running:
+            # Servers without lifespan events (and tests) start it on first request
+            self.worker.start()
+
+        body = await _read_body(receive)
+        if body is None:
+            return
+        environ = _wsgi_environ(scope, body)
+        task_id = self._stream_task_id(environ)
+        if task_id is not None:
+            return await self._stream_run(environ, task_id, receive, send)
+        return await self._call_wsgi(environ, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.worker is not None:
+                    self.worker.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.worker is not None:
+                    await self.worker.stop(timeout=self.app.config.get("ASGI_SHUTDOWN_TIMEOUT", 30))
+                await close_async_http_client(self.app)
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _stream_task_id(self, environ):
+        if environ["REQUEST_METHOD"] != "POST":
+            return None
+        try:
+            endpoint, args = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        return args["task_id"] if endpoint == _STREAM_ENDPOINT else None
+
+    # -------------------- Bridged routes --------------------
+    async def _call_wsgi(self, environ, receive, send):
+        loop = asyncio.get_running_loop()
+        # Small bound so a slow client throttles the thread producing the body
+        relay = asyncio.Queue(maxsize=8)
+        cancelled = threading.Event()
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(relay.put(item), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            put(("start", int(status.split(" ", 1)[0]), headers))
+            return lambda data: put(("body", data))
+
+        def run():
+            try:
+                body = self.app(environ, start_response)
+                try:
+                    for chunk in body:
+                        if cancelled.is_set():
+                            break
+                        if chunk:
+                            put(("body", chunk))
+                finally:
+                    if hasattr(body, "close"):
+                        body.close()
+                put(("end", None))
+            except BaseException as e:
+                put(("error", e))
+
+        future = loop.run_in_executor(self.executor, run)
+        watcher = loop.create_task(_wait_disconnect(receive))
+        started = False
+        try:
+            while True:
+                kind, *payload = await relay.get()
+                if kind == "error":
+                    raise payload[0]
+                if kind == "end":
+                    break
+                if watcher.done():
+                    cancelled.set()  # keep draining so the thread can finish
+                    continue
+                if kind == "start":
+                    status, headers = payload
+                    await send({"type": "http.response.start", "status": status,
+                                "headers": _encode_headers(headers)})
+                    started = True
+                else:
+                    await send({"type": "http.response.body", "body": payload[0], "more_body": True})
+            if started and not watcher.done():
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            watcher.cancel()
+            cancelled.set()
+            await future
+
+    # -------------------- Native agent stream --------------------
+    def _begin_stream(self, environ, task_id):
+        """
+        Run the Flask side of POST /tasks/<id>/run-ai/stream on a worker
+        thread: request hooks, token check, task lookup. Returns the response
+        to send (status, headers, body) and the user id when the stream may start.
+        """
+        app = self.app
+        with app.request_context(environ):
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = begin_stream_run(task_id)
+            except Exception as e:
+                try:
+                    rv = app.handle_user_exception(e)
+                except Exception as e:
+                    rv = app.handle_exception(e)
+
+            user_id = None
+            if rv is None:
+                user_id = g.user_id
+                response = app.response_class(mimetype="text/event-stream", headers=SSE_HEADERS)
+            else:
+                response = app.make_response(rv)
+            response = app.process_response(response)
+            body = b"" if user_id is not None else response.get_data()
+            return response.status_code, response.headers.to_wsgi_list(), body, user_id
+
+    async def _stream_run(self, environ, task_id, receive, send):
+        loop = asyncio.get_running_loop()
+        status, headers, body, user_id = await loop.run_in_executor(
+            self.executor, self._begin_stream, environ, task_id
+        )
+        await send({"type": "http.response.start", "status": status, "headers": _encode_headers(headers)})
+        if user_id is None:
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def relay():
+            async with aclosing(astream_agent_for_task(self.app, task_id, user_id)) as events:
+                async for event, payload in events:
+                    frame = stream_event_to_sse(event, payload).encode("utf-8")
+                    await send({"type": "http.response.body", "body": frame, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        streaming = loop.create_task(relay())
+        watcher = loop.create_task(_wait_disconnect(receive))
+        await asyncio.wait({streaming, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not streaming.done():
+            # Client went away: cancelling marks the run as cancelled
+            streaming.cancel()
+        watcher.cancel()
+        try:
+            await streaming
+        except asyncio.CancelledError:
+            pass
+
+
+def create_asgi_app(config=None):
+    """
+    Build the app for ASGI serving. With AI_WORKERS_IN_PROCESS, queued agent
+    jobs are run by the asyncio worker instead of the thread worker pool.
+    """
+    app = create_app(config)
+    in_process = app.config["AI_WORKERS_IN_PROCESS"]
+    app.config["AI_WORKERS_IN_PROCESS"] = False  # keeps ensure_workers_started from starting threads
+    return ASGIApp(app, agent_worker=in_process)
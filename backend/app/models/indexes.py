@@ -0,0 +1,199 @@
+import click
+import logging
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import PyMongoError
+from app import mongo
+from app.utils.text_search import TASK_TEXT_WEIGHTS
+from app.utils.job_queue import FINISHED_JOB_TTL_SECONDS
+from app.utils.logger import get_logger, log_event
+
+logger = get_logger(__name__)
+
+# Indexes for the hot lookups in the models. create_indexes is idempotent; run
+# `flask ensure-indexes` on deploy (app start-up does not touch the indexes).
+INDEXES = {
+    "tasks": [
+        # get_task_by_id / every update by {task_id, user_id}: task_id alone is unique
+        IndexModel([("task_id", ASCENDING)], name="task_id_unique", unique=True),
+        # get_tasks_by_user: newest first, keyset on (created_at, task_id)
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("task_id", DESCENDING)],
+            name="user_id_created_at",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("task_id", DESCENDING)],
+            name="user_id_status_created_at",
+        ),
+        # GET /tasks?since=: a user's tasks changed after a time
+        IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING)], name="user_id_updated_at"),
+        # TaskScheduler: tasks due before a time, soonest first
+        IndexModel([("next_run_at", ASCENDING)], name="next_run_at"),
+        # GET /tasks/search: weighted $text over title/description/result, one user at a time
+        IndexModel(
+            [("user_id", ASCENDING)] + [(field, TEXT) for field in TASK_TEXT_WEIGHTS],
+            name="user_id_text",
+            weights=TASK_TEXT_WEIGHTS,
+            default_language="english",
+        ),
+    ],
+    "logs": [
+        # get_logs_for_user: a user's logs newest first, keyset on (timestamp, _id)
+        IndexModel(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_timestamp_id",
+        ),
+    ],
+    "task_vectors": [
+        # search_model: load one user's similar-task vectors
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "users": [
+        # Profiles saved by PUT /profile before an email is set have an empty
+        # email, so uniqueness only applies to real addresses
+        IndexModel(
+            [("email", ASCENDING)],
+            name="email_unique",
+            unique=True,
+            partialFilterExpression={"email": {"$type": "string", "$gt": ""}},
+        ),
+        # One document per user: save_profile upserts by user_id
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "user_versions": [
+        # User cache invalidation by polling: profiles changed after a time
+        IndexModel([("changed_at.profile", ASCENDING)], name="changed_at_profile", sparse=True),
+    ],
+    "revoked_tokens": [
+        # Revoked tokens expire with the token itself (revoke_token stores its exp);
+        # keeps the default name revoke_token used to create
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_1", expireAfterSeconds=0),
+    ],
+    "ai_response_cache": [
+        # ResponseCache Mongo tier: entries expire at their stored expires_at
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_1", expireAfterSeconds=0),
+    ],
+    "ai_jobs": [
+        # MongoJobQueue. The first two keep the default names the queue used to
+        # create at start-up, so existing deployments don't hit a name conflict.
+        # claim: oldest queued job first
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_1_created_at_1"),
+        # get / renew / complete / fail by job_id
+        IndexModel([("job_id", ASCENDING)], name="job_id_1", unique=True),
+        # Completed and failed jobs expire; queued/running jobs have finished_at None
+        # and are never removed
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=FINISHED_JOB_TTL_SECONDS),
+    ],
+}
+
+# Indexes earlier versions created that nothing uses any more; ensure_indexes drops them
+RETIRED_INDEXES = {
+    "tasks": ["task_id_user_id"],  # duplicated task_id_unique
+    "logs": ["user_id_timestamp"],  # replaced by user_id_timestamp_id
+    "users": ["user_id"],  # replaced by user_id_unique
+}
+
+# Representative shape of each model query, used by `flask check-indexes`
+_SAMPLE = "__explain__"
+MODEL_QUERIES = [
+    ("task_model.get_task_by_id", "tasks", {"task_id": _SAMPLE, "user_id": _SAMPLE}, None),
+    ("task_model.get_tasks_by_user", "tasks", {"user_id": _SAMPLE},
+     [("created_at", DESCENDING), ("task_id", DESCENDING)]),
+    ("task_model.get_tasks_by_user(status)", "tasks", {"user_id": _SAMPLE, "status": "pending"},
+     [("created_at", DESCENDING), ("task_id", DESCENDING)]),
+    ("task_model.find_tasks_for_run", "tasks", {"user_id": _SAMPLE, "task_id": {"$in": [_SAMPLE]}}, None),
+    ("task_model.get_tasks_changed_since", "tasks", {"user_id": _SAMPLE, "updated_at": {"$gt": datetime(2000, 1, 1)}},
+     [("updated_at", ASCENDING), ("task_id", ASCENDING)]),
+    ("search_model.search_tasks", "tasks", {"user_id": _SAMPLE, "$text": {"$search": "report"}}, None),
+    ("scheduler.refresh", "tasks", {"next_run_at": {"$lt": datetime(2000, 1, 1)}},
+     [("next_run_at", ASCENDING)]),
+    ("user_model.get_user_by_email", "users", {"email": _SAMPLE}, None),
+    ("user_model.get_user_by_id", "users", {"user_id": _SAMPLE}, None),
+    ("user_cache.poll", "user_versions", {"changed_at.profile": {"$gt": datetime(2000, 1, 1)}}, None),
+    ("job_queue.get", "ai_jobs", {"job_id": _SAMPLE, "user_id": _SAMPLE}, None),
+    ("log_model.get_logs_for_user", "logs", {"user_id": _SAMPLE}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+]
+
+
+def ensure_indexes(db=None):
+    """
+    Drop the retired indexes and create every declared one. Retired indexes go
+    first: a replacement on the same keys under a new name can't be created
+    alongside them. Failures (e.g. existing duplicate emails blocking a unique
+    index) are reported per collection, not raised. Returns {collection:
+    [index names] or error string}.
+    """
+    db = db if db is not None else mongo.db
+    report = {}
+    for collection, indexes in INDEXES.items():
+        try:
+            existing = set(db[collection].index_information())
+            for name in RETIRED_INDEXES.get(collection, ()):
+                if name in existing:
+                    db[collection].drop_index(name)
+            report[collection] = db[collection].create_indexes(indexes)
+        except PyMongoError as e:
+            log_event(logger, logging.ERROR, "index_creation_failed", collection=collection, error=str(e))
+            report[collection] = f"error: {e}"
+    return report
+
+
+def _plan_stages(plan):
+    """
+    Yield every stage name in an explain() plan tree (classic and SBE formats).
+    """
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def explain_model_queries(db=None):
+    """
+    Run explain() on each model query. Returns a list of
+    {"query", "collection", "stages", "collscan", "in_memory_sort"}.
+    """
+    db = db if db is not None else mongo.db
+    results = []
+    for name, collection, query, sort in MODEL_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(winning_plan))
+        results.append({
+            "query": name,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+        })
+    return results
+
+
+def register_index_commands(app):
+    @app.cli.command("ensure-indexes")
+    def ensure_indexes_command():
+        """Create the declared MongoDB indexes (idempotent)."""
+        for collection, result in ensure_indexes().items():
+            click.echo(f"{collection}: {result}")
+
+    @app.cli.command("check-indexes")
+    def check_indexes_command():
+        """Explain every model query and flag collection scans."""
+        failures = 0
+        for result in explain_model_queries():
+            if result["collscan"]:
+                failures += 1
+                status = "COLLSCAN"
+            elif result["in_memory_sort"]:
+                status = "IN-MEMORY SORT"
+            else:
+                status = "ok"
+            click.echo(f"[{status}] {result['query']} ({result['collection']}): {' > '.join(result['stages'])}")
+        if failures:
+            raise SystemExit(f"{failures} model queries fall back to a collection scan")
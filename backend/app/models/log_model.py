@@ -1,38 +1,123 @@
-from app import mongo
+from app.repositories import get_repositories
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.utils.log_sink import get_log_sink
+from app.utils.serializers import compile_serializer, projection_for, format_datetime
+from app.models.version_model import bump_versions_many
 from datetime import datetime
+import base64
+import json
 
 def log_ai_response(user_id, task_id, ai_response):
-    mongo.db.logs.insert_one({
+    write_logs([{
         "user_id": user_id,
         "task_id": task_id,
         "ai_response": ai_response,
         "timestamp": datetime.utcnow()
-    })
-
-def get_logs_for_user(user_id):
-    from bson import ObjectId
-    from app import mongo
-    logs = mongo.db.logs.find({"user_id": user_id})
-    formatted_logs = []
-
-    for log in logs:
-        ts = log.get("timestamp")
-        if isinstance(ts, datetime):
-            ts_str = ts.strftime("%Y-%m-%d %H:%M:%S")
-        elif isinstance(ts, str):
-            ts_str = ts
+    }])
+
+def write_logs(entries):
+    """
+    Persist already-built log entries. With the buffered log sink enabled
+    (LOG_SINK_ENABLED) they are queued and written in batches off the
+    request path; otherwise several entries go in one insert_many.
+    """
+    entries = list(entries)
+    if not entries:
+        return
+
+    sink = get_log_sink()
+    if sink is not None:
+        # The sink bumps the log versions once the batch is written
+        sink.write_many(entries)
+        return
+    if len(entries) == 1:
+        get_repositories().logs.insert_one(entries[0])
+    else:
+        get_repositories().logs.insert_many(entries, ordered=False)
+    bump_versions_many([entry.get("user_id") for entry in entries], "logs")
+
+def _log_timestamp(ts):
+    if isinstance(ts, datetime):
+        return format_datetime(ts)
+    if isinstance(ts, str):
+        return ts
+    return format_datetime(datetime.utcnow())
+
+# Log response shape: response key -> (document field, default, converter)
+LOG_FIELDS = {
+    "id": ("_id", "", str),
+    "timestamp": ("timestamp", None, _log_timestamp),
+    "task": ("task_id", "Unknown Task", str),
+    "type": ("type", "SYSTEM", str),
+    "status": ("status", "SUCCESS", str),
+    "duration": ("duration", "N/A", str),
+    "details": ("ai_response", "", str),
+    "user": ("user", "System", str),
+    # Gemini tokens of an agent run: prompt, completion, total, calls, estimated, batched, trimmed
+    "tokens": ("tokens", None, None),
+}
+format_log = compile_serializer(LOG_FIELDS, list(LOG_FIELDS))
+_LOG_PROJECTION = projection_for(LOG_FIELDS, list(LOG_FIELDS))
+
+# Legacy logs have a string timestamp (or none); "kind" keeps the cursor's type
+# so the next page continues among the same kind of timestamps
+def encode_log_cursor(log):
+    ts = log.get("timestamp")
+    if isinstance(ts, datetime):
+        data = {"timestamp": ts.isoformat(), "kind": "datetime"}
+    elif isinstance(ts, str):
+        data = {"timestamp": ts, "kind": "string"}
+    else:
+        data = {"timestamp": None, "kind": None}
+    data["id"] = str(log["_id"])
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii")
+
+def decode_log_cursor(cursor):
+    """
+    (timestamp, _id) of the last log on the previous page; the timestamp is
+    a datetime, or a str/None for legacy logs.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        kind, ts = data.get("kind", "datetime"), data["timestamp"]
+        if kind == "datetime":
+            ts = datetime.fromisoformat(ts)
+        elif kind == "string":
+            ts = str(ts)
         else:
-            ts_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-
-        formatted_logs.append({
-            "id": str(log.get("_id", "")),
-            "timestamp": ts_str,
-            "task": str(log.get("task_id", "Unknown Task")),
-            "type": str(log.get("type", "SYSTEM")),
-            "status": str(log.get("status", "SUCCESS")),
-            "duration": str(log.get("duration", "N/A")),
-            "details": str(log.get("ai_response", "")),
-            "user": str(log.get("user", "System"))
-        })
-
-    return formatted_logs
+            ts = None
+        return ts, ObjectId(data["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+
+def find_logs_for_user(user_id, start=None, end=None, task_id=None, status=None, cursor=None, limit=None, batch_size=500):
+    """
+    Raw iterator over a user's logs, newest first, keyset-paged on (timestamp, _id).
+    start/end bound the timestamp (start inclusive, end exclusive).
+    """
+    return get_repositories().logs.find_for_user(
+        user_id, start=start, end=end, task_id=task_id,
+        status=status.lower() if status else None,
+        after=decode_log_cursor(cursor) if cursor else None,
+        limit=limit, batch_size=batch_size, fields=_LOG_PROJECTION,
+    )
+
+def iter_logs_for_user(user_id, **filters):
+    """
+    Yield formatted logs as the cursor produces them, without building a list.
+    """
+    for log in find_logs_for_user(user_id, **filters):
+        yield format_log(log)
+
+def get_logs_for_user(user_id, limit=500, **filters):
+    """
+    One page of formatted logs. Returns (logs, next_cursor).
+    """
+    docs = list(find_logs_for_user(user_id, limit=limit + 1, **filters))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_log_cursor(docs[-1])
+
+    return [format_log(log) for log in docs], next_cursor
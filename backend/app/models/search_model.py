@@ -0,0 +1,208 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+
+from app.models.task_model import TASK_LIST_FIELDS, DEFAULT_TASK_LIST_FIELDS
+from app.models.version_model import deleted_tasks_since, get_version
+from app.repositories import get_repositories
+from app.utils.serializers import compile_serializer, projection_for
+from app.utils.vector_index import SimilarTaskIndex, UserVectors, embed_tasks, embed_text
+
+# Task search:
+# - search_tasks: Mongo $text over title, description and the AI result
+#   (weights in app.utils.text_search), best match first, offset cursor.
+# - find_similar_tasks: nearest neighbours in the local vector index
+#   (app.utils.vector_index). A user's vectors are loaded on first use from
+#   `task_vectors` and then kept in sync incrementally: when the user's task
+#   version has moved, only tasks created/changed since the last sync (the
+#   updated_at index) are embedded and deletions come from the tombstones, so
+#   new and finished tasks join the index without a rebuild.
+
+# Search results can also show the AI result text that was matched
+SEARCH_FIELDS = dict(TASK_LIST_FIELDS, result=("result", None, None))
+
+# Fields a task vector is computed from
+_VECTOR_FIELDS = ["task_id", "title", "description", "result", "updated_at"]
+
+
+def _check_fields(fields):
+    fields = fields or DEFAULT_TASK_LIST_FIELDS
+    unknown = [f for f in fields if f not in SEARCH_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def encode_search_cursor(query, offset):
+    raw = json.dumps({"q": query, "offset": offset})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_search_cursor(cursor, query):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = int(data["offset"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if data.get("q") != query or offset < 0:
+        raise ValueError("Cursor does not belong to this query")
+    return offset
+
+
+# ✅ Full-text search. Text scores can't be used as a keyset, so pages are
+# offsets, capped at max_results. Returns (tasks, next_cursor).
+def search_tasks(user_id, query, fields=None, limit=20, cursor=None, max_results=1000):
+    fields = _check_fields(fields)
+    query = (query or "").strip()
+    if not query:
+        raise ValueError("q is required")
+
+    offset = decode_search_cursor(cursor, query) if cursor else 0
+    limit = min(limit, max_results - offset)
+    if limit <= 0:
+        return [], None
+
+    docs = get_repositories().tasks.search(
+        user_id, query, skip=offset, limit=limit + 1,
+        fields=projection_for(SEARCH_FIELDS, fields, always=["task_id"]),
+    )
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        if offset + limit < max_results:
+            next_cursor = encode_search_cursor(query, offset + limit)
+
+    serialize = compile_serializer(SEARCH_FIELDS, fields)
+    return [dict(serialize(doc), score=round(doc["score"], 4)) for doc in docs], next_cursor
+
+
+# -------------------- Similar tasks --------------------
+def init_similar_index(app):
+    app.extensions["similar_task_index"] = None
+    if app.config.get("SIMILAR_TASKS_ENABLED", True):
+        app.extensions["similar_task_index"] = SimilarTaskIndex(
+            dim=app.config.get("SIMILAR_TASKS_DIM", 256),
+            max_vectors=app.config.get("SIMILAR_TASKS_MAX_VECTORS", 500_000),
+        )
+
+
+def get_similar_index():
+    index = current_app.extensions.get("similar_task_index")
+    if index is None:
+        raise LookupError("Similar-task search is disabled")
+    return index
+
+
+def _store_vectors(repos, user_id, tasks, vectors):
+    # float16 halves the stored size; similarities change by < 0.001
+    repos.vectors.upsert_many(user_id, [
+        (task["task_id"], vector.astype(np.float16).tobytes(), task.get("updated_at"))
+        for task, vector in zip(tasks, vectors)
+    ])
+
+
+def _load_vectors(user_id, index, repos, overlap):
+    """
+    A user's vectors as stored, or embedded from scratch (first use ever, or
+    after SIMILAR_TASKS_DIM changed). Returns (entry, needs_sync).
+    """
+    entry = UserVectors(index.dim)
+    stored = repos.vectors.load(user_id)
+    if stored and all(len(row["vector"]) == index.dim * 2 for row in stored):
+        matrix = np.frombuffer(b"".join(row["vector"] for row in stored), dtype=np.float16)
+        entry.upsert([row["task_id"] for row in stored], matrix.reshape(-1, index.dim).astype(np.float32))
+        synced_at = max((row["updated_at"] for row in stored if row["updated_at"]), default=None)
+        entry.synced_at = synced_at - overlap if synced_at else datetime.min
+        return entry, True
+
+    if stored:
+        repos.vectors.clear(user_id)
+    started = datetime.utcnow()
+    # Not changed_since: tasks written before updated_at existed have none
+    tasks = repos.tasks.find(user_id, fields=_VECTOR_FIELDS)
+    vectors = embed_tasks(tasks, index.dim)
+    entry.upsert([task["task_id"] for task in tasks], vectors)
+    _store_vectors(repos, user_id, tasks, vectors)
+    entry.synced_at = started - overlap
+    return entry, False
+
+
+def _sync_vectors(user_id, entry, repos, overlap):
+    started = datetime.utcnow()
+    deleted, complete = deleted_tasks_since(user_id, entry.synced_at)
+    changed = repos.tasks.changed_since(user_id, entry.synced_at, limit=None, fields=_VECTOR_FIELDS)
+    if changed:
+        vectors = embed_tasks(changed, entry.dim)
+        entry.upsert([task["task_id"] for task in changed], vectors)
+        _store_vectors(repos, user_id, changed, vectors)
+    if not complete:
+        # Tombstones were trimmed: drop every vector whose task is gone
+        live = {task["task_id"] for task in repos.tasks.find(user_id, fields=["task_id"])}
+        deleted = [task_id for task_id in entry.task_ids if task_id not in live]
+    if deleted:
+        entry.remove(deleted)
+        repos.vectors.delete_many(user_id, deleted)
+    entry.synced_at = max(entry.synced_at, started - overlap)
+
+
+def _user_vectors(user_id, index):
+    # Caller holds index.user_lock(user_id). The version is read before
+    # syncing, so a write racing the sync only causes another sync next time.
+    repos = get_repositories()
+    overlap = timedelta(seconds=current_app.config.get("TASKS_SINCE_OVERLAP_SECONDS", 5))
+    version = get_version(user_id, "tasks")
+
+    entry = index.get(user_id)
+    if entry is not None and entry.version == version:
+        return entry
+    needs_sync = True
+    if entry is None:
+        entry, needs_sync = _load_vectors(user_id, index, repos, overlap)
+    if needs_sync:
+        _sync_vectors(user_id, entry, repos, overlap)
+    entry.version = version
+    index.put(user_id, entry)
+    return entry
+
+
+def _similar_results(user_id, hits, fields):
+    docs = get_repositories().tasks.find(
+        user_id, task_ids=[task_id for task_id, _ in hits],
+        fields=projection_for(SEARCH_FIELDS, fields, always=["task_id"]),
+    )
+    by_id = {doc["task_id"]: doc for doc in docs}
+    serialize = compile_serializer(SEARCH_FIELDS, fields)
+    return [
+        dict(serialize(by_id[task_id]), similarity=round(similarity, 4))
+        for task_id, similarity in hits if task_id in by_id
+    ]
+
+
+# ✅ Tasks most similar to one of the user's tasks; None if it does not exist
+def find_similar_tasks(user_id, task_id, fields=None, limit=10):
+    fields = _check_fields(fields)
+    index = get_similar_index()
+    with index.user_lock(user_id):
+        entry = _user_vectors(user_id, index)
+        vector = entry.vector(task_id)
+        if vector is None:
+            return None
+        hits = entry.top_k(vector, limit, exclude=[task_id])
+    return _similar_results(user_id, hits, fields)
+
+
+# ✅ Tasks most similar to free text (GET /tasks/search?mode=semantic)
+def search_similar_tasks(user_id, query, fields=None, limit=10):
+    fields = _check_fields(fields)
+    query = (query or "").strip()
+    if not query:
+        raise ValueError("q is required")
+    index = get_similar_index()
+    vector = embed_text(query, index.dim)
+    with index.user_lock(user_id):
+        hits = _user_vectors(user_id, index).top_k(vector, limit)
+    return _similar_results(user_id, hits, fields)
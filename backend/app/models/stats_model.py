@@ -0,0 +1,126 @@
+import click
+from collections import Counter
+from datetime import datetime
+
+from app.repositories import get_repositories
+
+# Per-user task counters, one document per user in `task_stats`:
+#   {_id: user_id, total, status: {...}, type: {...}, priority: {...}, built_at, updated_at}
+# Task writes adjust them with $inc, so GET /tasks/stats is a single _id lookup.
+# `built_at` marks a document counted from the tasks collection: a $inc upsert
+# for a user whose tasks predate the counters creates a partial document
+# without it, and the next read rebuilds that document.
+# Status transitions that read-then-write can drift under races; `flask
+# rebuild-task-stats` recomputes the counters from the tasks collection.
+
+STAT_DIMENSIONS = ("status", "type", "priority")
+STAT_DEFAULTS = {"status": "pending", "type": "General", "priority": "Medium"}
+TASK_STATS_STATUSES = ("pending", "running", "completed", "error", "deferred")
+
+
+def _stat_key(dimension, value):
+    # Missing and empty values count as the dimension's default, the same way
+    # on writes and on rebuilds. Counter names end up in field paths, so "."
+    # and a leading "$" are not allowed.
+    key = str(value) if value not in (None, "") else STAT_DEFAULTS[dimension]
+    return key.replace(".", "_").lstrip("$") or "unknown"
+
+
+def _task_deltas(task, sign):
+    deltas = Counter({"total": sign})
+    for dimension in STAT_DIMENSIONS:
+        deltas[f"{dimension}.{_stat_key(dimension, task.get(dimension))}"] += sign
+    return deltas
+
+
+def _apply_deltas(user_id, deltas):
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    get_repositories().task_stats.increment(user_id, deltas, datetime.utcnow())
+
+
+# ✅ Counter hooks called by the task model
+def record_tasks_created(user_id, tasks):
+    deltas = Counter()
+    for task in tasks:
+        deltas.update(_task_deltas(task, 1))
+    _apply_deltas(user_id, deltas)
+
+
+def record_tasks_deleted(user_id, tasks):
+    deltas = Counter()
+    for task in tasks:
+        deltas.update(_task_deltas(task, -1))
+    _apply_deltas(user_id, deltas)
+
+
+def record_status_changes(user_id, transitions):
+    """
+    transitions: iterable of (old_status, new_status) pairs for one user.
+    """
+    deltas = Counter()
+    for old_status, new_status in transitions:
+        if old_status != new_status:
+            deltas[f"status.{_stat_key('status', old_status)}"] -= 1
+            deltas[f"status.{_stat_key('status', new_status)}"] += 1
+    _apply_deltas(user_id, deltas)
+
+
+def format_task_stats(doc):
+    total = max(doc.get("total", 0), 0)
+    by_status = {status: 0 for status in TASK_STATS_STATUSES}
+    by_status.update({k: v for k, v in doc.get("status", {}).items() if v > 0})
+    completed = by_status.get("completed", 0)
+    return {
+        "total": total,
+        "by_status": by_status,
+        "by_type": {k: v for k, v in doc.get("type", {}).items() if v > 0},
+        "by_priority": {k: v for k, v in doc.get("priority", {}).items() if v > 0},
+        "completion_rate": round(completed / total, 4) if total else 0.0,
+        "updated_at": doc["updated_at"].isoformat() if doc.get("updated_at") else None,
+    }
+
+
+# ✅ Stats for one user; built from the tasks collection if missing or partial
+def get_task_stats(user_id):
+    stats = get_repositories().task_stats
+    doc = stats.get(user_id)
+    if doc is None or not doc.get("built_at"):
+        rebuild_task_stats(user_id)
+        doc = stats.get(user_id) or {}
+    return format_task_stats(doc)
+
+
+def rebuild_task_stats(user_id=None):
+    """
+    Recompute counters with one grouped count over the tasks and overwrite the
+    stats documents (for one user, or for everyone). Returns users rebuilt.
+    """
+    repos = get_repositories()
+    per_user = {}
+    for (uid, *values), count in repos.tasks.count_groups(user_id):
+        doc = per_user.setdefault(uid, {"total": 0, "status": {}, "type": {}, "priority": {}})
+        doc["total"] += count
+        for dimension, value in zip(STAT_DIMENSIONS, values):
+            key = _stat_key(dimension, value)
+            doc[dimension][key] = doc[dimension].get(key, 0) + count
+
+    if user_id is not None:
+        per_user.setdefault(user_id, {"total": 0, "status": {}, "type": {}, "priority": {}})
+    else:
+        repos.task_stats.prune(per_user)
+
+    now = datetime.utcnow()
+    for uid, doc in per_user.items():
+        doc["built_at"] = doc["updated_at"] = now
+        repos.task_stats.replace(uid, doc)
+    return len(per_user)
+
+
+def register_stats_commands(app):
+    @app.cli.command("rebuild-task-stats")
+    @click.option("--user-id", default=None, help="Only rebuild this user's counters.")
+    def rebuild_task_stats_command(user_id):
+        """Recompute per-user task counters from the tasks collection."""
+        click.echo(f"Rebuilt task stats for {rebuild_task_stats(user_id)} user(s)")
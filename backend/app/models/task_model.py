@@ -1,15 +1,43 @@
-from app import mongo
+from app.repositories import get_repositories
+from app.models.stats_model import record_tasks_created, record_tasks_deleted, record_status_changes
+from app.models.version_model import bump_versions, deleted_tasks_since
+from app.utils.serializers import compile_serializer, projection_for, format_date, format_datetime
 from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import base64
+import json
 
 # ✅ Create a new task with status (default = "pending")
-VALID_STATUSES = {"pending", "running", "completed", "error"}
+# "deferred": the AI backend was unavailable; next_run_at says when the run is retried.
+# Only the server sets it, so clients may send just the CLIENT_STATUSES.
+VALID_STATUSES = {"pending", "running", "completed", "error", "deferred"}
+CLIENT_STATUSES = {"pending", "running", "completed", "error"}
 
-def create_task(user_id, title, description, status="pending", type="General", priority="Medium", schedule="None", notify=False, auto_retry=False):
-    if status.lower() not in VALID_STATUSES:
+# Recurring `schedule` values and their period; anything else ("manual", "None") never auto-runs
+SCHEDULE_INTERVALS = {"daily": timedelta(days=1), "weekly": timedelta(weeks=1)}
+
+def next_scheduled_run(schedule, after, now=None):
+    """
+    When a task with this schedule should next run, or None if it is not recurring.
+    With `now`, whole periods are added until the run is in the future, so a
+    task that missed runs (scheduler down) keeps its time of day.
+    """
+    interval = SCHEDULE_INTERVALS.get(str(schedule or "").lower())
+    if not interval:
+        return None
+    run_at = after + interval
+    if now is not None and run_at <= now:
+        run_at += interval * ((now - run_at) // interval + 1)
+    return run_at
+
+def build_task(user_id, title, description, status="pending", type="General", priority="Medium", schedule="None", notify=False, auto_retry=False, use_cache=True):
+    if not title:
+        raise ValueError("Task title is required")
+    if not isinstance(status, str) or status.lower() not in CLIENT_STATUSES:
         raise ValueError("Invalid status provided. Must be one of: pending, running, completed, error")
 
-    task = {
+    now = datetime.utcnow()
+    return {
         "task_id": str(uuid4()),
         "user_id": user_id,
         "title": title,
@@ -21,49 +49,344 @@ def create_task(user_id, title, description, status="pending", type="General", p
         "schedule": schedule,
         "notify": notify,
         "auto_retry": auto_retry,
-        "created_at": datetime.utcnow(),
+        "use_cache": use_cache,
+        "created_at": now,
+        "updated_at": now,
         "last_run": None,
+        # Scheduler state: next due time (None = not scheduled), auto_retry attempts,
+        # and the regular run a retry/deferral stands in for (the next one is counted from it)
+        "next_run_at": next_scheduled_run(schedule, now),
+        "retry_count": 0,
+        "run_slot": None,
     }
-    mongo.db.tasks.insert_one(task)
+
+def create_task(user_id, title, description, status="pending", type="General", priority="Medium", schedule="None", notify=False, auto_retry=False, use_cache=True):
+    task = build_task(user_id, title, description, status=status, type=type, priority=priority,
+                      schedule=schedule, notify=notify, auto_retry=auto_retry, use_cache=use_cache)
+    get_repositories().tasks.insert(task)
+    record_tasks_created(user_id, [task])
+    bump_versions(user_id, "tasks")
     return task["task_id"]
 
 
+# ✅ Request body -> create_task arguments, with the same defaults as POST /tasks
+def task_fields_from_payload(data):
+    return {
+        "title": data.get("title"),
+        "description": data.get("description", ""),
+        "status": data.get("status", "pending"),
+        "type": data.get("type", "General"),
+        "priority": data.get("priority", "Medium"),
+        "schedule": data.get("schedule", "None"),
+        "notify": data.get("notify", False),
+        "auto_retry": data.get("auto_retry", False),
+        "use_cache": data.get("use_cache", True),
+    }
+
+
+# Fields PUT /tasks/<task_id> may change
+UPDATABLE_TASK_FIELDS = ("title", "description", "status", "use_cache", "schedule", "auto_retry")
+
+# ✅ Request body -> validated $set document for a task update
+def build_task_update(data):
+    update_data = {k: data[k] for k in UPDATABLE_TASK_FIELDS if data.get(k) is not None}
+    if "status" in update_data and update_data["status"] not in CLIENT_STATUSES:
+        raise ValueError("Invalid status provided. Must be one of: pending, running, completed, error")
+    update_data["updated_at"] = datetime.utcnow()
+    if "schedule" in update_data:
+        # A new schedule restarts the clock from now
+        update_data["next_run_at"] = next_scheduled_run(update_data["schedule"], update_data["updated_at"])
+        update_data["retry_count"] = 0
+        update_data["run_slot"] = None
+    return update_data
+
+
+# Fields the stats counters are keyed on
+STATS_FIELDS = ["task_id", "status", "type", "priority"]
+
+# ✅ Apply a validated update; False if the task does not exist
+def update_task_fields(task_id, user_id, update_data):
+    before = get_repositories().tasks.update(task_id, user_id, update_data, before_fields=STATS_FIELDS)
+    if before is None:
+        return False
+    if "status" in update_data:
+        record_status_changes(user_id, [(before.get("status"), update_data["status"])])
+    bump_versions(user_id, "tasks")
+    return True
+
+
+# ✅ Delete one task; False if the task does not exist
+def delete_task_by_id(task_id, user_id):
+    deleted = get_repositories().tasks.delete(task_id, user_id, fields=STATS_FIELDS)
+    if deleted is None:
+        return False
+    record_tasks_deleted(user_id, [deleted])
+    bump_versions(user_id, "tasks", deleted_task_ids=[task_id])
+    return True
+
+
+def _created_at(value):
+    return format_date(value or datetime.utcnow())
+
+
+def _last_run(value):
+    return format_datetime(value) if value else "Never"
+
+
+# Fields a task response can contain: response key -> (document field, default, converter)
+TASK_FIELDS = {
+    "task_id": ("task_id", "", None),
+    "title": ("title", "", None),
+    "description": ("description", "", None),
+    "status": ("status", "pending", None),
+    "progress": ("progress", 0, None),
+    "type": ("type", "General", None),
+    "priority": ("priority", "Medium", None),
+    "schedule": ("schedule", "None", None),
+    "notify": ("notify", False, None),
+    "auto_retry": ("auto_retry", False, None),
+    "use_cache": ("use_cache", True, None),
+    "createdAt": ("created_at", None, _created_at),
+    "lastRun": ("last_run", None, _last_run),
+}
+
+# Fields GET /tasks can return (use_cache is only part of the single-task shape)
+TASK_LIST_FIELDS = {name: spec for name, spec in TASK_FIELDS.items() if name != "use_cache"}
+
+# Shape returned when the caller does not ask for specific fields
+DEFAULT_TASK_LIST_FIELDS = ["task_id", "title", "description", "status", "progress", "type", "createdAt", "lastRun"]
+
+# Shape of get_task_by_id
+TASK_DETAIL_FIELDS = list(TASK_FIELDS)
+_serialize_task_detail = compile_serializer(TASK_FIELDS, TASK_DETAIL_FIELDS)
+_TASK_DETAIL_PROJECTION = projection_for(TASK_FIELDS, TASK_DETAIL_FIELDS)
+
+
+def encode_task_cursor(task):
+    # Legacy tasks without created_at sort after all others; their cursor holds null
+    created_at = task.get("created_at")
+    raw = json.dumps({"created_at": created_at.isoformat() if created_at else None, "task_id": task["task_id"]})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_task_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        created_at = data["created_at"]
+        return (datetime.fromisoformat(created_at) if created_at is not None else None), data["task_id"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
 # ✅ Get tasks filtered by user
-def get_tasks_by_user(user_id):
-    tasks = list(mongo.db.tasks.find({"user_id": user_id}))
-    transformed_tasks = []
-
-    for task in tasks:
-        transformed_tasks.append({
-            "task_id": task.get("task_id", ""),
-            "title": task.get("title", ""),
-            "description": task.get("description", ""),
-            "status": task.get("status", "pending"),
-            "progress": task.get("progress", 0),
-            "type": task.get("type", "General"),
-            "createdAt": task.get("created_at", datetime.utcnow()).strftime("%Y-%m-%d"),
-            "lastRun": task.get("last_run").strftime("%Y-%m-%d %H:%M:%S") if task.get("last_run") else "Never"
-        })
-
-    return transformed_tasks
+# Filters run inside Mongo; results are ordered newest first and paged with a
+# keyset cursor on (created_at, task_id). Returns (tasks, next_cursor).
+def get_tasks_by_user(user_id, status=None, type=None, priority=None,
+                      created_after=None, created_before=None,
+                      fields=None, limit=100, cursor=None):
+    fields = fields or DEFAULT_TASK_LIST_FIELDS
+    unknown = [f for f in fields if f not in TASK_LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    filters = {}
+    if status:
+        filters["status"] = status
+    if type:
+        filters["type"] = type
+    if priority:
+        filters["priority"] = priority
+
+    after = decode_task_cursor(cursor) if cursor else None
+
+    # created_at/task_id are always fetched because the cursor is built from them
+    doc_fields = projection_for(TASK_LIST_FIELDS, fields, always=["created_at", "task_id"])
+
+    docs = get_repositories().tasks.page(
+        user_id, filters=filters, created_after=created_after, created_before=created_before,
+        after=after, limit=limit + 1, fields=doc_fields,
+    )
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_task_cursor(docs[-1])
+
+    serialize = compile_serializer(TASK_LIST_FIELDS, fields)
+    return [serialize(task) for task in docs], next_cursor
+
+# ✅ Delta for GET /tasks?since=: tasks created/updated after `since` plus ids
+# deleted after it. `as_of` is the `since` for the next call; it trails the
+# clock by `overlap_seconds` so writes racing this read are sent again rather
+# than missed (clients upsert by task_id). If more than `limit` tasks changed
+# or deletions were trimmed, `resync` asks the client for a full reload.
+def get_tasks_changed_since(user_id, since, fields=None, limit=100, overlap_seconds=5):
+    fields = fields or DEFAULT_TASK_LIST_FIELDS
+    unknown = [f for f in fields if f not in TASK_LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+    as_of = datetime.utcnow() - timedelta(seconds=overlap_seconds)
+    deleted, complete = deleted_tasks_since(user_id, since)
+    docs = get_repositories().tasks.changed_since(
+        user_id, since, limit=limit + 1, fields=projection_for(TASK_LIST_FIELDS, fields),
+    )
+    resync = not complete or len(docs) > limit
+    if resync:
+        docs, deleted = [], []
+
+    serialize = compile_serializer(TASK_LIST_FIELDS, fields)
+    return {
+        "tasks": [serialize(task) for task in docs],
+        "deleted": deleted,
+        "as_of": max(as_of, since).isoformat(),
+        "resync": resync,
+    }
 
 def get_task_by_id(task_id, user_id):
-    task = mongo.db.tasks.find_one({"task_id": task_id, "user_id": user_id})
+    task = get_repositories().tasks.get(task_id, user_id, fields=_TASK_DETAIL_PROJECTION)
     if not task:
         return None
+    return _serialize_task_detail(task)
 
-    return {
-        "task_id": task.get("task_id", ""),
-        "title": task.get("title", ""),
-        "description": task.get("description", ""),
-        "status": task.get("status", "pending"),
-        "progress": task.get("progress", 0),
-        "type": task.get("type", "General"),
-        "priority": task.get("priority", "Medium"),
-        "schedule": task.get("schedule", "None"),
-        "notify": task.get("notify", False),
-        "auto_retry": task.get("auto_retry", False),
-        "createdAt": task.get("created_at", datetime.utcnow()).strftime("%Y-%m-%d"),
-        "lastRun": task.get("last_run").strftime("%Y-%m-%d %H:%M:%S") if task.get("last_run") else "Never"
-    }
 
+# ✅ Update a task's status (plus any extra fields) in one write
+def set_task_status(task_id, user_id, status, **fields):
+    if status not in VALID_STATUSES:
+        raise ValueError("Invalid status provided. Must be one of: pending, running, completed, error, deferred")
+
+    fields["status"] = status
+    fields.setdefault("updated_at", datetime.utcnow())
+    # The pre-update image gives the old status atomically for the stats counters
+    before = get_repositories().tasks.update(task_id, user_id, fields, before_fields=["status"])
+    if before is not None:
+        record_status_changes(user_id, [(before.get("status"), status)])
+        bump_versions(user_id, "tasks")
+    return before
+
+
+# ✅ Save an agent run's step outputs (app.utils.agent_pipeline). Internal state:
+# not part of any API shape, so updated_at and the version are left alone.
+def save_task_checkpoint(task_id, user_id, checkpoint):
+    return get_repositories().tasks.update(task_id, user_id, {"agent_checkpoint": checkpoint}) is not None
+
+
+# ✅ Load several of a user's tasks in one query (by id list and/or status)
+def find_tasks_for_run(user_id, task_ids=None, status=None, limit=None):
+    return get_repositories().tasks.find(user_id, task_ids=task_ids, status=status, limit=limit)
+
+
+# ---------------- Bulk create / update / delete ----------------
+# Each helper validates every row, sends one unordered bulk write and returns
+# one result per input row: {"index", "task_id", "status", "error"?}.
+
+def _existing_tasks(user_id, task_ids):
+    docs = get_repositories().tasks.find(user_id, task_ids=task_ids, fields=STATS_FIELDS)
+    return {doc["task_id"]: doc for doc in docs}
+
+
+def _apply_bulk(results, write, ops, op_rows):
+    """
+    Run `write(ops)`, mark failed rows and return the row indexes that were written.
+    """
+    failed = write(ops) if ops else {}
+    for op_index, message in failed.items():
+        results[op_rows[op_index]].update({"status": "error", "error": message})
+    return [row for op_index, row in enumerate(op_rows) if op_index not in failed]
+
+
+def bulk_create_tasks(user_id, rows):
+    results, ops, op_rows, tasks = [], [], [], {}
+    for index, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("Each task must be a JSON object")
+            task = build_task(user_id, **task_fields_from_payload(row))
+        except ValueError as ve:
+            results.append({"index": index, "status": "invalid", "error": str(ve)})
+            continue
+        results.append({"index": index, "task_id": task["task_id"], "status": "created"})
+        ops.append(task)
+        op_rows.append(index)
+        tasks[index] = task
+
+    written = _apply_bulk(results, get_repositories().tasks.insert_many, ops, op_rows)
+    record_tasks_created(user_id, [tasks[index] for index in written])
+    if written:
+        bump_versions(user_id, "tasks")
+    return results
+
+
+def _validated_task_ids(rows, get_task_id):
+    """
+    Yield (index, task_id, row, error) with duplicate/missing ids flagged.
+    """
+    seen = set()
+    for index, row in enumerate(rows):
+        task_id = get_task_id(row)
+        if not isinstance(task_id, str) or not task_id:
+            yield index, None, row, "task_id is required"
+        elif task_id in seen:
+            yield index, task_id, row, "Duplicate task_id in request"
+        else:
+            seen.add(task_id)
+            yield index, task_id, row, None
+
+
+def bulk_update_tasks_fields(user_id, rows):
+    results, candidates = [], []
+    for index, task_id, row, error in _validated_task_ids(rows, lambda r: r.get("task_id") if isinstance(r, dict) else None):
+        if error is None:
+            try:
+                update_data = build_task_update(row)
+            except ValueError as ve:
+                error = str(ve)
+        if error:
+            results.append({"index": index, "task_id": task_id, "status": "invalid", "error": error})
+            continue
+        results.append({"index": index, "task_id": task_id, "status": "updated"})
+        candidates.append((index, task_id, update_data))
+
+    existing = _existing_tasks(user_id, [task_id for _, task_id, _ in candidates])
+    ops, op_rows, transitions = [], [], {}
+    for index, task_id, update_data in candidates:
+        if task_id not in existing:
+            results[index]["status"] = "not_found"
+            continue
+        ops.append((task_id, user_id, update_data))
+        op_rows.append(index)
+        if "status" in update_data:
+            transitions[index] = (existing[task_id].get("status"), update_data["status"])
+
+    written = _apply_bulk(results, get_repositories().tasks.bulk_update, ops, op_rows)
+    record_status_changes(user_id, [transitions[index] for index in written if index in transitions])
+    if written:
+        bump_versions(user_id, "tasks")
+    return results
+
+
+def bulk_delete_tasks(user_id, task_ids):
+    results, candidates = [], []
+    for index, task_id, _, error in _validated_task_ids(task_ids, lambda t: t):
+        if error:
+            results.append({"index": index, "task_id": task_id, "status": "invalid", "error": error})
+            continue
+        results.append({"index": index, "task_id": task_id, "status": "deleted"})
+        candidates.append((index, task_id))
+
+    existing = _existing_tasks(user_id, [task_id for _, task_id in candidates])
+    ops, op_rows = [], []
+    for index, task_id in candidates:
+        if task_id not in existing:
+            results[index]["status"] = "not_found"
+            continue
+        ops.append((task_id, user_id))
+        op_rows.append(index)
+
+    written = _apply_bulk(results, get_repositories().tasks.bulk_delete, ops, op_rows)
+    record_tasks_deleted(user_id, [existing[results[index]["task_id"]] for index in written])
+    if written:
+        bump_versions(user_id, "tasks", deleted_task_ids=[results[index]["task_id"] for index in written])
+    return results
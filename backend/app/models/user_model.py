@@ -1,12 +1,36 @@
-
-from app import mongo
+from flask import current_app
+from app.repositories import get_repositories
+from app.models.version_model import bump_versions
+from app.utils.user_cache import UserCache, UserCacheInvalidator
 from datetime import datetime  # ✅ add this
+import threading
+
+# User documents are read through the per-process UserCache (app.utils.user_cache)
+# and every write here updates it. Each write also bumps the user's "profile"
+# version, which is how other processes learn to drop their copy.
+
+def _user_cache():
+    return current_app.extensions.get("user_cache")
+
 def get_user_by_email(email):
-    return mongo.db.users.find_one({"email": email})
+    cache = _user_cache()
+    if cache is None:
+        return get_repositories().users.get_by_email(email)
+    return cache.get_by_email(email, get_repositories().users.get_by_email)
 
 def get_user_by_id(user_id):
-    return mongo.db.users.find_one({"user_id": user_id})
+    cache = _user_cache()
+    if cache is None:
+        return get_repositories().users.get_by_user_id(user_id)
+    return cache.get_by_id(user_id, get_repositories().users.get_by_user_id)
+
 
+def _insert_user(user):
+    get_repositories().users.insert(user)
+    bump_versions(user["user_id"], "profile")
+    cache = _user_cache()
+    if cache is not None:
+        cache.put(user)
 
 def create_user(user_id, email, hashed_pw, name):
     user = {
@@ -17,4 +41,83 @@ def create_user(user_id, email, hashed_pw, name):
         "role": "user",
         "created_at": datetime.utcnow()  # ✅ fixed
     }
-    mongo.db.users.insert_one(user)
+    _insert_user(user)
+
+# ✅ Minimal profile for a user_id that has none: shown by GET /profile without
+# being stored, and saved by the first PUT /profile
+def default_profile(user_id):
+    return {
+        "user_id": user_id,
+        "firstName": "",
+        "lastName": "",
+        "email": "",
+        "phone": "",
+        "location": "",
+        "role": "user",
+        "department": "",
+        "timezone": "",
+        "created_at": datetime.utcnow()
+    }
+
+def save_profile(user_id, fields):
+    """
+    $set `fields` on a user's profile, creating it from default_profile if it
+    has none (a single upsert, so concurrent first saves can't both insert).
+    """
+    profile = get_repositories().users.upsert(user_id, fields, default_profile(user_id))
+    bump_versions(user_id, "profile")
+    cache = _user_cache()
+    if cache is not None:
+        cache.put(profile)
+    return profile
+
+def update_user(user_id, fields):
+    """
+    $set `fields` on a user; False if there is no such user.
+    """
+    if not get_repositories().users.update(user_id, fields):
+        return False
+    bump_versions(user_id, "profile")
+    cache = _user_cache()
+    if cache is not None:
+        cache.update(user_id, fields)
+    return True
+
+def update_user_password(user_id, hashed_pw):
+    update_user(user_id, {"password": hashed_pw})
+
+
+# -------------------- User cache --------------------
+def init_user_cache(app):
+    app.extensions["user_cache"] = None
+    app.extensions["user_cache_invalidator"] = None
+    if not app.config.get("USER_CACHE_ENABLED", True):
+        return
+    cache = UserCache(
+        max_entries=app.config.get("USER_CACHE_MAX_ENTRIES", 10000),
+        ttl_seconds=app.config.get("USER_CACHE_TTL_SECONDS", 300),
+    )
+    app.extensions["user_cache"] = cache
+    mode = app.config.get("USER_CACHE_INVALIDATION", "auto")
+    if mode != "none":
+        app.extensions["user_cache_invalidator"] = UserCacheInvalidator(
+            cache, app.extensions["repositories"].versions, mode=mode,
+            poll_seconds=app.config.get("USER_CACHE_POLL_SECONDS", 2.0),
+            overlap_seconds=app.config.get("TASKS_SINCE_OVERLAP_SECONDS", 5),
+        )
+        app.before_request(ensure_user_cache_invalidator_started)
+
+
+_start_lock = threading.Lock()
+
+def ensure_user_cache_invalidator_started():
+    """
+    Start following other processes' user writes on the first request (not
+    at import, so forked workers and CLI commands don't inherit the thread).
+    """
+    invalidator = current_app.extensions.get("user_cache_invalidator")
+    if invalidator is None or invalidator.running:
+        return
+    with _start_lock:
+        if not invalidator.running:
+            invalidator.start()
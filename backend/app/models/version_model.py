@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from flask import current_app
+
+from app.repositories import get_repositories
+
+# Per-user change counters, one document per user in `user_versions`:
+#   {_id: user_id, epoch, tasks, profile, logs, deleted_tasks: [{task_id, at}], updated_at}
+# Every write bumps the scopes it changes *after* the write, so a reader that
+# sees a version never gets data older than it. GET handlers turn the version
+# into an ETag (app.utils.conditional) and answer 304 from this one lookup.
+
+VERSION_SCOPES = ("tasks", "profile", "logs")
+
+
+def _check_scopes(scopes):
+    unknown = [scope for scope in scopes if scope not in VERSION_SCOPES]
+    if unknown:
+        raise ValueError(f"Unknown version scopes: {', '.join(unknown)}")
+
+
+# ✅ Bump hooks called after writes
+def bump_versions(user_id, *scopes, deleted_task_ids=()):
+    _check_scopes(scopes)
+    get_repositories().versions.bump(
+        user_id, scopes, datetime.utcnow(), deleted_task_ids=list(deleted_task_ids),
+        keep=current_app.config.get("TASK_TOMBSTONES_MAX", 1000),
+    )
+
+
+def bump_versions_many(user_ids, *scopes, repos=None):
+    """
+    Bump the same scopes for several users (batch agent runs, log batches).
+    `repos` lets callers without an app context (the log sink thread) pass
+    the repositories in.
+    """
+    _check_scopes(scopes)
+    user_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id]
+    if user_ids:
+        (repos or get_repositories()).versions.bump_many(user_ids, scopes, datetime.utcnow())
+
+
+def get_version(user_id, scope):
+    """
+    Opaque version string for one scope of a user's data, e.g. "3f2a9c1e.42".
+    """
+    doc = get_repositories().versions.get(user_id, fields=["epoch", scope]) or {}
+    return f"{doc.get('epoch', '0')}.{doc.get(scope, 0)}"
+
+
+def deleted_tasks_since(user_id, since):
+    """
+    Task ids deleted after `since`. Returns (task_ids, complete); complete is
+    False when older tombstones were already trimmed, so some deletions after
+    `since` may be missing and the caller has to refetch everything.
+    """
+    doc = get_repositories().versions.get(user_id, fields=["deleted_tasks"]) or {}
+    tombstones = doc.get("deleted_tasks", [])
+    complete = (
+        len(tombstones) < current_app.config.get("TASK_TOMBSTONES_MAX", 1000)
+        or tombstones[0]["at"] <= since
+    )
+    return [t["task_id"] for t in tombstones if t["at"] > since], complete
@@ -0,0 +1,61 @@
+"""
+Persistence for tasks, task stats, logs, users, per-user change versions and
+similar-task vectors behind one interface, so the models never touch a
+database driver directly.
+
+STORAGE_BACKEND selects the engine:
+- mongo: the collections of the configured MongoDB (default)
+- memory: indexed in-process storage, no MongoDB needed (tests, benchmarks)
+
+Both engines expose the same methods; see repositories.mongo for the reference
+implementation.
+"""
+from collections import namedtuple
+
+from flask import current_app
+
+__all__ = ["Repositories", "STORAGE_BACKENDS", "init_repositories", "get_repositories"]
+
+STORAGE_BACKENDS = {"mongo", "memory"}
+
+Repositories = namedtuple("Repositories", ["tasks", "task_stats", "logs", "users", "versions", "vectors"])
+
+
+def init_repositories(app):
+    backend = app.config.get("STORAGE_BACKEND", "mongo")
+    if backend == "mongo":
+        from app import mongo
+        from app.repositories.mongo import (
+            MongoTaskRepository, MongoTaskStatsRepository, MongoLogRepository, MongoUserRepository,
+            MongoVersionRepository, MongoTaskVectorRepository,
+        )
+        repos = Repositories(
+            tasks=MongoTaskRepository(lambda: mongo.db.tasks),
+            task_stats=MongoTaskStatsRepository(lambda: mongo.db.task_stats),
+            logs=MongoLogRepository(lambda: mongo.db.logs),
+            users=MongoUserRepository(lambda: mongo.db.users),
+            versions=MongoVersionRepository(lambda: mongo.db.user_versions),
+            vectors=MongoTaskVectorRepository(lambda: mongo.db.task_vectors),
+        )
+    elif backend == "memory":
+        from app.repositories.memory import (
+            MemoryTaskRepository, MemoryTaskStatsRepository, MemoryLogRepository, MemoryUserRepository,
+            MemoryVersionRepository, MemoryTaskVectorRepository,
+        )
+        repos = Repositories(
+            tasks=MemoryTaskRepository(),
+            task_stats=MemoryTaskStatsRepository(),
+            logs=MemoryLogRepository(),
+            users=MemoryUserRepository(),
+            versions=MemoryVersionRepository(),
+            vectors=MemoryTaskVectorRepository(),
+        )
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+    app.extensions["repositories"] = repos
+    return repos
+
+
+def get_repositories():
+    return current_app.extensions["repositories"]
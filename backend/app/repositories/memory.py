@@ -0,0 +1,478 @@
+import copy
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime
+from uuid import uuid4
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.utils.text_search import TASK_TEXT_WEIGHTS, parse_search_query, task_text_terms
+
+__all__ = [
+    "MemoryTaskRepository", "MemoryTaskStatsRepository", "MemoryLogRepository", "MemoryUserRepository",
+    "MemoryVersionRepository", "MemoryTaskVectorRepository",
+]
+
+# Sorts before every real value, for bisecting on the first half of a key
+_MIN_ID = ""
+
+
+# Task, log and user documents are flat (scalar values), so shallow copies are
+# enough to keep callers from mutating stored documents
+def _project(doc, fields):
+    if doc is None:
+        return None
+    if fields is None:
+        return dict(doc)
+    return {field: doc[field] for field in fields if field in doc}
+
+
+def _descending(keys, upper=None, lower=None):
+    """
+    Walk a sorted key list from the top: keys < upper, down to keys >= lower.
+    """
+    end = len(keys) if upper is None else bisect_left(keys, upper)
+    start = 0 if lower is None else bisect_left(keys, lower)
+    for i in range(end - 1, start - 1, -1):
+        yield keys[i]
+
+
+class MemoryTaskRepository:
+    """
+    Tasks held in process. Indexed like the Mongo collection: a unique index on
+    task_id, per user a sorted (created_at, task_id) list that serves the
+    newest-first pages and cursors without scanning other users' tasks, a
+    sorted (next_run_at, task_id) list for the scheduler, and per user an
+    inverted index of the searched text fields (no stemming, unlike Mongo's).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}  # task_id -> doc
+        self._by_user = {}  # user_id -> sorted [(created_at, task_id)]
+        self._due = []  # sorted [(next_run_at, task_id)], scheduled tasks only
+        self._postings = {}  # user_id -> {term: {task_id}}
+        self._doc_terms = {}  # task_id -> {term: weighted frequency}
+
+    @staticmethod
+    def _key(doc):
+        return doc.get("created_at") or datetime.min, doc["task_id"]
+
+    def _index_text(self, doc):
+        terms = self._doc_terms[doc["task_id"]] = task_text_terms(doc)
+        postings = self._postings.setdefault(doc["user_id"], {})
+        for term in terms:
+            postings.setdefault(term, set()).add(doc["task_id"])
+
+    def _unindex_text(self, doc):
+        postings = self._postings.get(doc["user_id"], {})
+        for term in self._doc_terms.pop(doc["task_id"], ()):
+            task_ids = postings.get(term)
+            if task_ids is not None:
+                task_ids.discard(doc["task_id"])
+                if not task_ids:
+                    del postings[term]
+
+    def _set_fields(self, doc, fields):
+        old_run = doc.get("next_run_at")
+        reindex = any(field in TASK_TEXT_WEIGHTS for field in fields)
+        if reindex:
+            self._unindex_text(doc)
+        doc.update(fields)
+        if reindex:
+            self._index_text(doc)
+        if "next_run_at" in fields and fields["next_run_at"] != old_run:
+            if old_run is not None:
+                self._due.pop(bisect_left(self._due, (old_run, doc["task_id"])))
+            if doc["next_run_at"] is not None:
+                insort(self._due, (doc["next_run_at"], doc["task_id"]))
+
+    def _owned(self, task_id, user_id):
+        doc = self._docs.get(task_id)
+        return doc if doc is not None and doc.get("user_id") == user_id else None
+
+    def insert(self, task):
+        with self._lock:
+            if task["task_id"] in self._docs:
+                raise DuplicateKeyError(f"Duplicate task_id: {task['task_id']}")
+            doc = dict(task)
+            self._docs[doc["task_id"]] = doc
+            insort(self._by_user.setdefault(doc["user_id"], []), self._key(doc))
+            if doc.get("next_run_at") is not None:
+                insort(self._due, (doc["next_run_at"], doc["task_id"]))
+            self._index_text(doc)
+
+    def insert_many(self, tasks):
+        errors = {}
+        for index, task in enumerate(tasks):
+            try:
+                self.insert(task)
+            except DuplicateKeyError as e:
+                errors[index] = str(e)
+        return errors
+
+    def get(self, task_id, user_id, fields=None):
+        with self._lock:
+            return _project(self._owned(task_id, user_id), fields)
+
+    def find(self, user_id, task_ids=None, status=None, limit=None, fields=None):
+        with self._lock:
+            if task_ids is not None:
+                docs = (self._owned(task_id, user_id) for task_id in dict.fromkeys(task_ids))
+            else:
+                docs = (self._docs[task_id] for _, task_id in self._by_user.get(user_id, []))
+            results = []
+            for doc in docs:
+                if doc is None or (status and doc.get("status") != status):
+                    continue
+                results.append(_project(doc, fields))
+                if limit and len(results) >= limit:
+                    break
+            return results
+
+    def page(self, user_id, filters=None, created_after=None, created_before=None, after=None, limit=100, fields=None):
+        filters = filters or {}
+        # Tasks without created_at are keyed (and cursored) as datetime.min
+        upper = (after[0] or datetime.min, after[1]) if after else None
+        if created_before and (upper is None or (created_before, _MIN_ID) < upper):
+            upper = (created_before, _MIN_ID)
+        lower = (created_after, _MIN_ID) if created_after else None
+
+        with self._lock:
+            results = []
+            for _, task_id in _descending(self._by_user.get(user_id, []), upper, lower):
+                doc = self._docs[task_id]
+                if all(doc.get(field) == value for field, value in filters.items()):
+                    results.append(_project(doc, fields))
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def changed_since(self, user_id, since, limit=100, fields=None):
+        with self._lock:
+            docs = [
+                self._docs[task_id] for _, task_id in self._by_user.get(user_id, [])
+                if (self._docs[task_id].get("updated_at") or datetime.min) > since
+            ]
+            docs.sort(key=lambda doc: (doc["updated_at"], doc["task_id"]))
+            return [_project(doc, fields) for doc in docs[:limit]]
+
+    def search(self, user_id, query, skip=0, limit=100, fields=None):
+        terms, phrases, excluded = parse_search_query(query)
+        with self._lock:
+            postings = self._postings.get(user_id, {})
+            matches = set().union(*(postings.get(term, ()) for term in terms))
+            ranked = []
+            for task_id in matches:
+                doc_terms, doc = self._doc_terms[task_id], self._docs[task_id]
+                if excluded and not excluded.isdisjoint(doc_terms):
+                    continue
+                if phrases:
+                    text = " ".join(str(doc.get(field) or "") for field in TASK_TEXT_WEIGHTS).lower()
+                    if not all(phrase in text for phrase in phrases):
+                        continue
+                ranked.append((-sum(doc_terms.get(term, 0) for term in terms), task_id))
+            ranked.sort()
+            return [
+                dict(_project(self._docs[task_id], fields), score=-score)
+                for score, task_id in ranked[skip:skip + limit]
+            ]
+
+    def update(self, task_id, user_id, fields, before_fields=None):
+        with self._lock:
+            doc = self._owned(task_id, user_id)
+            if doc is None:
+                return None
+            before = _project(doc, before_fields or ["task_id"])
+            self._set_fields(doc, fields)
+            return before
+
+    def bulk_update(self, updates):
+        for task_id, user_id, fields in updates:
+            self.update(task_id, user_id, fields)
+        return {}
+
+    def delete(self, task_id, user_id, fields=None):
+        with self._lock:
+            doc = self._owned(task_id, user_id)
+            if doc is None:
+                return None
+            del self._docs[task_id]
+            keys = self._by_user[user_id]
+            keys.pop(bisect_left(keys, self._key(doc)))
+            if doc.get("next_run_at") is not None:
+                self._due.pop(bisect_left(self._due, (doc["next_run_at"], task_id)))
+            self._unindex_text(doc)
+            return _project(doc, fields or ["task_id"])
+
+    def bulk_delete(self, keys):
+        for task_id, user_id in keys:
+            self.delete(task_id, user_id)
+        return {}
+
+    def find_due(self, before, limit=500, fields=None):
+        with self._lock:
+            end = bisect_left(self._due, (before, _MIN_ID))
+            return [_project(self._docs[task_id], fields) for _, task_id in self._due[:min(end, limit)]]
+
+    def find_unscheduled(self, schedules, limit=500, fields=None):
+        schedules = {schedule.lower() for schedule in schedules}
+        with self._lock:
+            found = (doc for doc in self._docs.values()
+                     if doc.get("next_run_at") is None and str(doc.get("schedule") or "").lower() in schedules)
+            return [_project(doc, fields) for doc, _ in zip(found, range(limit))]
+
+    def claim_due(self, task_id, user_id, due_at, owner, lease_until, now):
+        with self._lock:
+            doc = self._owned(task_id, user_id)
+            if doc is None or doc.get("next_run_at") != due_at:
+                return None
+            if doc.get("lease_until") is not None and doc["lease_until"] >= now:
+                return None
+            self._set_fields(doc, {"lease_owner": owner, "lease_until": lease_until})
+            return _project(doc, None)
+
+    def release(self, task_id, user_id, owner, fields):
+        with self._lock:
+            doc = self._owned(task_id, user_id)
+            if doc is None or doc.get("lease_owner") != owner:
+                return False
+            self._set_fields(doc, dict(fields, lease_owner=None, lease_until=None))
+            return True
+
+    def count_groups(self, user_id=None):
+        with self._lock:
+            docs = (
+                (self._docs[task_id] for _, task_id in self._by_user.get(user_id, []))
+                if user_id is not None else list(self._docs.values())
+            )
+            counts = Counter(
+                (doc.get("user_id"), doc.get("status"), doc.get("type"), doc.get("priority")) for doc in docs
+            )
+        return counts.items()
+
+
+class MemoryTaskStatsRepository:
+    """
+    Per-user counter documents; dotted $inc paths become nested dicts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}
+
+    def get(self, user_id):
+        with self._lock:
+            return copy.deepcopy(self._docs.get(user_id))
+
+    def increment(self, user_id, deltas, updated_at):
+        with self._lock:
+            doc = self._docs.setdefault(user_id, {"_id": user_id})
+            for path, amount in deltas.items():
+                *parents, leaf = path.split(".")
+                target = doc
+                for part in parents:
+                    target = target.setdefault(part, {})
+                target[leaf] = target.get(leaf, 0) + amount
+            doc["updated_at"] = updated_at
+
+    def replace(self, user_id, doc):
+        with self._lock:
+            self._docs[user_id] = dict(copy.deepcopy(doc), _id=user_id)
+
+    def prune(self, keep_user_ids):
+        keep = set(keep_user_ids)
+        with self._lock:
+            for user_id in [u for u in self._docs if u not in keep]:
+                del self._docs[user_id]
+
+
+class MemoryVersionRepository:
+    """
+    Per-user change counters; see MongoVersionRepository.
+    """
+
+    # One process holds all the data: there is nothing to watch
+    supports_change_streams = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}
+
+    def get(self, user_id, fields=None):
+        with self._lock:
+            return copy.deepcopy(self._docs.get(user_id))
+
+    def bump(self, user_id, scopes, now, deleted_task_ids=(), keep=1000):
+        with self._lock:
+            doc = self._docs.setdefault(user_id, {"_id": user_id, "epoch": uuid4().hex[:8]})
+            for scope in scopes:
+                doc[scope] = doc.get(scope, 0) + 1
+                doc.setdefault("changed_at", {})[scope] = now
+            doc["updated_at"] = now
+            if deleted_task_ids:
+                deleted = doc.setdefault("deleted_tasks", [])
+                deleted.extend({"task_id": task_id, "at": now} for task_id in deleted_task_ids)
+                del deleted[:-keep]
+
+    def bump_many(self, user_ids, scopes, now):
+        for user_id in user_ids:
+            self.bump(user_id, scopes, now)
+
+    def changed_since(self, scope, since):
+        with self._lock:
+            return [
+                {"_id": doc["_id"], scope: doc.get(scope, 0), "changed_at": doc["changed_at"][scope]}
+                for doc in self._docs.values()
+                if doc.get("changed_at", {}).get(scope) and doc["changed_at"][scope] > since
+            ]
+
+    def watch(self, scope, resume_after=None, max_await_ms=1000):
+        return None
+
+
+class MemoryTaskVectorRepository:
+    """
+    Similar-task vectors; see MongoTaskVectorRepository.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_user = {}  # user_id -> {task_id: (vector, updated_at)}
+
+    def load(self, user_id):
+        with self._lock:
+            return [
+                {"task_id": task_id, "vector": vector, "updated_at": updated_at}
+                for task_id, (vector, updated_at) in self._by_user.get(user_id, {}).items()
+            ]
+
+    def upsert_many(self, user_id, rows):
+        with self._lock:
+            vectors = self._by_user.setdefault(user_id, {})
+            for task_id, vector, updated_at in rows:
+                vectors[task_id] = (bytes(vector), updated_at)
+        return {}
+
+    def delete_many(self, user_id, task_ids):
+        with self._lock:
+            vectors = self._by_user.get(user_id, {})
+            for task_id in task_ids:
+                vectors.pop(task_id, None)
+
+    def clear(self, user_id):
+        with self._lock:
+            self._by_user.pop(user_id, None)
+
+
+class MemoryLogRepository:
+    """
+    Logs held in process, with a per-user (timestamp, _id) sorted list so a
+    page is a bisect plus a walk, as with the Mongo index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}  # _id -> doc
+        self._by_user = {}  # user_id -> sorted [(timestamp, _id)]
+
+    def insert_one(self, entry):
+        self.insert_many([entry])
+
+    def insert_many(self, entries, ordered=False):
+        with self._lock:
+            for entry in entries:
+                # Like pymongo, assign the _id on the caller's document
+                entry.setdefault("_id", ObjectId())
+                if entry["_id"] in self._docs:
+                    continue
+                doc = dict(entry)
+                self._docs[doc["_id"]] = doc
+                ts = doc.get("timestamp") if isinstance(doc.get("timestamp"), datetime) else datetime.min
+                insort(self._by_user.setdefault(doc.get("user_id"), []), (ts, doc["_id"]))
+
+    def find_for_user(self, user_id, start=None, end=None, task_id=None, status=None,
+                      after=None, limit=None, batch_size=500, fields=None):
+        # Logs without a datetime timestamp are keyed (datetime.min, _id), cursors too
+        upper = (after[0] if isinstance(after[0], datetime) else datetime.min, after[1]) if after else None
+        if end and (upper is None or (end, ObjectId("0" * 24)) < upper):
+            upper = (end, ObjectId("0" * 24))
+        lower = (start, ObjectId("0" * 24)) if start else None
+
+        with self._lock:
+            results = []
+            for _, log_id in _descending(self._by_user.get(user_id, []), upper, lower):
+                doc = self._docs[log_id]
+                if (task_id and doc.get("task_id") != task_id) or (status and doc.get("status") != status):
+                    continue
+                results.append(_project(doc, fields))
+                if limit and len(results) >= limit:
+                    break
+        return iter(results)
+
+
+class MemoryUserRepository:
+    """
+    Users held in process, indexed by user_id and (non-empty) email.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_user_id = {}
+        self._by_email = {}
+
+    def get_by_email(self, email):
+        with self._lock:
+            return _project(self._by_email.get(email), None)
+
+    def get_by_user_id(self, user_id):
+        with self._lock:
+            return _project(self._by_user_id.get(user_id), None)
+
+    def insert(self, user):
+        with self._lock:
+            email = user.get("email")
+            if email and email in self._by_email:
+                raise DuplicateKeyError(f"Duplicate email: {email}")
+            user.setdefault("_id", ObjectId())
+            doc = dict(user)
+            self._by_user_id[doc["user_id"]] = doc
+            if email:
+                self._by_email[email] = doc
+
+    def update(self, user_id, fields):
+        with self._lock:
+            doc = self._by_user_id.get(user_id)
+            if doc is None:
+                return False
+            new_email = fields.get("email", doc.get("email"))
+            if new_email and new_email != doc.get("email") and new_email in self._by_email:
+                raise DuplicateKeyError(f"Duplicate email: {new_email}")
+            if doc.get("email"):
+                self._by_email.pop(doc["email"], None)
+            doc.update(fields)
+            if doc.get("email"):
+                self._by_email[doc["email"]] = doc
+            return True
+
+    def upsert(self, user_id, fields, defaults):
+        """
+        $set `fields` on the user, creating it from `defaults` if there is
+        none; returns the stored document.
+        """
+        with self._lock:
+            doc = self._by_user_id.get(user_id)
+            if doc is None:
+                doc = dict(defaults, user_id=user_id, _id=ObjectId())
+            new_email = fields.get("email", doc.get("email"))
+            if new_email and new_email != doc.get("email") and new_email in self._by_email:
+                raise DuplicateKeyError(f"Duplicate email: {new_email}")
+            if doc.get("email"):
+                self._by_email.pop(doc["email"], None)
+            doc.update(fields)
+            self._by_user_id[user_id] = doc
+            if doc.get("email"):
+                self._by_email[doc["email"]] = doc
+            return dict(doc)
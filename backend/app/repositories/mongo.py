@@ -0,0 +1,438 @@
+from pymongo import InsertOne, UpdateOne, DeleteOne, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
+from datetime import datetime
+from uuid import uuid4
+import re
+
+__all__ = [
+    "MongoTaskRepository", "MongoTaskStatsRepository", "MongoLogRepository", "MongoUserRepository",
+    "MongoVersionRepository", "MongoTaskVectorRepository",
+]
+
+
+def _projection(fields):
+    if fields is None:
+        return None
+    projection = {"_id": 0}
+    projection.update({field: 1 for field in fields})
+    return projection
+
+
+def _bulk_write(collection, ops):
+    """
+    Unordered bulk_write; returns {op index: error message} for ops that failed.
+    """
+    if not ops:
+        return {}
+    try:
+        collection.bulk_write(ops, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        return {err["index"]: err.get("errmsg", "Write failed") for err in e.details.get("writeErrors", [])}
+
+
+class MongoTaskRepository:
+    """
+    Tasks in the `tasks` collection, keyed by (task_id, user_id).
+    """
+
+    def __init__(self, collection_getter):
+        self._collection_getter = collection_getter
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def insert(self, task):
+        self.collection.insert_one(task)
+
+    def insert_many(self, tasks):
+        return _bulk_write(self.collection, [InsertOne(task) for task in tasks])
+
+    def get(self, task_id, user_id, fields=None):
+        return self.collection.find_one({"task_id": task_id, "user_id": user_id}, _projection(fields))
+
+    def find(self, user_id, task_ids=None, status=None, limit=None, fields=None):
+        query = {"user_id": user_id}
+        if task_ids is not None:
+            query["task_id"] = {"$in": list(task_ids)}
+        if status:
+            query["status"] = status
+
+        cursor = self.collection.find(query, _projection(fields))
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def page(self, user_id, filters=None, created_after=None, created_before=None, after=None, limit=100, fields=None):
+        query = {"user_id": user_id}
+        query.update(filters or {})
+        if created_after or created_before:
+            query["created_at"] = {}
+            if created_after:
+                query["created_at"]["$gte"] = created_after
+            if created_before:
+                query["created_at"]["$lt"] = created_before
+
+        if after:
+            after_created_at, after_task_id = after
+            if after_created_at is None:
+                # Past the dated tasks: only legacy ones without created_at are left
+                query["$or"] = [{"created_at": None, "task_id": {"$lt": after_task_id}}]
+            else:
+                query["$or"] = [
+                    {"created_at": {"$lt": after_created_at}},
+                    {"created_at": after_created_at, "task_id": {"$lt": after_task_id}},
+                    # null/missing sorts last in a descending sort, but $lt does not match it
+                    {"created_at": None},
+                ]
+
+        return list(
+            self.collection.find(query, _projection(fields))
+            .sort([("created_at", DESCENDING), ("task_id", DESCENDING)])
+            .limit(limit)
+        )
+
+    def changed_since(self, user_id, since, limit=100, fields=None):
+        """
+        A user's tasks with updated_at after `since`, oldest change first
+        (all of them with limit=None).
+        """
+        return list(
+            self.collection.find({"user_id": user_id, "updated_at": {"$gt": since}}, _projection(fields))
+            .sort([("updated_at", ASCENDING), ("task_id", ASCENDING)])
+            .limit(limit or 0)
+        )
+
+    def search(self, user_id, query, skip=0, limit=100, fields=None):
+        """
+        A user's tasks matching a $text query, best match first; each has its
+        relevance in "score". Served by the (user_id, text) index.
+        """
+        projection = _projection(fields) or {}
+        projection["score"] = {"$meta": "textScore"}
+        return list(
+            self.collection.find({"user_id": user_id, "$text": {"$search": query}}, projection)
+            .sort([("score", {"$meta": "textScore"}), ("task_id", ASCENDING)])
+            .skip(skip)
+            .limit(limit)
+        )
+
+    def update(self, task_id, user_id, fields, before_fields=None):
+        # Returns the task as it was before the update, or None if it does not exist
+        return self.collection.find_one_and_update(
+            {"task_id": task_id, "user_id": user_id},
+            {"$set": fields},
+            projection=_projection(before_fields or ["task_id"]),
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    def bulk_update(self, updates):
+        return _bulk_write(self.collection, [
+            UpdateOne({"task_id": task_id, "user_id": user_id}, {"$set": fields})
+            for task_id, user_id, fields in updates
+        ])
+
+    def delete(self, task_id, user_id, fields=None):
+        return self.collection.find_one_and_delete(
+            {"task_id": task_id, "user_id": user_id},
+            projection=_projection(fields or ["task_id"]),
+        )
+
+    def bulk_delete(self, keys):
+        return _bulk_write(self.collection, [
+            DeleteOne({"task_id": task_id, "user_id": user_id}) for task_id, user_id in keys
+        ])
+
+    def find_due(self, before, limit=500, fields=None):
+        """
+        Scheduled tasks with next_run_at before `before`, soonest first.
+        """
+        return list(
+            self.collection.find({"next_run_at": {"$lt": before}}, _projection(fields))
+            .sort("next_run_at", ASCENDING)
+            .limit(limit)
+        )
+
+    def find_unscheduled(self, schedules, limit=500, fields=None):
+        """
+        Tasks with a recurring schedule (any case of `schedules`) but no
+        next_run_at, e.g. created before the scheduler existed.
+        """
+        pattern = "^(" + "|".join(re.escape(schedule) for schedule in schedules) + ")$"
+        return list(self.collection.find(
+            {"schedule": {"$regex": pattern, "$options": "i"}, "next_run_at": None},
+            _projection(fields),
+        ).limit(limit))
+
+    def claim_due(self, task_id, user_id, due_at, owner, lease_until, now):
+        """
+        Take the run lease on a due task. Matches only if the task is still due
+        at `due_at` and nobody holds an unexpired lease, so of several instances
+        racing for the same run exactly one gets the document back.
+        """
+        return self.collection.find_one_and_update(
+            {
+                "task_id": task_id,
+                "user_id": user_id,
+                "next_run_at": due_at,
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}],
+            },
+            {"$set": {"lease_owner": owner, "lease_until": lease_until}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def release(self, task_id, user_id, owner, fields):
+        """
+        Drop the lease and set the outcome fields, if the lease is still ours.
+        """
+        return self.collection.update_one(
+            {"task_id": task_id, "user_id": user_id, "lease_owner": owner},
+            {"$set": dict(fields, lease_owner=None, lease_until=None)},
+        ).matched_count > 0
+
+    def count_groups(self, user_id=None):
+        """
+        Yield ((user_id, status, type, priority), count) for every combination present.
+        """
+        pipeline = []
+        if user_id is not None:
+            pipeline.append({"$match": {"user_id": user_id}})
+        pipeline.append({
+            "$group": {
+                "_id": {"user_id": "$user_id", "status": "$status", "type": "$type", "priority": "$priority"},
+                "count": {"$sum": 1},
+            }
+        })
+        for row in self.collection.aggregate(pipeline):
+            group = row["_id"]
+            yield (group.get("user_id"), group.get("status"), group.get("type"), group.get("priority")), row["count"]
+
+
+class MongoTaskStatsRepository:
+    """
+    Per-user counter documents in `task_stats` (_id = user_id).
+    """
+
+    def __init__(self, collection_getter):
+        self._collection_getter = collection_getter
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def get(self, user_id):
+        return self.collection.find_one({"_id": user_id})
+
+    def increment(self, user_id, deltas, updated_at):
+        self.collection.update_one(
+            {"_id": user_id},
+            {"$inc": deltas, "$set": {"updated_at": updated_at}},
+            upsert=True,
+        )
+
+    def replace(self, user_id, doc):
+        self.collection.replace_one({"_id": user_id}, doc, upsert=True)
+
+    def prune(self, keep_user_ids):
+        self.collection.delete_many({"_id": {"$nin": list(keep_user_ids)}})
+
+
+class MongoVersionRepository:
+    """
+    Per-user change counters in `user_versions` (_id = user_id). `epoch` is
+    set once per document so counters restarting after a reset never repeat
+    an earlier version. `changed_at.<scope>` is when a scope was last bumped.
+    """
+
+    # watch() works on a replica set or sharded cluster, not on a standalone server
+    supports_change_streams = True
+
+    def __init__(self, collection_getter):
+        self._collection_getter = collection_getter
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def get(self, user_id, fields=None):
+        return self.collection.find_one({"_id": user_id}, fields and {field: 1 for field in fields})
+
+    @staticmethod
+    def _bump(scopes, now, deleted_task_ids=(), keep=1000):
+        update = {
+            "$inc": {scope: 1 for scope in scopes},
+            "$set": dict({"updated_at": now}, **{f"changed_at.{scope}": now for scope in scopes}),
+            "$setOnInsert": {"epoch": uuid4().hex[:8]},
+        }
+        if deleted_task_ids:
+            update["$push"] = {"deleted_tasks": {
+                "$each": [{"task_id": task_id, "at": now} for task_id in deleted_task_ids],
+                "$slice": -keep,
+            }}
+        return update
+
+    def bump(self, user_id, scopes, now, deleted_task_ids=(), keep=1000):
+        self.collection.update_one({"_id": user_id}, self._bump(scopes, now, deleted_task_ids, keep), upsert=True)
+
+    def bump_many(self, user_ids, scopes, now):
+        _bulk_write(self.collection, [
+            UpdateOne({"_id": user_id}, self._bump(scopes, now), upsert=True) for user_id in user_ids
+        ])
+
+    def changed_since(self, scope, since):
+        """
+        [{_id: user_id, <scope>: counter, changed_at}] of users whose `scope` was bumped after `since`.
+        """
+        return [
+            {"_id": doc["_id"], scope: doc.get(scope, 0), "changed_at": doc["changed_at"][scope]}
+            for doc in self.collection.find(
+                {f"changed_at.{scope}": {"$gt": since}}, {scope: 1, f"changed_at.{scope}": 1}
+            )
+        ]
+
+    def watch(self, scope, resume_after=None, max_await_ms=1000):
+        """
+        Change stream of bumps to `scope` (and new/removed version documents);
+        each event's documentKey._id is the user_id. Needs a replica set or
+        sharded cluster: a standalone server raises OperationFailure.
+        """
+        pipeline = [{"$match": {"$or": [
+            {"operationType": {"$in": ["insert", "replace", "delete"]}},
+            {f"updateDescription.updatedFields.{scope}": {"$exists": True}},
+        ]}}]
+        return self.collection.watch(pipeline, resume_after=resume_after, max_await_time_ms=max_await_ms)
+
+
+class MongoTaskVectorRepository:
+    """
+    Similar-task vectors in `task_vectors` (_id = task_id), each with the
+    updated_at of the task version it was computed from.
+    """
+
+    def __init__(self, collection_getter):
+        self._collection_getter = collection_getter
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def load(self, user_id):
+        return [
+            {"task_id": doc["_id"], "vector": doc["vector"], "updated_at": doc["updated_at"]}
+            for doc in self.collection.find({"user_id": user_id}).batch_size(5000)
+        ]
+
+    def upsert_many(self, user_id, rows):
+        return _bulk_write(self.collection, [
+            UpdateOne(
+                {"_id": task_id},
+                {"$set": {"user_id": user_id, "vector": vector, "updated_at": updated_at}},
+                upsert=True,
+            )
+            for task_id, vector, updated_at in rows
+        ])
+
+    def delete_many(self, user_id, task_ids):
+        if task_ids:
+            self.collection.delete_many({"user_id": user_id, "_id": {"$in": list(task_ids)}})
+
+    def clear(self, user_id):
+        self.collection.delete_many({"user_id": user_id})
+
+
+class MongoLogRepository:
+    """
+    Agent logs in the `logs` collection, read newest first by (timestamp, _id).
+    """
+
+    def __init__(self, collection_getter):
+        self._collection_getter = collection_getter
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def insert_one(self, entry):
+        self.collection.insert_one(entry)
+
+    def insert_many(self, entries, ordered=False):
+        self.collection.insert_many(entries, ordered=ordered)
+
+    def find_for_user(self, user_id, start=None, end=None, task_id=None, status=None,
+                      after=None, limit=None, batch_size=500, fields=None):
+        query = {"user_id": user_id}
+        if start or end:
+            query["timestamp"] = {}
+            if start:
+                query["timestamp"]["$gte"] = start
+            if end:
+                query["timestamp"]["$lt"] = end
+        if task_id:
+            query["task_id"] = task_id
+        if status:
+            query["status"] = status
+        if after:
+            after_ts, after_id = after
+            # Descending, dates sort before legacy string timestamps, and those
+            # before missing ones; $lt only compares values of the same type
+            if isinstance(after_ts, datetime):
+                query["$or"] = [
+                    {"timestamp": {"$lt": after_ts}},
+                    {"timestamp": after_ts, "_id": {"$lt": after_id}},
+                    {"timestamp": {"$not": {"$type": "date"}}},
+                ]
+            elif isinstance(after_ts, str):
+                query["$or"] = [
+                    {"timestamp": {"$lt": after_ts}},
+                    {"timestamp": after_ts, "_id": {"$lt": after_id}},
+                    {"timestamp": None},
+                ]
+            else:
+                query["$or"] = [{"timestamp": None, "_id": {"$lt": after_id}}]
+
+        logs = (
+            self.collection.find(query, _projection(fields))
+            .sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+            .batch_size(batch_size)
+        )
+        if limit:
+            logs = logs.limit(limit)
+        return logs
+
+
+class MongoUserRepository:
+    """
+    Accounts and profiles in the `users` collection.
+    """
+
+    def __init__(self, collection_getter):
+        self._collection_getter = collection_getter
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def get_by_email(self, email):
+        return self.collection.find_one({"email": email})
+
+    def get_by_user_id(self, user_id):
+        return self.collection.find_one({"user_id": user_id})
+
+    def insert(self, user):
+        self.collection.insert_one(user)
+
+    def update(self, user_id, fields):
+        # True if the user exists
+        return self.collection.update_one({"user_id": user_id}, {"$set": fields}).matched_count > 0
+
+    def upsert(self, user_id, fields, defaults):
+        # One atomic write: the unique user_id index turns a concurrent insert into a retried update
+        defaults = {k: v for k, v in defaults.items() if k not in fields and k != "user_id"}
+        return self.collection.find_one_and_update(
+            {"user_id": user_id},
+            {"$set": fields, "$setOnInsert": defaults},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
@@ -1,67 +1,256 @@
-from flask import Blueprint, jsonify, g, request
+from flask import Blueprint, jsonify, g, request, current_app, Response, stream_with_context
 from app.utils.jwt_helper import token_required
-from app.models.task_model import get_task_by_id
-from app.utils.langchain_tools import run_agent_for_task
-from app import mongo
+from app.models.task_model import get_task_by_id, find_tasks_for_run, set_task_status, VALID_STATUSES
+from app.utils.job_queue import get_job_queue, ensure_workers_started, job_to_dict
+from app.utils.langchain_tools import stream_agent_for_task, get_llm_guard, defer_until
+from app.utils.llm_guard import LLMUnavailable
+from app.utils.rate_limit import UserRateLimiter
+from app.utils.scheduler import schedule_task_run
+from app.utils.logger import get_logger, log_event
+from collections import Counter
 from datetime import datetime
+import json
+import logging
+import math
+
+logger = get_logger(__name__)
 
 ai_bp = Blueprint("ai", __name__)
 
+
+def defer_if_llm_unavailable(task_id, user_id):
+    """
+    While the LLM circuit breaker is open, mark the task deferred (the
+    scheduler runs it once the backend had time to recover) and return a 503
+    response instead of starting a run bound to fail. None otherwise.
+
+    The breaker is per process and only sees calls made here. With
+    AI_WORKERS_IN_PROCESS=false the queued runs call the LLM in worker.py, so
+    this process's breaker only opens on its own streaming runs; queued runs
+    are still deferred, by the worker, when its breaker is open.
+    """
+    try:
+        get_llm_guard().check()
+        return None
+    except LLMUnavailable as e:
+        run_at = defer_until(e.retry_after)
+        set_task_status(task_id, user_id, "deferred", next_run_at=run_at)
+        schedule_task_run(task_id, user_id, run_at)
+        retry_after = math.ceil(e.retry_after)
+        return jsonify({
+            "error": "AI backend unavailable",
+            "status": "deferred",
+            "next_run_at": run_at.isoformat(),
+            "retry_after": retry_after,
+        }), 503, {"Retry-After": str(retry_after)}
+
 @ai_bp.route("/tasks/<task_id>/run-ai", methods=["POST"])
 @token_required
 def run_ai_for_task_route(task_id):
     """
-    Run Gemini AI agent for a given stored task.
-    Updates task status and logs the AI output.
-    Returns the AI output as JSON.
+    Queue a Gemini AI agent run for a given stored task.
+    Returns 202 with a job id right away; the run itself happens on an
+    agent worker, and its progress is reported by GET /ai-jobs/<job_id>.
     """
     try:
         user_id = g.user_id
-        print(f"Received JSON body: {request.get_json()}")
-
         # Ensure task exists
         task = get_task_by_id(task_id, user_id)
         if not task:
             return jsonify({"error": "Task not found"}), 404
 
-        # Set task status to running
-        mongo.db.tasks.update_one(
-            {"task_id": task_id, "user_id": user_id},
-            {"$set": {"status": "running", "last_run": datetime.utcnow()}}
-        )
+        deferred = defer_if_llm_unavailable(task_id, user_id)
+        if deferred is not None:
+            return deferred
+
+        job = get_job_queue().enqueue(task_id, user_id)
+        ensure_workers_started()
+
+        return jsonify({
+            "message": "Agentic AI task queued",
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "status_url": f"/ai-jobs/{job['job_id']}",
+        }), 202, {"Location": f"/ai-jobs/{job['job_id']}"}
 
-        # Run the agentic AI loop
-        context = run_agent_for_task(task_id, user_id)
-
-        if context.get("error"):
-            # Mark task as error in DB if error occurred
-            mongo.db.tasks.update_one(
-                {"task_id": task_id, "user_id": user_id},
-                {"$set": {"status": "error"}}
-            )
-            return jsonify({
-                "error": "AI processing failed",
-                "details": context["error"]
-            }), 500
-
-        # Debug print for backend logs
-        print(f"Agentic AI completed for task {task_id} by user {user_id}. Steps completed: {context.get('steps_completed')}")
-        
-        # Return the AI response and metadata as JSON
+    except Exception as e:
+        log_event(logger, logging.ERROR, "run_ai_queue_failed", task_id=task_id, error=str(e))
         return jsonify({
-            "message": "Agentic AI task completed",
-            "ai_response": context.get("results"),
-            "steps_completed": context.get("steps_completed"),
-        }), 200
+            "error": "Failed to queue AI task",
+            "details": str(e)
+        }), 500
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Response headers of the SSE stream (also used by the ASGI mode, app.asgi)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def stream_event_to_sse(event, payload):
+    """
+    SSE frame for one (event, payload) of stream_agent_for_task / astream_agent_for_task.
+    """
+    if event == "chunk":
+        return _sse("chunk", {"text": payload})
+    if event == "done":
+        return _sse("done", {
+            "ai_response": payload.get("results"),
+            "steps_completed": payload.get("steps_completed"),
+            "cached": payload.get("cached", False),
+        })
+    log_event(logger, logging.WARNING, "run_ai_stream_failed", task_id=payload.get("task_id"), error=payload.get("error"))
+    return _sse("error", {"error": "AI processing failed", "details": payload.get("error")})
+
+
+@token_required
+def begin_stream_run(task_id):
+    """
+    Checks before a streamed run, shared by both serving modes: returns an
+    error response, or None once the task is marked running.
+    """
+    # Ensure task exists
+    task = get_task_by_id(task_id, g.user_id)
+    if not task:
+        return jsonify({"error": "Task not found"}), 404
+
+    deferred = defer_if_llm_unavailable(task_id, g.user_id)
+    if deferred is not None:
+        return deferred
+
+    set_task_status(task_id, g.user_id, "running", last_run=datetime.utcnow())
+    return None
+
+
+@ai_bp.route("/tasks/<task_id>/run-ai/stream", methods=["POST"])
+def run_ai_stream_route(task_id):
+    """
+    Run the Gemini AI agent for a task and relay the answer as Server-Sent Events:
+    - event: chunk  data: {"text": ...}   (repeated as Gemini generates)
+    - event: done   data: {"ai_response", "steps_completed", "cached"}
+    - event: error  data: {"error": ...}
+    The assembled result is saved to the task and logs when the stream ends.
+    """
+    error = begin_stream_run(task_id)
+    if error is not None:
+        return error
+    user_id = g.user_id
+
+    def generate():
+        for event, payload in stream_agent_for_task(task_id, user_id):
+            yield stream_event_to_sse(event, payload)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@ai_bp.route("/ai-jobs/<job_id>", methods=["GET"])
+@token_required
+def get_ai_job_status(job_id):
+    """
+    Report the status of a queued agent run: queued, running, completed or error.
+    """
+    try:
+        job = get_job_queue().get(job_id, g.user_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+
+        return jsonify(job_to_dict(job)), 200
 
     except Exception as e:
-        # On unexpected failure, mark task as error
-        mongo.db.tasks.update_one(
-            {"task_id": task_id, "user_id": g.user_id},
-            {"$set": {"status": "error"}}
+        log_event(logger, logging.ERROR, "ai_job_status_failed", job_id=job_id, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+def get_batch_rate_limiter():
+    limiter = current_app.extensions.get("ai_batch_rate_limiter")
+    if limiter is None:
+        limiter = current_app.extensions.setdefault(
+            "ai_batch_rate_limiter",
+            UserRateLimiter(current_app.config["AI_BATCH_RATE_PER_MINUTE"])
         )
-        print(f"Error in run_ai_for_task_route: {e}")
+    return limiter
+
+
+@ai_bp.route("/tasks/run-ai/batch", methods=["POST"])
+@token_required
+def run_ai_batch_route():
+    """
+    Queue agent runs for many of the user's tasks in one call.
+    Body: {"task_ids": [...]} or {"status": "pending"}.
+    Tasks are loaded in one query and one job per task is queued in one
+    insert, like POST /tasks/<id>/run-ai; each run is reported by
+    GET /ai-jobs/<job_id>. Returns 202 with a per-task job id or reason.
+    """
+    try:
+        user_id = g.user_id
+        data = request.get_json(silent=True) or {}
+        task_ids = data.get("task_ids")
+        status = data.get("status")
+        max_tasks = current_app.config["AI_BATCH_MAX_TASKS"]
+
+        if task_ids is None and not status:
+            return jsonify({"error": "Provide task_ids or a status filter"}), 400
+
+        if task_ids is not None:
+            if not isinstance(task_ids, list) or not all(isinstance(t, str) for t in task_ids):
+                return jsonify({"error": "task_ids must be a list of task id strings"}), 400
+            task_ids = list(dict.fromkeys(task_ids))
+            if len(task_ids) > max_tasks:
+                return jsonify({"error": f"At most {max_tasks} tasks per batch"}), 400
+
+        if status and status not in VALID_STATUSES:
+            return jsonify({"error": "Invalid status provided. Must be one of: pending, running, completed, error, deferred"}), 400
+
+        tasks = find_tasks_for_run(user_id, task_ids=task_ids, status=status, limit=max_tasks)
+
+        results = {}
+        if task_ids is not None:
+            found = {task["task_id"] for task in tasks}
+            for task_id in task_ids:
+                if task_id not in found:
+                    results[task_id] = {"task_id": task_id, "status": "not_found"}
+            order = task_ids
+        else:
+            order = [task["task_id"] for task in tasks]
+
+        # Per-user cap on how many agent runs may start per minute
+        limiter = get_batch_rate_limiter()
+        granted = limiter.acquire(user_id, len(tasks))
+        to_run, limited = tasks[:granted], tasks[granted:]
+        for task in limited:
+            results[task["task_id"]] = {"task_id": task["task_id"], "status": "rate_limited"}
+
+        if limited and not to_run:
+            retry_after = math.ceil(limiter.retry_after(user_id))
+            return jsonify({"error": "Rate limit exceeded for batch AI runs"}), 429, {"Retry-After": str(retry_after)}
+
+        if to_run:
+            # Workers mark each task running when they pick its job up
+            jobs = get_job_queue().enqueue_many([(task["task_id"], user_id) for task in to_run])
+            ensure_workers_started()
+            for job in jobs:
+                results[job["task_id"]] = {
+                    "task_id": job["task_id"],
+                    "status": job["status"],
+                    "job_id": job["job_id"],
+                    "status_url": f"/ai-jobs/{job['job_id']}",
+                }
+
+        ordered = [results[task_id] for task_id in order]
+        summary = {"requested": len(ordered), **Counter(r["status"] for r in ordered)}
+        log_event(logger, logging.INFO, "batch_ai_run_queued", user_id=user_id, **summary)
+
+        return jsonify({
+            "message": "Batch AI run queued",
+            "summary": summary,
+            "results": ordered,
+        }), 202
+
+    except Exception as e:
+        log_event(logger, logging.ERROR, "batch_ai_run_failed", error=str(e))
         return jsonify({
-            "error": "AI processing failed",
+            "error": "Failed to queue batch AI run",
             "details": str(e)
         }), 500
@@ -1,12 +1,17 @@
-from flask import Blueprint, request, jsonify
-from app.models.user_model import get_user_by_email, create_user
-from app.utils.jwt_helper import generate_jwt_token
+from flask import Blueprint, request, jsonify, g
+from app.models.user_model import get_user_by_email, create_user, update_user_password
+from app.utils.jwt_helper import generate_jwt_token, token_required, revoke_token
+from app.utils.password_hasher import get_password_hasher, HasherBusy
 from app import mongo
-import bcrypt
 import uuid
 
 auth_bp = Blueprint("auth", __name__)
 
+# bcrypt runs on a bounded pool; when it is saturated, shed load instead of queueing
+@auth_bp.errorhandler(HasherBusy)
+def hasher_busy(e):
+    return jsonify({"error": "Too many authentication requests, please retry"}), 429, {"Retry-After": str(e.retry_after)}
+
 # -------------------- Signup Route --------------------
 @auth_bp.route("/signup", methods=["POST"])
 def signup():
@@ -22,7 +27,7 @@ def signup():
     if existing_user:
         return jsonify({"error": "User already exists"}), 409
 
-    hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed_pw = get_password_hasher().hash_password(password)
     user_id = str(uuid.uuid4())
 
     create_user(user_id=user_id, email=email, hashed_pw=hashed_pw, name=name)
@@ -46,10 +51,15 @@ def login():
     if not email or not password:
         return jsonify({"error": "Email and password are required"}), 400
 
+    hasher = get_password_hasher()
     user = get_user_by_email(email)
-    if not user or not bcrypt.checkpw(password.encode('utf-8'), user["password"]):
+    if not user or not user.get("password") or not hasher.verify_password(password, user["password"]):
         return jsonify({"error": "Invalid credentials"}), 401
 
+    # Transparently upgrade hashes made with an older BCRYPT_ROUNDS
+    if hasher.needs_rehash(user["password"]):
+        update_user_password(user["user_id"], hasher.hash_password(password))
+
     token = generate_jwt_token(str(user["_id"]))
     
 
@@ -58,4 +68,11 @@ def login():
         "user_id": user["user_id"],
         "name": user["name"]
     }), 200
-    
\ No newline at end of file
+
+# -------------------- Logout Route --------------------
+@auth_bp.route("/logout", methods=["POST"])
+@token_required
+def logout():
+    # Revoke the presented token so it stops working before it expires
+    revoke_token(g.token)
+    return jsonify({"message": "Logged out"}), 200
@@ -1,11 +1,46 @@
-from flask import Blueprint, jsonify, g
+from flask import Blueprint, jsonify, g, request, current_app, Response, stream_with_context
 from app.utils.jwt_helper import token_required
-from app.models.log_model import get_logs_for_user
+from app.utils.conditional import conditional_get
+from app.models.log_model import get_logs_for_user, iter_logs_for_user
+from app.utils.serializers import dumps
+from app.utils.logger import get_logger, log_event
+from datetime import datetime
+import logging
+
+logger = get_logger(__name__)
 
 logs_bp = Blueprint("logs", __name__)
 
+def _parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date, e.g. 2024-01-31 or 2024-01-31T12:00:00")
+
+def _limit_arg(default=None):
+    value = request.args.get("limit")
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+
+def _wants_ndjson():
+    if request.args.get("format") == "ndjson":
+        return True
+    return request.accept_mimetypes.best == "application/x-ndjson"
+
+# Query params: start, end (ISO timestamps), task_id, status, limit, cursor,
+# format=ndjson (or Accept: application/x-ndjson) to stream every matching log.
+# JSON responses stay a plain list; the next page's cursor is in X-Next-Cursor.
+# Responses carry an ETag; If-None-Match with an unchanged log version gets a 304.
 @logs_bp.route("/logs", methods=["GET"])
 @token_required
+@conditional_get("logs")
 def logs():
     try:
         # Pull user_id from g instead of request
@@ -13,13 +48,41 @@ def logs():
         if not user_id:
             return jsonify({"error": "User ID missing from request"}), 401
 
-        logs = get_logs_for_user(user_id)
+        filters = {
+            "start": _parse_date_arg("start"),
+            "end": _parse_date_arg("end"),
+            "task_id": request.args.get("task_id"),
+            "status": request.args.get("status"),
+            "cursor": request.args.get("cursor"),
+        }
+
+        if _wants_ndjson():
+            limit = _limit_arg()
+            if limit is not None and limit < 1:
+                return jsonify({"error": "limit must be a positive integer"}), 400
+            logs_iter = iter_logs_for_user(user_id, limit=limit, **filters)
+
+            def generate():
+                for log in logs_iter:
+                    yield dumps(log) + "\n"
+
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+        max_page_size = current_app.config["LOGS_MAX_PAGE_SIZE"]
+        limit = _limit_arg(current_app.config["LOGS_PAGE_SIZE"])
+        if limit < 1 or limit > max_page_size:
+            return jsonify({"error": f"limit must be between 1 and {max_page_size}"}), 400
+
+        logs, next_cursor = get_logs_for_user(user_id, limit=limit, **filters)
 
         if not logs:
             return jsonify({"message": "No logs found"}), 404
 
-        return jsonify(logs), 200
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        return jsonify(logs), 200, headers
 
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
-        print(f"Error fetching logs: {e}")
+        log_event(logger, logging.ERROR, "route_failed", route="GET /logs", error=str(e))
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from app.utils.metrics import render_metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+# ✅ Prometheus scrape endpoint (text exposition format 0.0.4)
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,37 +1,23 @@
 from flask import Blueprint, request, jsonify, g
 from app.utils.jwt_helper import token_required
-from app import mongo
-from datetime import datetime
+from app.utils.conditional import conditional_get
+from app.models.user_model import get_user_by_id, default_profile, save_profile
 
 profile_bp = Blueprint("profile", __name__)
 
 # ---------------- GET Profile ----------------
 @profile_bp.route("/", methods=["GET"])
 @token_required
+@conditional_get("profile")
 def get_profile():
-    # Always match user_id as string
-    user = mongo.db.users.find_one(
-        {"user_id": str(g.user_id)},
-        {"_id": 0, "password": 0}
-    )
+    # Always match user_id as string (served from the user cache when possible)
+    user = get_user_by_id(str(g.user_id))
 
     if not user:
-        # Auto-create minimal profile so 404 never happens again
-        new_user = {
-            "user_id": str(g.user_id),
-            "firstName": "",
-            "lastName": "",
-            "email": "",
-            "phone": "",
-            "location": "",
-            "role": "user",
-            "department": "",
-            "timezone": "",
-            "created_at": datetime.utcnow()
-        }
-        mongo.db.users.insert_one(new_user)
-        user = {k: v for k, v in new_user.items() if k != "password"}
+        # Minimal profile so 404 never happens; only a PUT stores it, so reads stay read-only
+        user = default_profile(str(g.user_id))
 
+    user = {k: v for k, v in user.items() if k not in ("_id", "password")}
     return jsonify(user), 200
 
 
@@ -52,12 +38,7 @@ def update_profile():
     if not update_data:
         return jsonify({"error": "No valid fields to update"}), 400
 
-    result = mongo.db.users.update_one(
-        {"user_id": str(g.user_id)},
-        {"$set": update_data}
-    )
-
-    if result.matched_count == 0:
-        return jsonify({"error": "User not found"}), 404
+    # Creates the profile on the first PUT (GET showed the default one)
+    save_profile(str(g.user_id), update_data)
 
     return jsonify({"message": "Profile updated successfully"}), 200
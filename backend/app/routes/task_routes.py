@@ -1,11 +1,22 @@
-from flask import Blueprint, request, jsonify,g
+from flask import Blueprint, request, jsonify, g, current_app
 from app.utils.jwt_helper import token_required
-from app.models.task_model import create_task , get_tasks_by_user, get_task_by_id
-from app import mongo
+from app.utils.conditional import conditional_get
+from app.models.task_model import (
+    create_task, get_tasks_by_user, get_tasks_changed_since, get_task_by_id, build_task_update,
+    update_task_fields, delete_task_by_id,
+    bulk_create_tasks, bulk_update_tasks_fields, bulk_delete_tasks,
+)
+from app.models.stats_model import get_task_stats
+from app.models.search_model import search_tasks, search_similar_tasks, find_similar_tasks
+from app.utils.logger import get_logger, log_event
 from bson import ObjectId
 import datetime
+import logging
+from collections import Counter
 from random import randint
 from datetime import datetime
+
+logger = get_logger(__name__)
 task_bp = Blueprint("task", __name__)
 
 # ✅ Create a new task
@@ -24,6 +35,7 @@ def create_task_route():
         schedule = data.get("schedule", "None")
         notify = data.get("notify", False)
         auto_retry = data.get("auto_retry", False)
+        use_cache = data.get("use_cache", True)
 
         if not title:
             return jsonify({"error": "Task title is required"}), 400
@@ -37,7 +49,8 @@ def create_task_route():
             priority=priority,
             schedule=schedule,
             notify=notify,
-            auto_retry=auto_retry
+            auto_retry=auto_retry,
+            use_cache=use_cache
         )
 
         return jsonify({"message": "Task created", "task_id": task_id}), 201
@@ -48,30 +61,176 @@ def create_task_route():
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
 
-# ✅ Get all tasks (with optional status filter)
+# ✅ Get tasks (filters, field selection and cursor pagination run in Mongo)
+# Query params: status, type, priority, created_after, created_before (ISO dates),
+# fields (comma separated), limit, cursor (next_cursor from the previous page).
+# since=<ISO timestamp> switches to delta mode: {"tasks" changed after it,
+# "deleted" task ids, "as_of" (the next since), "resync"}; only fields and limit apply.
+# Responses carry an ETag; If-None-Match with an unchanged task version gets a 304.
+
+def _parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date, e.g. 2024-01-31 or 2024-01-31T12:00:00")
+
+DELTA_EXCLUSIVE_ARGS = ("status", "type", "priority", "created_after", "created_before", "cursor")
 
 @task_bp.route("/tasks", methods=["GET"])
 @token_required
+@conditional_get("tasks")
 def get_tasks():
     try:
         status_filter = request.args.get("status", "all")
         user_id = g.user_id
 
-        # ✅ This already returns a cleaned list of task dicts
-        tasks = get_tasks_by_user(user_id)
+        max_page_size = current_app.config["TASKS_MAX_PAGE_SIZE"]
+        try:
+            limit = int(request.args.get("limit", current_app.config["TASKS_PAGE_SIZE"]))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        if limit < 1 or limit > max_page_size:
+            return jsonify({"error": f"limit must be between 1 and {max_page_size}"}), 400
+
+        fields = request.args.get("fields")
+        fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+        since = _parse_date_arg("since")
+        if since is not None:
+            conflicting = [arg for arg in DELTA_EXCLUSIVE_ARGS if request.args.get(arg)]
+            if conflicting:
+                return jsonify({"error": f"since cannot be combined with: {', '.join(conflicting)}"}), 400
+            delta = get_tasks_changed_since(
+                user_id, since, fields=fields, limit=limit,
+                overlap_seconds=current_app.config["TASKS_SINCE_OVERLAP_SECONDS"],
+            )
+            return jsonify(dict(delta, next_cursor=None)), 200
+
+        tasks, next_cursor = get_tasks_by_user(
+            user_id,
+            status=None if status_filter == "all" else status_filter,
+            type=request.args.get("type"),
+            priority=request.args.get("priority"),
+            created_after=_parse_date_arg("created_after"),
+            created_before=_parse_date_arg("created_before"),
+            fields=fields,
+            limit=limit,
+            cursor=request.args.get("cursor"),
+        )
+
+        return jsonify({"tasks": tasks, "next_cursor": next_cursor}), 200
+
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        log_event(logger, logging.ERROR, "route_failed", route="GET /tasks", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
 
-        # ✅ Filter by status if provided
-        if status_filter != "all":
-            tasks = [task for task in tasks if task["status"] == status_filter]
 
+
+
+# ✅ Search the user's tasks
+# Query params: q, mode, fields (as GET /tasks, plus "result"), limit, cursor.
+# mode=text (default): Mongo text search over title, description and the AI
+#   result, best match first with a "score"; q supports "exact phrases" and -excluded words.
+# mode=semantic: nearest tasks to q in the similar-task index, with a "similarity"; one page.
+
+def _limit_arg(default):
+    max_page_size = current_app.config["TASKS_MAX_PAGE_SIZE"]
+    try:
+        limit = int(request.args.get("limit", default))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1 or limit > max_page_size:
+        raise ValueError(f"limit must be between 1 and {max_page_size}")
+    return limit
+
+def _fields_arg():
+    fields = request.args.get("fields")
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+@task_bp.route("/tasks/search", methods=["GET"])
+@token_required
+@conditional_get("tasks")
+def search_tasks_route():
+    try:
+        query = request.args.get("q", "")
+        mode = request.args.get("mode", "text")
+        limit = _limit_arg(20)
+
+        if mode == "semantic":
+            if request.args.get("cursor"):
+                return jsonify({"error": "cursor is not supported with mode=semantic"}), 400
+            tasks, next_cursor = search_similar_tasks(g.user_id, query, fields=_fields_arg(), limit=limit), None
+        elif mode == "text":
+            tasks, next_cursor = search_tasks(
+                g.user_id, query, fields=_fields_arg(), limit=limit, cursor=request.args.get("cursor"),
+                max_results=current_app.config["TASK_SEARCH_MAX_RESULTS"],
+            )
+        else:
+            return jsonify({"error": "mode must be text or semantic"}), 400
+
+        return jsonify({"tasks": tasks, "next_cursor": next_cursor}), 200
+
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
+    except Exception as e:
+        log_event(logger, logging.ERROR, "route_failed", route="GET /tasks/search", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+# ✅ Tasks similar to a task (title, description and AI result), most similar first
+@task_bp.route("/tasks/<task_id>/similar", methods=["GET"])
+@token_required
+@conditional_get("tasks")
+def similar_tasks_route(task_id):
+    try:
+        tasks = find_similar_tasks(g.user_id, task_id, fields=_fields_arg(), limit=_limit_arg(10))
+        if tasks is None:
+            return jsonify({"error": "Task not found"}), 404
         return jsonify({"tasks": tasks}), 200
 
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
     except Exception as e:
-        print("❌ Error in GET /tasks:", e)
+        log_event(logger, logging.ERROR, "route_failed", route="GET /tasks/<task_id>/similar", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 
+# ✅ Dashboard counters: totals by status/type/priority and completion rate.
+# Served from the per-user task_stats document, so cost does not grow with tasks.
+@task_bp.route("/tasks/stats", methods=["GET"])
+@token_required
+@conditional_get("tasks")
+def task_stats():
+    try:
+        return jsonify(get_task_stats(g.user_id)), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, "route_failed", route="GET /tasks/stats", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
 
+# ✅ Get one task by ID
+@task_bp.route("/tasks/<task_id>", methods=["GET"])
+@token_required
+@conditional_get("tasks")
+def get_task(task_id):
+    try:
+        task = get_task_by_id(task_id, g.user_id)
+        if not task:
+            return jsonify({"error": "Task not found"}), 404
+        return jsonify(task), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, "route_failed", route="GET /tasks/<task_id>", error=str(e))
+        return jsonify({"error": str(e)}), 500
 
 
 # ✅ Update a task by ID
@@ -82,25 +241,15 @@ def update_task(task_id):
         data = request.json
         user_id = g.user_id
 
-        update_data = {
-            "title": data.get("title"),
-            "description": data.get("description"),
-            "status": data.get("status"),
-            "updated_at": datetime.datetime.utcnow()
-        }
-
-        update_data = {k: v for k, v in update_data.items() if v is not None}
-
-        result = mongo.db.tasks.update_one(
-            {"task_id": task_id, "user_id": user_id},
-            {"$set": update_data}
-        )
+        update_data = build_task_update(data)
 
-        if result.modified_count == 0:
+        if not update_task_fields(task_id, user_id, update_data):
             return jsonify({"error": "Task not found or no update made"}), 404
 
         return jsonify({"message": "Task updated"}), 200
 
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -112,12 +261,58 @@ def delete_task(task_id):
     try:
         user_id = g.user_id
 
-        result = mongo.db.tasks.delete_one({"task_id": task_id, "user_id": user_id})
-
-        if result.deleted_count == 0:
+        if not delete_task_by_id(task_id, user_id):
             return jsonify({"error": "Task not found"}), 404
 
         return jsonify({"message": "Task deleted"}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+# ✅ Bulk endpoints: one request and one unordered bulk_write for many tasks.
+# Rows are validated like POST /tasks; the response has one result per row.
+
+def _bulk_rows(key):
+    data = request.get_json(silent=True) or {}
+    rows = data.get(key)
+    if not isinstance(rows, list) or not rows:
+        raise ValueError(f"'{key}' must be a non-empty list")
+    max_rows = current_app.config["TASKS_BULK_MAX"]
+    if len(rows) > max_rows:
+        raise ValueError(f"At most {max_rows} rows per bulk request")
+    return rows
+
+def _bulk_response(results):
+    summary = {"requested": len(results), **Counter(r["status"] for r in results)}
+    return jsonify({"summary": summary, "results": results}), 200
+
+@task_bp.route("/tasks/bulk", methods=["POST"])
+@token_required
+def bulk_create_route():
+    try:
+        return _bulk_response(bulk_create_tasks(g.user_id, _bulk_rows("tasks")))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500
+
+@task_bp.route("/tasks/bulk", methods=["PUT"])
+@token_required
+def bulk_update_route():
+    try:
+        return _bulk_response(bulk_update_tasks_fields(g.user_id, _bulk_rows("updates")))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/bulk", methods=["DELETE"])
+@token_required
+def bulk_delete_route():
+    try:
+        return _bulk_response(bulk_delete_tasks(g.user_id, _bulk_rows("task_ids")))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
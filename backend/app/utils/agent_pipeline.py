@@ -0,0 +1,337 @@
+"""
+Declarative agent pipelines.
+
+A Pipeline is a list of Steps; each step names the steps whose outputs it
+needs (`requires`). Steps are grouped into waves: every step of a wave only
+depends on earlier waves, so the steps of a wave run concurrently (e.g.
+several LLM sub-queries fanned out, then merged by a later step).
+
+Each step can have a timeout and retries. A timeout applies where steps run
+on the shared step pool (several steps in one wave) or on the event loop; a
+step that is alone in its wave runs inline on the calling thread, bounded by
+its own I/O timeouts (for LLM steps, the HTTP client's), so a single-step
+wave does not take a pool thread. Steps that timed out are not retried: the
+abandoned attempt may still be running. Outputs of steps marked
+`checkpoint=True` (the expensive ones) are saved to the task document under
+`agent_checkpoint` after every wave, so a run that fails (or a process that
+dies) resumes from the last completed step instead of paying for those
+calls again. A checkpoint only applies to the same pipeline and the same
+task inputs (title/description by default); a successful run clears it.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from flask import current_app
+
+from app.utils.metrics import AGENT_STEPS, AGENT_STEP_DURATION
+
+__all__ = ["Step", "Pipeline", "run_in_app"]
+
+_step_pool_lock = threading.Lock()
+
+
+def _get_step_pool(app):
+    # Threads that run pipeline steps with a timeout or alongside other steps,
+    # one pool per app (AGENT_STEP_THREADS), created on first use
+    with _step_pool_lock:
+        pool = app.extensions.get("agent_step_pool")
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=app.config.get("AGENT_STEP_THREADS", 32),
+                                      thread_name_prefix="agent-step")
+            app.extensions["agent_step_pool"] = pool
+        return pool
+
+
+async def run_in_app(app, fn, *args, **kwargs):
+    """
+    Await a blocking call (repositories, models, cache) on a worker thread
+    with an app context pushed.
+    """
+    def call():
+        with app.app_context():
+            return fn(*args, **kwargs)
+    return await asyncio.to_thread(call)
+
+
+class Step:
+    """
+    One pipeline step. `fn(task, inputs, context)` returns the step output,
+    where `inputs` maps each required step name to its output. `afn` is an
+    optional coroutine version `afn(app, task, inputs, context)` used by
+    Pipeline.arun; without it `fn` runs on a worker thread there.
+    Checkpointed outputs must be BSON-serialisable.
+    """
+
+    def __init__(self, name, fn, requires=(), afn=None, timeout=None, retries=0,
+                 retry_backoff=0.5, checkpoint=False):
+        self.name = name
+        self.fn = fn
+        self.requires = tuple(requires)
+        self.afn = afn
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.checkpoint = checkpoint
+
+    def backoff(self, attempt):
+        return self.retry_backoff * (2 ** attempt)
+
+
+class StepTimeout(Exception):
+    # The timed-out attempt may still be running (threads are not interrupted),
+    # so retrying would put a second call in flight next to it
+    retryable = False
+
+
+def _retryable(error):
+    # Errors can opt out of retries (e.g. app.utils.llm_guard.LLMUnavailable)
+    return getattr(error, "retryable", True)
+
+
+def _timeout_error(step):
+    return StepTimeout(f"Step {step.name} timed out after {step.timeout}s")
+
+
+class Pipeline:
+    """
+    Steps in dependency order. The output of `result` (the last step by
+    default) becomes context["results"].
+    """
+
+    def __init__(self, name, steps, result=None, inputs=("title", "description")):
+        self.name = name
+        self.steps = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise ValueError(f"Duplicate step: {step.name}")
+            unknown = [name for name in step.requires if name not in self.steps]
+            if unknown:
+                # Requiring only earlier steps also rules out cycles
+                raise ValueError(f"Step {step.name} requires unknown or later steps: {', '.join(unknown)}")
+            self.steps[step.name] = step
+        self.result = result or steps[-1].name
+        self.inputs = tuple(inputs)
+        self.waves = self._waves(steps)
+
+    @staticmethod
+    def _waves(steps):
+        level = {}
+        for step in steps:
+            level[step.name] = 1 + max((level[name] for name in step.requires), default=-1)
+        waves = [[] for _ in range(max(level.values()) + 1)]
+        for step in steps:
+            waves[level[step.name]].append(step)
+        return waves
+
+    # -------------------- checkpoints --------------------
+    def input_key(self, task):
+        raw = json.dumps([self.name] + [task.get(field) for field in self.inputs], default=str)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest()
+
+    def resume(self, task):
+        """
+        Step outputs saved by an earlier failed run of this pipeline on the same inputs.
+        """
+        checkpoint = task.get("agent_checkpoint") or {}
+        if checkpoint.get("pipeline") != self.name or checkpoint.get("input_key") != self.input_key(task):
+            return {}
+        return {
+            name: output for name, output in (checkpoint.get("outputs") or {}).items()
+            if name in self.steps and self.steps[name].checkpoint
+        }
+
+    def checkpoint_for(self, task, outputs):
+        """
+        Checkpoint document holding the checkpointed steps among `outputs`.
+        """
+        return {
+            "pipeline": self.name,
+            "input_key": self.input_key(task),
+            "outputs": {name: output for name, output in outputs.items() if self.steps[name].checkpoint},
+            "updated_at": datetime.utcnow(),
+        }
+
+    def _start(self, task, context):
+        outputs = self.resume(task)
+        context["pipeline"] = self.name
+        context["outputs"] = outputs
+        context["resumed_steps"] = list(outputs)
+        for name in outputs:
+            AGENT_STEPS.inc(name, "resumed")
+        return outputs
+
+    def _after_wave(self, task, context, outputs, wave, done):
+        context["steps_completed"] += [step.name for step in wave if step.name in outputs]
+        if any(self.steps[name].checkpoint for name in done):
+            context["checkpoint"] = self.checkpoint_for(task, outputs)
+            return True
+        return False
+
+    def _finish(self, context, outputs):
+        context["results"] = outputs[self.result]
+        return context
+
+    # -------------------- threads --------------------
+    def run(self, task, context, save=None):
+        """
+        Run the pipeline for a loaded task document, filling `context`.
+        `save(checkpoint)` is called after each wave that produced
+        checkpointed outputs; context["checkpoint"] holds the latest one either
+        way. Raises the first step error.
+        """
+        app = current_app._get_current_object()
+        outputs = self._start(task, context)
+
+        for wave in self.waves:
+            pending = [step for step in wave if step.name not in outputs]
+            if not pending:
+                context["steps_completed"] += [step.name for step in wave]
+                continue
+
+            if len(pending) == 1:
+                results = {pending[0].name: self._call_inline(pending[0], task, outputs, context)}
+            else:
+                results = self._call_wave(app, pending, task, outputs, context)
+
+            errors = [result for result in results.values() if isinstance(result, Exception)]
+            done = {name: result for name, result in results.items() if not isinstance(result, Exception)}
+            outputs.update(done)
+            if self._after_wave(task, context, outputs, wave, done) and save:
+                save(context["checkpoint"])
+            if errors:
+                raise errors[0]
+
+        return self._finish(context, outputs)
+
+    def _inputs(self, step, outputs):
+        return {name: outputs[name] for name in step.requires}
+
+    def _call_inline(self, step, task, outputs, context):
+        for attempt in range(step.retries + 1):
+            start = time.perf_counter()
+            try:
+                output = step.fn(task, self._inputs(step, outputs), context)
+                AGENT_STEP_DURATION.observe(time.perf_counter() - start, step.name, "completed")
+                return output
+            except Exception as e:
+                AGENT_STEP_DURATION.observe(time.perf_counter() - start, step.name, "error")
+                if attempt == step.retries or not _retryable(e):
+                    AGENT_STEPS.inc(step.name, "error")
+                    return e
+                AGENT_STEPS.inc(step.name, "retried")
+                time.sleep(step.backoff(attempt))
+
+    def _call_wave(self, app, steps, task, outputs, context):
+        """
+        Run the steps of a wave concurrently on the step pool. Attempts past
+        their timeout are abandoned, not interrupted: the thread finishes in
+        the background and its output is ignored. They are not retried.
+        """
+        pool = _get_step_pool(app)
+
+        def attempt(step, delay):
+            if delay:
+                time.sleep(delay)
+            with app.app_context():
+                return step.fn(task, self._inputs(step, outputs), context)
+
+        def submit(step, attempt_no, delay=0):
+            future = pool.submit(attempt, step, delay)
+            deadline = None if step.timeout is None else time.monotonic() + delay + step.timeout
+            running[future] = (step, attempt_no, deadline, time.perf_counter() + delay)
+
+        running, results = {}, {}
+        for step in steps:
+            submit(step, 0)
+
+        while running:
+            deadlines = [deadline for _, _, deadline, _ in running.values() if deadline is not None]
+            timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            finished, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            expired = [future for future, (_, _, deadline, _) in running.items()
+                       if future not in finished and deadline is not None and deadline <= now]
+
+            for future in list(finished) + expired:
+                step, attempt_no, _, started = running.pop(future)
+                elapsed = max(0.0, time.perf_counter() - started)
+                if future in finished and future.exception() is None:
+                    AGENT_STEP_DURATION.observe(elapsed, step.name, "completed")
+                    results[step.name] = future.result()
+                    continue
+
+                error = future.exception() if future in finished else _timeout_error(step)
+                AGENT_STEP_DURATION.observe(elapsed, step.name, "timeout" if future not in finished else "error")
+                if attempt_no < step.retries and _retryable(error):
+                    AGENT_STEPS.inc(step.name, "retried")
+                    submit(step, attempt_no + 1, step.backoff(attempt_no))
+                else:
+                    AGENT_STEPS.inc(step.name, "error")
+                    results[step.name] = error
+
+        return results
+
+    # -------------------- asyncio --------------------
+    async def arun(self, app, task, context, save=None):
+        """
+        Pipeline.run for the event loop. Steps of a wave are awaited together;
+        `save(checkpoint)` is a blocking call and runs on a worker thread.
+        """
+        outputs = self._start(task, context)
+
+        for wave in self.waves:
+            pending = [step for step in wave if step.name not in outputs]
+            if not pending:
+                context["steps_completed"] += [step.name for step in wave]
+                continue
+
+            values = await asyncio.gather(
+                *(self._acall(app, step, task, outputs, context) for step in pending),
+                return_exceptions=True,
+            )
+            for value in values:
+                if isinstance(value, asyncio.CancelledError):
+                    raise value
+            results = dict(zip((step.name for step in pending), values))
+
+            errors = [result for result in results.values() if isinstance(result, Exception)]
+            done = {name: result for name, result in results.items() if not isinstance(result, Exception)}
+            outputs.update(done)
+            if self._after_wave(task, context, outputs, wave, done) and save:
+                await run_in_app(app, save, context["checkpoint"])
+            if errors:
+                raise errors[0]
+
+        return self._finish(context, outputs)
+
+    async def _acall(self, app, step, task, outputs, context):
+        inputs = self._inputs(step, outputs)
+        for attempt in range(step.retries + 1):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                if step.afn is not None:
+                    call = step.afn(app, task, inputs, context)
+                else:
+                    call = run_in_app(app, step.fn, task, inputs, context)
+                output = await asyncio.wait_for(call, step.timeout)
+                outcome = "completed"
+                return output
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                error = _timeout_error(step)
+            except Exception as e:
+                error = e
+            finally:
+                AGENT_STEP_DURATION.observe(time.perf_counter() - start, step.name, outcome)
+
+            if attempt == step.retries or not _retryable(error):
+                AGENT_STEPS.inc(step.name, "error")
+                raise error
+            AGENT_STEPS.inc(step.name, "retried")
+            await asyncio.sleep(step.backoff(attempt))
@@ -0,0 +1,48 @@
+import hashlib
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+
+from app.models.version_model import get_version
+
+__all__ = ["conditional_get", "CACHE_CONTROL"]
+
+# Responses are per user and change whenever the user writes, so caches may
+# store them but must revalidate (If-None-Match) before every reuse
+CACHE_CONTROL = "private, no-cache"
+
+
+def _etag(scope, version):
+    # The version covers the user's data; the query string picks the representation
+    key = f"{g.user_id}\0{request.path}\0{request.query_string.decode('latin-1')}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest()
+    return f"{scope}.{version}.{digest}"
+
+
+def conditional_get(scope):
+    """
+    ETag / 304 support for a GET handler whose response only depends on the
+    user's `scope` version (see app.models.version_model). The version is read
+    before the handler runs, so a write racing the handler can only make the
+    ETag older than the body, never newer. Apply below @token_required.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not current_app.config.get("ETAGS_ENABLED", True):
+                return f(*args, **kwargs)
+
+            etag = _etag(scope, get_version(g.user_id, scope))
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = CACHE_CONTROL
+            response.vary.add("Authorization")
+            return response
+        return decorated
+    return decorator
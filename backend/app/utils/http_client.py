@@ -0,0 +1,209 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+__all__ = ["PoolStats", "PooledHTTPClient", "AsyncPooledHTTPClient"]
+
+
+class PoolStats:
+    """
+    Thread-safe counters for connection pool usage.
+    - hits: a request reused a kept-alive connection
+    - misses: a new connection (TCP + TLS handshake) had to be opened
+    - waits: every pooled connection was busy, so the request had to wait
+    - retries: requests re-sent after a retryable failure
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "misses": 0, "waits": 0, "retries": 0}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts["hits"] = max(0, counts["requests"] - counts["misses"])
+        return counts
+
+
+def _instrumented_pool(pool_cls, stats):
+    class InstrumentedPool(pool_cls):
+        def _get_conn(self, timeout=None):
+            stats.incr("requests")
+            # The pool queue holds one slot per connection; empty means all are checked out
+            if self.block and self.pool is not None and self.pool.empty():
+                stats.incr("waits")
+            return super()._get_conn(timeout)
+
+        def _new_conn(self):
+            stats.incr("misses")
+            return super()._new_conn()
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_cls.__name__}"
+    return InstrumentedPool
+
+
+class _InstrumentedAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _instrumented_pool(HTTPConnectionPool, self._stats),
+            "https": _instrumented_pool(HTTPSConnectionPool, self._stats),
+        }
+
+
+def _retry_after_seconds(response):
+    """
+    Parse a Retry-After header (delta-seconds or HTTP date). Returns None if absent/invalid.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class PooledHTTPClient:
+    """
+    Shared keep-alive HTTP client: one requests.Session with a bounded
+    connection pool, separate connect/read timeouts, and retries with
+    full-jitter exponential backoff that honour Retry-After on 429/503.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=20.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0, pool_block=True):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = PoolStats()
+
+        self.session = requests.Session()
+        adapter = _InstrumentedAdapter(
+            self.stats,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=pool_block,
+            max_retries=0,  # retries are handled here so we can honour Retry-After
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                retry_after = None
+                if response.status_code in (429, 503):
+                    retry_after = _retry_after_seconds(response)
+                delay = self._backoff(attempt, retry_after)
+                response.close()
+
+            attempt += 1
+            self.stats.incr("retries")
+            time.sleep(delay)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncPooledHTTPClient:
+    """
+    asyncio counterpart of PooledHTTPClient (httpx.AsyncClient) for the ASGI
+    mode: the same pool size, timeouts and retry/backoff rules, but a request
+    waiting on the network holds no thread. `misses` and `waits` are not
+    tracked; httpx does not expose its pool events.
+    """
+
+    RETRY_STATUSES = PooledHTTPClient.RETRY_STATUSES
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=20.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = PoolStats()
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    _backoff = PooledHTTPClient._backoff
+
+    async def request(self, method, url, stream=False, **kwargs):
+        """
+        Send with retries. With stream=True the body is not read; the caller
+        must `await response.aclose()`.
+        """
+        attempt = 0
+        while True:
+            self.stats.incr("requests")
+            try:
+                response = await self.client.send(self.client.build_request(method, url, **kwargs), stream=stream)
+            except (httpx.NetworkError, httpx.RemoteProtocolError, httpx.TimeoutException):
+                # Same cases as requests.ConnectionError/Timeout in PooledHTTPClient
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                retry_after = None
+                if response.status_code in (429, 503):
+                    retry_after = _retry_after_seconds(response)
+                delay = self._backoff(attempt, retry_after)
+                await response.aclose()
+
+            attempt += 1
+            self.stats.incr("retries")
+            await asyncio.sleep(delay)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        await self.client.aclose()
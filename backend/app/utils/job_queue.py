@@ -0,0 +1,482 @@
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from flask import current_app
+from pymongo import ASCENDING, ReturnDocument
+from app.utils.logger import get_logger, log_event
+
+__all__ = [
+    "JOB_STATUSES",
+    "InMemoryJobQueue",
+    "MongoJobQueue",
+    "AgentWorkerPool",
+    "init_job_queue",
+    "get_job_queue",
+    "ensure_workers_started",
+    "start_worker_pool",
+    "heartbeat_interval",
+    "maintain_leases",
+    "job_to_dict",
+    "FINISHED_JOB_TTL_SECONDS",
+]
+
+logger = get_logger(__name__)
+
+# Lifecycle of a queued agent run: queued -> running -> completed | error
+JOB_STATUSES = {"queued", "running", "completed", "error"}
+
+# How long completed / failed jobs stay pollable (GET /jobs/<id>) before they are
+# removed: the in-memory queue prunes them, ai_jobs has a TTL index on finished_at
+FINISHED_JOB_TTL_SECONDS = 24 * 3600
+
+
+def _new_job(task_id, user_id):
+    return {
+        "job_id": str(uuid4()),
+        "task_id": task_id,
+        "user_id": user_id,
+        "status": "queued",
+        "attempts": 0,
+        "result": None,
+        "error": None,
+        "created_at": datetime.utcnow(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+def job_to_dict(job):
+    """
+    Shape a job document for API responses.
+    """
+    def fmt(ts):
+        return ts.strftime("%Y-%m-%d %H:%M:%S") if isinstance(ts, datetime) else None
+
+    result = job.get("result") or {}
+    return {
+        "job_id": job.get("job_id"),
+        "task_id": job.get("task_id"),
+        "status": job.get("status"),
+        "attempts": job.get("attempts", 0),
+        "ai_response": result.get("ai_response"),
+        "steps_completed": result.get("steps_completed", []),
+        "cached": result.get("cached", False),
+        "error": job.get("error"),
+        "createdAt": fmt(job.get("created_at")),
+        "startedAt": fmt(job.get("started_at")),
+        "finishedAt": fmt(job.get("finished_at")),
+    }
+
+
+def _result_discarded(job_id, worker_id):
+    # The worker's lease expired and another worker claimed the job: that run's result wins
+    log_event(logger, logging.WARNING, "job_result_discarded", job_id=job_id, worker_id=worker_id)
+
+
+# -------------------- Queue backends --------------------
+class InMemoryJobQueue:
+    """
+    Process-local queue. Used for tests and single-process development;
+    jobs are lost when the process exits. Jobs have no lease: nothing else
+    can claim a running job, so there is nothing to renew or reap. Finished
+    jobs are dropped `retention_seconds` after they finish.
+    """
+
+    lease_seconds = None
+
+    def __init__(self, retention_seconds=FINISHED_JOB_TTL_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._pending = deque()
+        self._finished = deque()  # (finished_at, job_id), oldest first
+        self._cond = threading.Condition()
+
+    def enqueue(self, task_id, user_id):
+        job = _new_job(task_id, user_id)
+        with self._cond:
+            self._jobs[job["job_id"]] = job
+            self._pending.append(job["job_id"])
+            self._cond.notify()
+        return dict(job)
+
+    def enqueue_many(self, items):
+        """
+        Queue one job per (task_id, user_id); returns the jobs in order.
+        """
+        jobs = [_new_job(task_id, user_id) for task_id, user_id in items]
+        with self._cond:
+            for job in jobs:
+                self._jobs[job["job_id"]] = job
+                self._pending.append(job["job_id"])
+            self._cond.notify_all()
+        return [dict(job) for job in jobs]
+
+    def claim(self, worker_id, timeout=1.0):
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            if not self._pending:
+                return None
+            job = self._jobs[self._pending.popleft()]
+            job.update({
+                "status": "running",
+                "worker_id": worker_id,
+                "started_at": datetime.utcnow(),
+                "attempts": job["attempts"] + 1,
+            })
+            return dict(job)
+
+    def renew(self, job_id, worker_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return bool(job) and job["status"] == "running" and job.get("worker_id") == worker_id
+
+    def reap_expired(self):
+        return []
+
+    def complete(self, job_id, result, worker_id=None):
+        return self._finish(job_id, "completed", worker_id, result=result)
+
+    def fail(self, job_id, error, worker_id=None):
+        return self._finish(job_id, "error", worker_id, error=error)
+
+    def _finish(self, job_id, status, worker_id, result=None, error=None):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or (worker_id is not None and job.get("worker_id") != worker_id):
+                _result_discarded(job_id, worker_id)
+                return False
+            now = datetime.utcnow()
+            job.update({
+                "status": status,
+                "result": result,
+                "error": error,
+                "finished_at": now,
+            })
+            self._finished.append((now, job_id))
+            self._prune(now)
+            return True
+
+    def _prune(self, now):
+        # Caller holds self._cond
+        cutoff = now - timedelta(seconds=self.retention_seconds)
+        while self._finished and self._finished[0][0] < cutoff:
+            _, job_id = self._finished.popleft()
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id, user_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job["user_id"] != user_id:
+                return None
+            return dict(job)
+
+
+class MongoJobQueue:
+    """
+    Queue stored in the `ai_jobs` collection. Workers claim jobs with an
+    atomic find_one_and_update, so any number of worker processes can share it.
+    The worker running a job renews its lease (renew) while the run is in
+    progress; a running job whose lease has expired (e.g. its worker died) is
+    claimed again, up to `max_attempts` claims, after which reap_expired
+    fails it for good. complete/fail only apply while `worker_id` still owns
+    the job, so a worker that lost its lease cannot overwrite the result.
+    """
+
+    def __init__(self, collection_getter, lease_seconds=120, poll_interval=0.5, max_attempts=3):
+        self._collection_getter = collection_getter
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max(1, max_attempts)
+
+    @property
+    def collection(self):
+        # Indexes (incl. the finished_at TTL) are declared in app.models.indexes
+        return self._collection_getter()
+
+    def enqueue(self, task_id, user_id):
+        job = _new_job(task_id, user_id)
+        self.collection.insert_one(dict(job))
+        return job
+
+    def enqueue_many(self, items):
+        jobs = [_new_job(task_id, user_id) for task_id, user_id in items]
+        if jobs:
+            self.collection.insert_many([dict(job) for job in jobs], ordered=False)
+        return jobs
+
+    def claim(self, worker_id, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            now = datetime.utcnow()
+            job = self.collection.find_one_and_update(
+                {"$or": [
+                    {"status": "queued"},
+                    {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$lt": self.max_attempts}},
+                ]},
+                {
+                    "$set": {
+                        "status": "running",
+                        "worker_id": worker_id,
+                        "started_at": now,
+                        "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("created_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if job:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(self.poll_interval, remaining))
+
+    def renew(self, job_id, worker_id):
+        """
+        Extend the lease of a job `worker_id` is running; False if it lost it.
+        """
+        result = self.collection.update_one(
+            {"job_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+        )
+        return result.matched_count > 0
+
+    def reap_expired(self):
+        """
+        Fail running jobs whose lease expired after their last allowed
+        attempt (dead-lettered). Returns the jobs failed.
+        """
+        reaped = []
+        while True:
+            now = datetime.utcnow()
+            job = self.collection.find_one_and_update(
+                {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+                {"$set": {
+                    "status": "error",
+                    "error": f"Gave up after {self.max_attempts} attempts (lease expired)",
+                    "finished_at": now,
+                    "dead_lettered": True,
+                }, "$unset": {"lease_expires_at": ""}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                return reaped
+            reaped.append(job)
+
+    def complete(self, job_id, result, worker_id=None):
+        return self._finish(job_id, "completed", worker_id, result=result)
+
+    def fail(self, job_id, error, worker_id=None):
+        return self._finish(job_id, "error", worker_id, error=error)
+
+    def _finish(self, job_id, status, worker_id, result=None, error=None):
+        query = {"job_id": job_id}
+        if worker_id is not None:
+            query.update(worker_id=worker_id, status="running")
+        outcome = self.collection.update_one(
+            query,
+            {"$set": {
+                "status": status,
+                "result": result,
+                "error": error,
+                "finished_at": datetime.utcnow(),
+            }, "$unset": {"lease_expires_at": ""}}
+        )
+        if not outcome.matched_count:
+            _result_discarded(job_id, worker_id)
+        return outcome.matched_count > 0
+
+    def get(self, job_id, user_id):
+        return self.collection.find_one({"job_id": job_id, "user_id": user_id}, {"_id": 0})
+
+
+# -------------------- Worker pool --------------------
+def heartbeat_interval(queue):
+    """
+    Seconds between lease renewals for `queue`, None if its jobs have no lease.
+    """
+    return queue.lease_seconds / 3 if queue.lease_seconds else None
+
+
+def maintain_leases(queue, active):
+    """
+    One heartbeat of a worker: renew the lease of every job it is running
+    (`active`: {job_id: worker_id}) and mark the tasks of dead-lettered jobs
+    as errored. Needs an app context.
+    """
+    from app.models.task_model import set_task_status
+
+    for job_id, worker_id in list(active.items()):
+        if not queue.renew(job_id, worker_id):
+            log_event(logger, logging.WARNING, "job_lease_lost", job_id=job_id, worker_id=worker_id)
+    for job in queue.reap_expired():
+        log_event(logger, logging.ERROR, "job_dead_lettered", job_id=job["job_id"], task_id=job["task_id"],
+                  attempts=job.get("attempts"))
+        set_task_status(job["task_id"], job["user_id"], "error")
+
+
+class AgentWorkerPool:
+    """
+    Fixed-size pool of threads draining a job queue and running the agent loop.
+    A heartbeat thread renews the leases of the jobs being run.
+    """
+
+    def __init__(self, app, queue, concurrency=4, poll_timeout=1.0):
+        self.app = app
+        self.queue = queue
+        self.concurrency = max(1, int(concurrency))
+        self.poll_timeout = poll_timeout
+        # Worker ids must be unique across processes: they own leased jobs
+        self.pool_id = uuid4().hex[:8]
+        self._stop = threading.Event()
+        self._threads = []
+        self._active = {}  # job_id -> worker_id of the jobs being run
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._worker_loop, args=(f"worker-{self.pool_id}-{i}",), daemon=True)
+            for i in range(self.concurrency)
+        ]
+        if heartbeat_interval(self.queue):
+            self._threads.append(threading.Thread(target=self._heartbeat_loop, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        log_event(logger, logging.INFO, "agent_worker_started", mode="threads", concurrency=self.concurrency)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def join(self):
+        try:
+            while self.running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _worker_loop(self, worker_id):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    job = self.queue.claim(worker_id, timeout=self.poll_timeout)
+                except Exception as e:
+                    log_event(logger, logging.WARNING, "job_claim_failed", worker_id=worker_id, error=str(e))
+                    time.sleep(self.poll_timeout)
+                    continue
+                if job:
+                    self._active[job["job_id"]] = worker_id
+                    try:
+                        self._run_job(job, worker_id)
+                    finally:
+                        self._active.pop(job["job_id"], None)
+
+    def _heartbeat_loop(self):
+        with self.app.app_context():
+            while not self._stop.wait(heartbeat_interval(self.queue)):
+                try:
+                    maintain_leases(self.queue, self._active)
+                except Exception as e:
+                    log_event(logger, logging.WARNING, "job_heartbeat_failed", error=str(e))
+
+    def _run_job(self, job, worker_id):
+        # Imported here to avoid a circular import at app start-up
+        from app.models.task_model import set_task_status
+        from app.utils.langchain_tools import run_agent_for_task
+
+        job_id, task_id, user_id = job["job_id"], job["task_id"], job["user_id"]
+        try:
+            set_task_status(task_id, user_id, "running", last_run=datetime.utcnow())
+            context = run_agent_for_task(task_id, user_id)
+
+            if context.get("error"):
+                self.queue.fail(job_id, context["error"], worker_id)
+                return
+
+            self.queue.complete(job_id, {
+                "ai_response": context.get("results"),
+                "steps_completed": context.get("steps_completed"),
+                "cached": context.get("cached", False),
+            }, worker_id)
+            log_event(logger, logging.INFO, "agent_job_completed", job_id=job_id, task_id=task_id, user_id=user_id,
+                      steps_completed=context.get("steps_completed"))
+
+        except Exception as e:
+            log_event(logger, logging.ERROR, "agent_job_failed", job_id=job_id, task_id=task_id, error=str(e))
+            try:
+                set_task_status(task_id, user_id, "error")
+            finally:
+                self.queue.fail(job_id, str(e), worker_id)
+
+
+# -------------------- App wiring --------------------
+def init_job_queue(app):
+    """
+    Select the queue backend from config (AI_JOB_BACKEND = "mongo" | "memory").
+    """
+    backend = app.config.get("AI_JOB_BACKEND", "mongo")
+    if backend == "memory":
+        queue = InMemoryJobQueue()
+    elif backend == "mongo":
+        from app import mongo
+        queue = MongoJobQueue(
+            lambda: mongo.db.ai_jobs,
+            lease_seconds=app.config.get("AI_JOB_LEASE_SECONDS", 120),
+            poll_interval=app.config.get("AI_WORKER_POLL_INTERVAL", 0.5),
+            max_attempts=app.config.get("AI_JOB_MAX_ATTEMPTS", 3),
+        )
+    else:
+        raise ValueError(f"Unknown AI_JOB_BACKEND: {backend}")
+
+    app.extensions["ai_job_queue"] = queue
+    app.extensions["ai_worker_pool"] = None
+    return queue
+
+
+def get_job_queue():
+    return current_app.extensions["ai_job_queue"]
+
+
+def start_worker_pool(app, concurrency=None):
+    pool = app.extensions.get("ai_worker_pool")
+    if pool is None:
+        pool = AgentWorkerPool(
+            app,
+            app.extensions["ai_job_queue"],
+            concurrency=concurrency or app.config.get("AI_WORKER_CONCURRENCY", 4),
+        )
+        app.extensions["ai_worker_pool"] = pool
+    return pool.start()
+
+
+_start_lock = threading.Lock()
+
+
+def ensure_workers_started():
+    """
+    Lazily start in-process workers on first enqueue (when AI_WORKERS_IN_PROCESS
+    is set). Starting lazily keeps CLI commands and the debug reloader's parent
+    process from spawning workers.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get("AI_WORKERS_IN_PROCESS", True):
+        return
+    pool = app.extensions.get("ai_worker_pool")
+    if pool is not None and pool.running:
+        return
+    with _start_lock:
+        start_worker_pool(app)
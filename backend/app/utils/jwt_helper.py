@@ -1,9 +1,131 @@
 import jwt
 import datetime
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
 from flask import current_app, request, jsonify, g
 from functools import wraps
+from pymongo.errors import PyMongoError
+from app.utils.logger import get_logger, log_event
+from app.utils.metrics import JWT_DECODE_DURATION
 
-__all__ = ["generate_jwt_token", "token_required"]
+__all__ = ["generate_jwt_token", "token_required", "revoke_token", "VerifiedTokenCache"]
+
+logger = get_logger(__name__)
+
+
+# 🗃️ Cache of already-verified tokens
+class VerifiedTokenCache:
+    """
+    Bounded LRU of verified token payloads keyed by the token's SHA-256 digest.
+    An entry lives until the token's `exp` or `ttl` seconds, whichever is first;
+    the ttl bounds how long a revocation made in another process goes unnoticed.
+    Revoked digests are remembered (until the token would have expired anyway).
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # digest -> (payload, valid_until)
+        self._revoked = {}  # digest -> exp
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, digest, payload):
+        valid_until = min(payload.get("exp", 0), time.time() + self.ttl)
+        with self._lock:
+            self._entries[digest] = (payload, valid_until)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def revoke(self, digest, exp):
+        now = time.time()
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._revoked[digest] = exp
+            # Forget revocations for tokens that have expired on their own
+            for old in [d for d, e in self._revoked.items() if e <= now]:
+                del self._revoked[old]
+
+    def is_revoked(self, digest):
+        with self._lock:
+            return digest in self._revoked
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _get_token_cache():
+    cache = current_app.extensions.get("jwt_token_cache")
+    if cache is None:
+        cache = current_app.extensions.setdefault("jwt_token_cache", VerifiedTokenCache(
+            max_entries=current_app.config.get("JWT_CACHE_SIZE", 10000),
+            ttl=current_app.config.get("JWT_CACHE_TTL", 60),
+        ))
+    return cache
+
+
+def _revoked_collection():
+    # Shared revocation list so a logout is seen by every process
+    if current_app.config.get("JWT_REVOCATION_BACKEND", "mongo") != "mongo":
+        return None
+    from app import mongo
+    return mongo.db.revoked_tokens
+
+
+def _is_revoked(digest):
+    if _get_token_cache().is_revoked(digest):
+        return True
+    collection = _revoked_collection()
+    if collection is None:
+        return False
+    try:
+        return collection.find_one({"_id": digest}, {"_id": 1}) is not None
+    except PyMongoError as e:
+        log_event(logger, logging.WARNING, "revocation_check_failed", error=str(e))
+        return False
+
+
+def revoke_token(token: str) -> None:
+    """
+    Revoke a token before its natural expiry (e.g. on logout).
+    """
+    secret = current_app.config.get("JWT_SECRET", "default_secret_key")
+    decoded = jwt.decode(token, secret, algorithms=["HS256"])
+    digest = token_digest(token)
+    exp = decoded.get("exp", time.time())
+
+    _get_token_cache().revoke(digest, exp)
+    collection = _revoked_collection()
+    if collection is not None:
+        collection.update_one(
+            {"_id": digest},
+            {"$set": {"expires_at": datetime.datetime.utcfromtimestamp(exp)}},
+            upsert=True,
+        )
+    log_event(logger, logging.INFO, "token_revoked", user_id=decoded.get("user_id"))
 
 
 # 🔐 Generate JWT Token
@@ -20,51 +142,70 @@ def generate_jwt_token(user_id: str) -> str:
     }
 
     secret = current_app.config.get("JWT_SECRET", "default_secret_key")
-    print(f"🔐 [generate_jwt_token] Using JWT_SECRET: {secret}")
-
     token = jwt.encode(payload, secret, algorithm="HS256")
+    log_event(logger, logging.DEBUG, "token_issued", user_id=user_id)
     return token
 
 
+def _timed_decode(token, secret):
+    start, outcome = time.perf_counter(), "invalid"
+    try:
+        decoded = jwt.decode(token, secret, algorithms=["HS256"])
+        outcome = "ok"
+        return decoded
+    finally:
+        JWT_DECODE_DURATION.observe(time.perf_counter() - start, outcome)
+
+
+def _unauthorized(message, reason):
+    log_event(logger, logging.INFO, "auth_rejected", reason=reason, path=request.path)
+    return jsonify({"error": message}), 401
+
+
 # 🔒 Token Verification Decorator
 def token_required(f):
     """
     Decorator to protect routes with JWT authentication.
     Requires 'Authorization: Bearer <token>' in the request headers.
+    Verified tokens are cached (JWT_CACHE_ENABLED), so repeat requests skip jwt.decode.
     """
     @wraps(f)
     def decorated(*args, **kwargs):
-        secret = current_app.config.get("JWT_SECRET", "default_secret_key")
-
         # Check for Authorization header
         auth_header = request.headers.get("Authorization", "")
         if not auth_header or not auth_header.startswith("Bearer "):
-            print("❌ Missing or malformed Authorization header")
-            return jsonify({"error": "Authorization header must start with 'Bearer'"}), 401
+            return _unauthorized("Authorization header must start with 'Bearer'", "missing_header")
 
         token = auth_header.split("Bearer ")[1].strip()
+        digest = token_digest(token)
+        use_cache = current_app.config.get("JWT_CACHE_ENABLED", True)
+
+        decoded = _get_token_cache().get(digest) if use_cache else None
+        if decoded is None:
+            secret = current_app.config.get("JWT_SECRET", "default_secret_key")
+            try:
+                decoded = _timed_decode(token, secret)
 
-        try:
-            print(f"🔑 [token_required] Using JWT_SECRET: {secret}")
-            print(f"🪪 Received Token: {token}")
+            except jwt.ExpiredSignatureError:
+                return _unauthorized("Token has expired", "expired")
 
-            decoded = jwt.decode(token, secret, algorithms=["HS256"])
-            print(f"✅ Token Decoded: {decoded}")
+            except jwt.InvalidTokenError as e:
+                log_event(logger, logging.DEBUG, "invalid_token", error=str(e))
+                return _unauthorized("Invalid token", "invalid")
 
-            # Save user_id for use in routes
-            g.user_id = decoded.get("user_id")
+            except Exception as e:
+                log_event(logger, logging.ERROR, "token_verification_failed", error=str(e))
+                return jsonify({"error": f"Token verification failed: {str(e)}"}), 401
 
-        except jwt.ExpiredSignatureError:
-            print("❌ Token has expired")
-            return jsonify({"error": "Token has expired"}), 401
+            if _is_revoked(digest):
+                return _unauthorized("Token has been revoked", "revoked")
 
-        except jwt.InvalidTokenError as e:
-            print(f"❌ Invalid token: {str(e)}")
-            return jsonify({"error": "Invalid token"}), 401
+            if use_cache:
+                _get_token_cache().put(digest, decoded)
 
-        except Exception as e:
-            print(f"❌ Unexpected error during token verification: {str(e)}")
-            return jsonify({"error": f"Token verification failed: {str(e)}"}), 401
+        # Save user_id for use in routes
+        g.user_id = decoded.get("user_id")
+        g.token = token
 
         return f(*args, **kwargs)
     return decorated
@@ -1,21 +1,167 @@
-import os
-import requests
-from datetime import datetime
-from dotenv import load_dotenv
+import asyncio
+import functools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
 from langchain.prompts import PromptTemplate
+from flask import current_app
 from app import mongo
+from app.models.task_model import set_task_status, save_task_checkpoint
+from app.models.log_model import write_logs
+from app.repositories import get_repositories
+from app.utils.agent_pipeline import Pipeline, Step, run_in_app
 from pymongo.errors import PyMongoError
+from app.utils.http_client import AsyncPooledHTTPClient, PooledHTTPClient
+from app.utils.logger import get_logger, log_event
+from app.utils.llm_guard import AdaptiveLimiter, CircuitBreaker, LLMGuard, LLMUnavailable
+from app.utils.micro_batch import MicroBatcher
+from app.utils.prompt_budget import count_tokens, fit_to_budget
+from app.utils.response_cache import ResponseCache, make_cache_key
+from app.utils.scheduler import schedule_task_run
+from app.utils.metrics import (
+    AGENT_RUNS, AGENT_RUNS_IN_FLIGHT, AI_PROMPT_TRIMMED, LLM_MICROBATCH, LLM_REQUEST_DURATION,
+    record_llm_usage, track_in_flight,
+)
 
-load_dotenv()
+logger = get_logger(__name__)
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
-GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME")  # For reference only
+# Settings (GEMINI_*, AI_CACHE_*, AI_MICROBATCH_*, LLM_*, AI_PROMPT_*, AGENT_LLM_STEP_*)
+# are read from app.config, see create_app; init_gemini and init_agent_pipelines
+# build the shared clients and the pipelines from them.
+
+_token_usage_lock = threading.Lock()
+
+def _http_options(config) -> dict:
+    return {
+        "connect_timeout": config["GEMINI_CONNECT_TIMEOUT"],
+        "read_timeout": config["GEMINI_READ_TIMEOUT"],
+        "max_retries": config["GEMINI_MAX_RETRIES"],
+        "backoff_base": config["GEMINI_BACKOFF_BASE"],
+        "backoff_max": config["GEMINI_BACKOFF_MAX"],
+    }
+
+def init_gemini(app):
+    """
+    Build the keep-alive Gemini client, LLM guard, response cache and
+    micro-batcher from app.config, shared by every Gemini call of the app
+    (threads and the ASGI event loop alike). The asyncio client is created
+    on first use, on the server's event loop.
+    """
+    config = app.config
+    # The shared cache tier needs MongoDB, which the in-memory storage engine does without
+    mongo_tier = config["AI_CACHE_MONGO"] and config["STORAGE_BACKEND"] == "mongo"
+    gemini = {
+        "http_client": PooledHTTPClient(pool_size=config["GEMINI_POOL_SIZE"], **_http_options(config)),
+        "async_http_client": None,
+        "llm_guard": LLMGuard(
+            AdaptiveLimiter(
+                initial=config["LLM_CONCURRENCY_INITIAL"],
+                min_limit=config["LLM_CONCURRENCY_MIN"],
+                max_limit=config["LLM_CONCURRENCY_MAX"],
+                latency_target=config["LLM_LATENCY_TARGET_SECONDS"],
+                max_queue=config["LLM_QUEUE_MAX"],
+            ),
+            CircuitBreaker(
+                window=config["LLM_BREAKER_WINDOW"],
+                min_calls=config["LLM_BREAKER_MIN_CALLS"],
+                failure_rate=config["LLM_BREAKER_FAILURE_RATE"],
+                cooldown=config["LLM_BREAKER_COOLDOWN_SECONDS"],
+            ),
+            queue_timeout=config["LLM_QUEUE_TIMEOUT_SECONDS"],
+        ),
+        "response_cache": ResponseCache(
+            max_entries=config["AI_CACHE_MAX_ENTRIES"],
+            ttl_seconds=config["AI_CACHE_TTL_SECONDS"],
+            collection_getter=(lambda: mongo.db.ai_response_cache) if mongo_tier else None,
+        ),
+        "micro_batcher": MicroBatcher(
+            functools.partial(_send_gemini_batch, app),
+            max_items=config["AI_MICROBATCH_MAX_PROMPTS"],
+            max_weight=config["AI_MICROBATCH_MAX_TOKENS"],
+            window=config["AI_MICROBATCH_WINDOW_MS"] / 1000,
+            max_in_flight=config["GEMINI_POOL_SIZE"],
+            name="gemini-batch",
+        ),
+    }
+    app.extensions["gemini"] = gemini
+    return gemini
+
+def _gemini(app=None) -> dict:
+    return (app or current_app).extensions["gemini"]
+
+def get_http_client(app=None) -> PooledHTTPClient:
+    """
+    Shared keep-alive client for all Gemini calls.
+    """
+    return _gemini(app)["http_client"]
+
+def get_async_http_client(app=None) -> AsyncPooledHTTPClient:
+    """
+    Shared asyncio client for Gemini calls in ASGI mode. Only used from the
+    server's event loop, so no lock is needed.
+    """
+    app = app or current_app
+    gemini = _gemini(app)
+    if gemini["async_http_client"] is None:
+        gemini["async_http_client"] = AsyncPooledHTTPClient(
+            pool_size=app.config["GEMINI_ASYNC_POOL_SIZE"], **_http_options(app.config)
+        )
+    return gemini["async_http_client"]
+
+async def close_async_http_client(app):
+    gemini = _gemini(app)
+    if gemini["async_http_client"] is not None:
+        client, gemini["async_http_client"] = gemini["async_http_client"], None
+        await client.close()
+
+def get_llm_guard(app=None) -> LLMGuard:
+    """
+    Limiter + circuit breaker shared by every Gemini call.
+    """
+    return _gemini(app)["llm_guard"]
+
+def get_micro_batcher(app=None) -> MicroBatcher:
+    return _gemini(app)["micro_batcher"]
+
+def get_response_cache(app=None) -> ResponseCache:
+    """
+    Shared cache of Gemini responses keyed by (model, normalised prompt).
+    """
+    return _gemini(app)["response_cache"]
+
+def response_cache_key(prompt: str, app=None) -> str:
+    config = (app or current_app).config
+    return make_cache_key(prompt, config["GEMINI_MODEL_NAME"] or config["GEMINI_API_ENDPOINT"])
+
+def get_cached_gemini_response(prompt: str, use_cache: bool = True, user_id: str | None = None,
+                               usage: dict | None = None) -> tuple[str | None, bool]:
+    """
+    get_gemini_response with the prompt cache in front of it (a cache hit
+    never waits on the LLM guard) and micro-batching behind it. Returns
+    (response, served_from_cache); `usage` gets the tokens of a call made.
+    """
+    if not (current_app.config["AI_CACHE_ENABLED"] and use_cache):
+        return get_batched_gemini_response(prompt, user_id, usage), False
+
+    cache = get_response_cache()
+    key = response_cache_key(prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, True
+
+    response = get_batched_gemini_response(prompt, user_id, usage)
+    if response:
+        cache.set(key, response)
+    return response, False
 
 def test_gemini_api():
     headers = {
         "Content-Type": "application/json",
-        "X-goog-api-key": GEMINI_API_KEY,
+        "X-goog-api-key": current_app.config["GEMINI_API_KEY"],
     }
     payload = {
         "contents": [
@@ -27,20 +173,23 @@ def test_gemini_api():
         ]
     }
 
-    response = requests.post(GEMINI_API_ENDPOINT, headers=headers, json=payload)
+    response = get_http_client().post(current_app.config["GEMINI_API_ENDPOINT"], headers=headers, json=payload)
     if response.status_code == 200:
         data = response.json()
         try:
-            print(data["candidates"][0]["content"])
+            log_event(logger, logging.INFO, "gemini_test_response", content=data["candidates"][0]["content"])
         except (KeyError, IndexError):
-            print("Unexpected Gemini API response structure:", data)
+            log_event(logger, logging.ERROR, "gemini_unexpected_response", keys=sorted(data))
     else:
-        print(f"Gemini API error {response.status_code}: {response.text}")
+        log_event(logger, logging.ERROR, "gemini_api_error", status=response.status_code, body=response.text[:500])
 
-def get_gemini_response(prompt: str) -> str | None:
+def gemini_request(prompt: str, app=None) -> tuple[dict, dict]:
+    """
+    Headers and payload of a generateContent call (shared by the sync and async clients).
+    """
     headers = {
         "Content-Type": "application/json",
-        "X-goog-api-key": GEMINI_API_KEY,
+        "X-goog-api-key": (app or current_app).config["GEMINI_API_KEY"],
     }
     payload = {
         "contents": [
@@ -51,114 +200,797 @@ def get_gemini_response(prompt: str) -> str | None:
             }
         ]
     }
+    return headers, payload
 
-    try:
-        response = requests.post(GEMINI_API_ENDPOINT, headers=headers, json=payload, timeout=20)
-        if response.status_code != 200:
-            print(f"Gemini API error {response.status_code}: {response.text}")
+def gemini_response_text(data: dict) -> str:
+    record_llm_usage(data)
+    return data["candidates"][0]["content"]["parts"][0]["text"].strip()
+
+def gemini_stream_frame(line: str) -> tuple[dict | None, list[str]]:
+    """
+    Parse one line of an alt=sse stream. Returns (frame, texts); frame is
+    None for lines that are not "data: {...}".
+    """
+    # SSE frames: "data: {...}"; blank lines separate events
+    if not line or not line.startswith("data:"):
+        return None, []
+    data = json.loads(line[len("data:"):].strip())
+    texts = []
+    for candidate in data.get("candidates", [])[:1]:
+        for part in candidate.get("content", {}).get("parts", []):
+            if part.get("text"):
+                texts.append(part["text"])
+    return data, texts
+
+def gemini_status_outcome(status_code: int) -> str:
+    """
+    How a non-200 answer counts for the LLM guard: throttling and server
+    errors are backend trouble; other 4xx are problems with our request.
+    """
+    if status_code == 429 or status_code >= 500:
+        return "error"
+    return "ignored"
+
+def token_usage(data: dict | None, prompt: str, text: str) -> dict:
+    """
+    Tokens of one call: Gemini's usageMetadata, or local counts if it sent none.
+    """
+    usage = (data or {}).get("usageMetadata") or {}
+    if usage.get("promptTokenCount") is not None:
+        return {"prompt": usage["promptTokenCount"], "completion": usage.get("candidatesTokenCount", 0),
+                "estimated": False}
+    return {"prompt": count_tokens(prompt), "completion": count_tokens(text), "estimated": True}
+
+def _gemini_call(headers: dict, payload: dict, user_id: str | None, parse):
+    """
+    One generateContent call through the LLM guard; returns parse(body).
+    None if the call failed; raises LLMUnavailable if it was not made
+    (circuit open or no slot).
+    """
+    with get_llm_guard().slot(user_id) as permit:
+        start, outcome = time.perf_counter(), "error"
+        try:
+            response = get_http_client().post(current_app.config["GEMINI_API_ENDPOINT"], headers=headers, json=payload)
+            if response.status_code != 200:
+                permit.outcome = gemini_status_outcome(response.status_code)
+                log_event(logger, logging.WARNING, "gemini_api_error",
+                          status=response.status_code, body=response.text[:500])
+                return None
+
+            result = parse(response.json())
+            outcome = permit.outcome = "ok"
+            return result
+        except Exception as e:
+            log_event(logger, logging.WARNING, "gemini_call_failed", error=repr(e))
             return None
+        finally:
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, "json", outcome)
 
-        data = response.json()
-        print("Gemini API full response:", data)
-        return data["candidates"][0]["content"]["parts"][0]["text"].strip()
-    except Exception as e:
-        print(f"Exception during Gemini API call: {e}")
-        return None
+def get_gemini_response(prompt: str, user_id: str | None = None, usage: dict | None = None) -> str | None:
+    """
+    One generateContent call through the LLM guard. Returns None if the call
+    failed; raises LLMUnavailable if it was not made (circuit open or no slot).
+    `usage`, if given, is filled with the call's token counts.
+    """
+    def parse(data):
+        text = gemini_response_text(data)
+        if usage is not None:
+            usage.update(token_usage(data, prompt, text))
+        return text
 
-def run_agent_for_task(task_id: str, user_id: str) -> dict:
+    headers, payload = gemini_request(prompt)
+    return _gemini_call(headers, payload, user_id, parse)
+
+# -------------------- Micro-batching --------------------
+# Several small prompts of one user go out as one request: an instruction part,
+# then one part per prompt headed by its marker line. The answer is split back
+# on the markers; a prompt whose answer is missing is sent again on its own.
+
+BATCH_INSTRUCTION = (
+    "The following {count} requests are independent. Answer each one separately and in order. "
+    "Start each answer with the marker line of its request, exactly as given (e.g. [[TASK 1]]), "
+    "and write nothing before the first marker."
+)
+BATCH_MARKER = "[[TASK {number}]]"
+_BATCH_MARKER_LINE = re.compile(r"^[\s*#>_]*\[\[TASK (\d+)\]\][\s*_:]*$", re.MULTILINE)
+
+def gemini_batch_request(prompts: list[str]) -> tuple[dict, dict]:
     """
-    Agentic AI loop for a task:
-    - Multi-step: analyze, call Gemini, post-process, finalize
-    - Updates task status & logs in MongoDB
-    Returns dict with results or error info.
+    Headers and payload of a multi-part generateContent call for several prompts.
+    """
+    headers, payload = gemini_request(BATCH_INSTRUCTION.format(count=len(prompts)))
+    payload["contents"][0]["parts"] += [
+        {"text": BATCH_MARKER.format(number=number) + "\n" + prompt}
+        for number, prompt in enumerate(prompts, 1)
+    ]
+    return headers, payload
+
+def split_batch_answers(text: str, count: int) -> list[str | None]:
+    """
+    The answer to each of `count` batched prompts, None where it is missing.
+    """
+    answers = [None] * count
+    pieces = _BATCH_MARKER_LINE.split(text or "")
+    # pieces: [before the first marker, number, answer, number, answer, ...]
+    for number, answer in zip(pieces[1::2], pieces[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count and answers[index] is None and answer.strip():
+            answers[index] = answer.strip()
+    return answers
+
+def _share(total: int, weights: list[int], index: int) -> int:
+    return round(total * weights[index] / sum(weights)) if sum(weights) else 0
+
+def get_gemini_batch_response(prompts: list[str], user_id: str | None = None) -> list[tuple[str, dict] | None]:
+    """
+    Several prompts in one multi-part call. Returns (answer, usage) per
+    prompt, or None for prompts that got no answer (the call failed, or the
+    answer could not be split out). The call's tokens are shared out in
+    proportion to each prompt's and answer's local token count.
     """
-    context = {
+    def parse(data):
+        text = gemini_response_text(data)
+        answers = split_batch_answers(text, len(prompts))
+        total = token_usage(data, "\n".join(prompts), text)
+        prompt_weights = [count_tokens(prompt) if answer else 0 for prompt, answer in zip(prompts, answers)]
+        answer_weights = [count_tokens(answer) if answer else 0 for answer in answers]
+        return [
+            (answer, {
+                "prompt": _share(total["prompt"], prompt_weights, i),
+                "completion": _share(total["completion"], answer_weights, i),
+                "estimated": total["estimated"],
+                "batched": True,
+            }) if answer else None
+            for i, answer in enumerate(answers)
+        ]
+
+    headers, payload = gemini_batch_request(prompts)
+    return _gemini_call(headers, payload, user_id, parse) or [None] * len(prompts)
+
+def _send_gemini_batch(app, user_id: str | None, prompts: list[str]) -> list[tuple[str, dict] | None]:
+    # MicroBatcher.send (on the batcher's threads): a prompt that found no
+    # company goes out on its own, unwrapped
+    if len(prompts) == 1:
+        return [None]
+    with app.app_context():
+        return get_gemini_batch_response(prompts, user_id)
+
+def get_batched_gemini_response(prompt: str, user_id: str | None = None, usage: dict | None = None) -> str | None:
+    """
+    get_gemini_response, sent in one request with other small prompts of the
+    same user when micro-batching is on (AI_MICROBATCH_ENABLED).
+    """
+    config = current_app.config
+    if config["AI_MICROBATCH_ENABLED"]:
+        tokens = count_tokens(prompt)
+        if tokens <= config["AI_MICROBATCH_MAX_PROMPT_TOKENS"]:
+            result = get_micro_batcher().submit(prompt, key=user_id, weight=tokens).result()
+            if result is not None:
+                LLM_MICROBATCH.inc("batched")
+                response, batch_usage = result
+                if usage is not None:
+                    usage.update(batch_usage)
+                return response
+            LLM_MICROBATCH.inc("single")
+    return get_gemini_response(prompt, user_id, usage)
+
+async def aget_gemini_response(app, prompt: str, user_id: str | None = None,
+                               usage: dict | None = None) -> str | None:
+    """
+    get_gemini_response on the asyncio client (ASGI mode).
+    """
+    headers, payload = gemini_request(prompt, app)
+
+    async with get_llm_guard(app).aslot(user_id) as permit:
+        start, outcome = time.perf_counter(), "error"
+        try:
+            response = await get_async_http_client(app).post(
+                app.config["GEMINI_API_ENDPOINT"], headers=headers, json=payload
+            )
+            if response.status_code != 200:
+                permit.outcome = gemini_status_outcome(response.status_code)
+                log_event(logger, logging.WARNING, "gemini_api_error",
+                          status=response.status_code, body=response.text[:500])
+                return None
+
+            data = response.json()
+            text = gemini_response_text(data)
+            if usage is not None:
+                usage.update(token_usage(data, prompt, text))
+            outcome = permit.outcome = "ok"
+            return text
+        except Exception as e:
+            log_event(logger, logging.WARNING, "gemini_call_failed", error=repr(e))
+            return None
+        finally:
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, "json", outcome)
+
+def get_stream_endpoint(app=None) -> str:
+    config = (app or current_app).config
+    if config["GEMINI_STREAM_ENDPOINT"]:
+        return config["GEMINI_STREAM_ENDPOINT"]
+    endpoint = config["GEMINI_API_ENDPOINT"].replace(":generateContent", ":streamGenerateContent")
+    return endpoint + ("&" if "?" in endpoint else "?") + "alt=sse"
+
+def stream_gemini_response(prompt: str, user_id: str | None = None, tokens: dict | None = None):
+    """
+    Yield text chunks as Gemini generates them (streamGenerateContent with
+    alt=sse). Raises on HTTP errors or a malformed stream, and LLMUnavailable
+    if the LLM guard refuses the call. The guard slot is held until the
+    stream ends; its latency is the time to the response headers. `tokens`,
+    if given, is filled with the call's token counts once the stream ends.
+    """
+    headers, payload = gemini_request(prompt)
+
+    with get_llm_guard().slot(user_id) as permit:
+        start, outcome, usage, chunks = time.perf_counter(), "error", None, []
+        response = get_http_client().post(get_stream_endpoint(), headers=headers, json=payload, stream=True)
+        try:
+            if response.status_code != 200:
+                permit.outcome = gemini_status_outcome(response.status_code)
+                raise Exception(f"Gemini API error {response.status_code}: {response.text}")
+            permit.done("ok")
+
+            # Byte lines: text/event-stream comes without a charset, and
+            # requests would decode it as ISO-8859-1
+            for line in response.iter_lines():
+                data, texts = gemini_stream_frame(line.decode("utf-8"))
+                # usageMetadata is cumulative; the last frame carries the totals
+                if data and "usageMetadata" in data:
+                    usage = data
+                chunks += texts
+                yield from texts
+            outcome = "ok"
+        finally:
+            response.close()
+            if usage:
+                record_llm_usage(usage)
+            if tokens is not None and outcome == "ok":
+                tokens.update(token_usage(usage, prompt, "".join(chunks)))
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, "stream", outcome)
+
+async def astream_gemini_response(app, prompt: str, user_id: str | None = None, tokens: dict | None = None):
+    """
+    stream_gemini_response on the asyncio client (ASGI mode).
+    """
+    headers, payload = gemini_request(prompt, app)
+
+    async with get_llm_guard(app).aslot(user_id) as permit:
+        start, outcome, usage, chunks = time.perf_counter(), "error", None, []
+        response = await get_async_http_client(app).post(
+            get_stream_endpoint(app), headers=headers, json=payload, stream=True
+        )
+        try:
+            if response.status_code != 200:
+                permit.outcome = gemini_status_outcome(response.status_code)
+                await response.aread()
+                raise Exception(f"Gemini API error {response.status_code}: {response.text}")
+            permit.done("ok")
+
+            async for line in response.aiter_lines():
+                data, texts = gemini_stream_frame(line)
+                if data and "usageMetadata" in data:
+                    usage = data
+                chunks += texts
+                for text in texts:
+                    yield text
+            outcome = "ok"
+        finally:
+            await response.aclose()
+            if usage:
+                record_llm_usage(usage)
+            if tokens is not None and outcome == "ok":
+                tokens.update(token_usage(usage, prompt, "".join(chunks)))
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, "stream", outcome)
+
+def new_agent_context(task_id: str, user_id: str) -> dict:
+    return {
         "task_id": task_id,
         "user_id": user_id,
         "results": None,
         "error": None,
         "steps_completed": [],
+        "resumed_steps": [],
+        "cached": False,
+        "checkpoint": None,
+        "deferred_until": None,
+        # Gemini tokens this run spent (logged with the result)
+        "tokens": {"prompt": 0, "completion": 0, "calls": 0, "estimated": False, "batched": False,
+                   "trimmed": False},
+    }
+
+def add_token_usage(context: dict, usage: dict) -> None:
+    """
+    Add one Gemini call's token counts (see token_usage) to the run's total.
+    """
+    if not usage:
+        return
+    with _token_usage_lock:  # steps of one wave run concurrently
+        tokens = context["tokens"]
+        tokens["prompt"] += usage.get("prompt", 0)
+        tokens["completion"] += usage.get("completion", 0)
+        tokens["calls"] += 1
+        tokens["estimated"] = tokens["estimated"] or usage.get("estimated", False)
+        tokens["batched"] = tokens["batched"] or usage.get("batched", False)
+
+PROMPT_HEADER = (
+    "You are a professional support agent.\n"
+    "Task title: {title}\n"
+    "Description: {description}\n"
+)
+
+DEFAULT_INSTRUCTION = "Please provide a concise, professional response."
+
+def fit_task_prompt(task: dict, instruction: str = DEFAULT_INSTRUCTION, app=None) -> tuple[str, bool]:
+    """
+    The task prompt within AI_PROMPT_MAX_TOKENS: the title is capped at
+    AI_PROMPT_TITLE_MAX_TOKENS and the description gets the tokens the rest
+    of the prompt leaves. Returns (prompt, shortened).
+    """
+    config = (app or current_app).config
+    overflow = config["AI_PROMPT_OVERFLOW"]
+    template = PROMPT_HEADER + "{instruction}"
+    title, title_cut = fit_to_budget(str(task.get("title", "")), config["AI_PROMPT_TITLE_MAX_TOKENS"])
+    fixed = count_tokens(template.format(title=title, description="", instruction=instruction))
+    description, description_cut = fit_to_budget(
+        str(task.get("description", "")), max(0, config["AI_PROMPT_MAX_TOKENS"] - fixed), overflow
+    )
+    if title_cut or description_cut:
+        AI_PROMPT_TRIMMED.inc(overflow if description_cut else "truncate")
+    prompt = template.format(title=title, description=description, instruction=instruction)
+    return prompt, title_cut or description_cut
+
+def _task_prompt(task: dict, context: dict, instruction: str = DEFAULT_INSTRUCTION, app=None) -> str:
+    prompt, shortened = fit_task_prompt(task, instruction, app)
+    if shortened:
+        context["tokens"]["trimmed"] = True
+    return prompt
+
+# -------------------- Agent pipelines --------------------
+# Steps of the agent loop (see app.utils.agent_pipeline). AGENT_PIPELINE picks
+# the pipeline; steps that call Gemini are checkpointed so a failed run does
+# not pay for them again.
+
+def analyze_task(task: dict, inputs: dict, context: dict) -> str:
+    # You can add more complex analysis here if needed
+    context["analysis"] = f"Analyzing task titled '{task.get('title', '')}'."
+    return context["analysis"]
+
+def _record_cache_hit(context: dict, cached: bool) -> None:
+    # A run counts as cached only if every Gemini step it made was a cache hit
+    context["cache_hits"] = context.get("cache_hits", []) + [cached]
+    context["cached"] = all(context["cache_hits"])
+
+def gemini_step(instruction: str | None = None):
+    """
+    (fn, afn) pair for a Step that asks Gemini about the task, through the prompt cache.
+    """
+    def prompt(task, context, app=None):
+        return _task_prompt(task, context, instruction or DEFAULT_INSTRUCTION, app)
+
+    def fn(task, inputs, context):
+        usage = {}
+        response, cached = get_cached_gemini_response(
+            prompt(task, context), use_cache=task.get("use_cache", True), user_id=task.get("user_id"), usage=usage
+        )
+        add_token_usage(context, usage)
+        if not response:
+            raise Exception("Gemini API returned no response")
+        _record_cache_hit(context, cached)
+        return response
+
+    async def afn(app, task, inputs, context):
+        usage = {}
+        response, cached = await aget_cached_gemini_response(
+            app, prompt(task, context, app), use_cache=task.get("use_cache", True), user_id=task.get("user_id"),
+            usage=usage,
+        )
+        add_token_usage(context, usage)
+        if not response:
+            raise Exception("Gemini API returned no response")
+        _record_cache_hit(context, cached)
+        return response
+
+    return fn, afn
+
+def llm_step(name: str, instruction: str | None = None, requires=(), timeout=None, retries=0) -> Step:
+    fn, afn = gemini_step(instruction)
+    return Step(name, fn, afn=afn, requires=requires, timeout=timeout, retries=retries, checkpoint=True)
+
+def postprocess_response(task: dict, inputs: dict, context: dict) -> str:
+    return (inputs["call_gemini_api"] or "").strip()
+
+# "sections": three sub-queries sent to Gemini at once, then merged into one answer
+RESULT_SECTIONS = [
+    ("summary", "Summary", "Summarize what this task is about in two or three sentences."),
+    ("action_items", "Action items", "List the concrete next steps as short bullet points."),
+    ("risks", "Risks", "List the main risks or open questions as short bullet points."),
+]
+
+def merge_sections(task: dict, inputs: dict, context: dict) -> str:
+    return "\n\n".join(f"{title}:\n{inputs[name].strip()}" for name, title, _ in RESULT_SECTIONS)
+
+def build_agent_pipelines(config) -> dict:
+    """
+    The agent pipelines by name; Gemini steps get AGENT_LLM_STEP_TIMEOUT and
+    AGENT_LLM_STEP_RETRIES from `config`.
+    """
+    llm = {"timeout": config["AGENT_LLM_STEP_TIMEOUT"], "retries": config["AGENT_LLM_STEP_RETRIES"]}
+    return {
+        "default": Pipeline("default", [
+            Step("analyze_task", analyze_task),
+            llm_step("call_gemini_api", requires=["analyze_task"], **llm),
+            Step("postprocess_response", postprocess_response, requires=["call_gemini_api"]),
+        ]),
+        "sections": Pipeline("sections", [
+            Step("analyze_task", analyze_task),
+            *(llm_step(name, instruction, requires=["analyze_task"], **llm)
+              for name, _, instruction in RESULT_SECTIONS),
+            Step("merge_sections", merge_sections, requires=[name for name, _, _ in RESULT_SECTIONS]),
+        ]),
     }
+
+def init_agent_pipelines(app):
+    pipelines = build_agent_pipelines(app.config)
+    app.extensions["agent_pipelines"] = pipelines
+    return pipelines
+
+def get_agent_pipeline(app=None, name=None) -> Pipeline:
+    """
+    The pipeline called `name`, by default the configured AGENT_PIPELINE.
+    """
+    app = app or current_app
+    name = name or app.config.get("AGENT_PIPELINE", "default")
+    pipelines = app.extensions["agent_pipelines"]
+    if name not in pipelines:
+        raise ValueError(f"Unknown AGENT_PIPELINE: {name}")
+    return pipelines[name]
+
+def execute_agent_steps(task: dict, context: dict, save=None) -> dict:
+    """
+    In-memory part of the agent loop for an already-loaded task document:
+    runs the configured pipeline, resuming from the task's checkpoint. The
+    only database writes are `save(checkpoint)` calls after expensive steps
+    (none if save is None); the caller persists the result (see
+    persist_agent_result). Raises on failure.
+    """
+    return get_agent_pipeline().run(task, context, save=save)
+
+def defer_until(retry_after: float) -> datetime:
+    # Jittered, so deferred tasks don't all come back in the same instant
+    return datetime.utcnow() + timedelta(seconds=max(retry_after, 1.0) * (1 + random.random() / 2))
+
+def record_agent_error(context: dict, error: Exception) -> None:
+    context["error"] = str(error)
+    if isinstance(error, LLMUnavailable):
+        # Gemini was never called: run again once the backend has had time to recover
+        context["deferred_until"] = defer_until(error.retry_after)
+
+def agent_run_outcome(context: dict) -> str:
+    if context.get("deferred_until"):
+        return "deferred"
+    return "error" if context.get("error") else "completed"
+
+def agent_result_writes(context: dict) -> tuple[dict, dict]:
+    """
+    Task fields and log entry that persist a finished (failed, deferred) agent run.
+    A deferred task gets next_run_at, so the scheduler runs it again.
+    """
+    now = datetime.utcnow()
+    if context.get("error"):
+        if context.get("deferred_until"):
+            task_fields = {"status": "deferred", "next_run_at": context["deferred_until"], "last_run": now}
+            log_entry = {"ai_response": f"Deferred: {context['error']}", "status": "deferred"}
+        else:
+            task_fields = {"status": "error", "last_run": now}
+            log_entry = {"ai_response": f"Error: {context['error']}", "status": "error"}
+        if context.get("checkpoint"):
+            # Kept so the next run resumes after the steps that succeeded
+            task_fields["agent_checkpoint"] = context["checkpoint"]
+    else:
+        task_fields = {
+            "status": "completed",
+            "progress": 100,
+            "result": context["results"],
+            "last_run": now,
+            "agent_checkpoint": None,
+        }
+        log_entry = {"ai_response": context["results"], "status": "success"}
+
+    tokens = context["tokens"]
+    log_entry.update({
+        "task_id": context["task_id"],
+        "user_id": context["user_id"],
+        "timestamp": now,
+        "tokens": dict(tokens, total=tokens["prompt"] + tokens["completion"]),
+    })
+    return task_fields, log_entry
+
+def persist_agent_result(context: dict) -> None:
+    """
+    Save a finished (or failed) run: task fields and one log entry.
+    """
+    task_fields, log_entry = agent_result_writes(context)
+    set_task_status(context["task_id"], context["user_id"], **task_fields)
+    write_logs([log_entry])
+    if context.get("deferred_until"):
+        schedule_task_run(context["task_id"], context["user_id"], context["deferred_until"])
+
+def run_agent_for_task(task_id: str, user_id: str) -> dict:
+    """
+    Agentic AI loop for a task:
+    - Multi-step: the AGENT_PIPELINE steps, then finalize
+    - Checkpoints Gemini outputs, so a failed run resumes where it stopped
+    - Updates task status & logs in MongoDB
+    Returns dict with results or error info.
+    """
+    with track_in_flight(AGENT_RUNS_IN_FLIGHT):
+        context = _run_agent_for_task(task_id, user_id)
+    AGENT_RUNS.inc(agent_run_outcome(context))
+    return context
+
+def _run_agent_for_task(task_id: str, user_id: str) -> dict:
+    context = new_agent_context(task_id, user_id)
     try:
-        task = mongo.db.tasks.find_one({"task_id": task_id, "user_id": user_id})
+        task = get_repositories().tasks.get(task_id, user_id)
         if not task:
             raise Exception("Task not found")
 
-        # Define steps for the agent to execute
-        steps = [
-            "analyze_task",
-            "call_gemini_api",
-            "postprocess_response",
-            "finalize_task",
-        ]
+        execute_agent_steps(
+            task, context, save=lambda checkpoint: save_task_checkpoint(task_id, user_id, checkpoint)
+        )
 
-        for step in steps:
-            if step == "analyze_task":
-                # You can add more complex analysis here if needed
-                context["analysis"] = f"Analyzing task titled '{task.get('title', '')}'."
-                context["steps_completed"].append(step)
-
-            elif step == "call_gemini_api":
-                prompt_template = (
-                    "You are a professional support agent.\n"
-                    "Task title: {title}\n"
-                    "Description: {description}\n"
-                    "Please provide a concise, professional response."
-                )
-                prompt = prompt_template.format(
-                    title=task.get("title", ""),
-                    description=task.get("description", "")
-                )
-                response = get_gemini_response(prompt)
-                if not response:
-                    raise Exception("Gemini API returned no response")
-                context["results"] = response
-                context["steps_completed"].append(step)
-
-            elif step == "postprocess_response":
-                if context["results"]:
-                    context["results"] = context["results"].strip()
-                context["steps_completed"].append(step)
-
-            elif step == "finalize_task":
-                mongo.db.tasks.update_one(
-                    {"task_id": task_id, "user_id": user_id},
-                    {"$set": {
-                        "status": "completed",
-                        "progress": 100,
-                        "result": context["results"],
-                        "last_run": datetime.utcnow(),
-                    }}
-                )
-                mongo.db.logs.insert_one({
-                    "task_id": task_id,
-                    "user_id": user_id,
-                    "ai_response": context["results"],
-                    "status": "success",
-                    "timestamp": datetime.utcnow(),
-                })
-                context["steps_completed"].append(step)
+        # finalize_task
+        persist_agent_result(context)
+        context["steps_completed"].append("finalize_task")
 
         return context
 
     except Exception as e:
-        context["error"] = str(e)
+        record_agent_error(context, e)
         # Mark task as error and log it
         try:
-            mongo.db.tasks.update_one(
-                {"task_id": task_id, "user_id": user_id},
-                {"$set": {"status": "error", "last_run": datetime.utcnow()}}
-            )
-            mongo.db.logs.insert_one({
-                "task_id": task_id,
-                "user_id": user_id,
-                "ai_response": f"Error: {context['error']}",
-                "status": "error",
-                "timestamp": datetime.utcnow(),
-            })
+            persist_agent_result(context)
         except PyMongoError as log_error:
-            print(f"Failed to log error in MongoDB: {log_error}")
+            log_event(logger, logging.ERROR, "agent_result_persist_failed",
+                      task_id=context["task_id"], error=str(log_error))
         return context
 
+def _stream_resume(task: dict, context: dict, app=None) -> str | None:
+    # Streams always make the default pipeline's single Gemini call; an answer
+    # checkpointed by a failed run is replayed instead of asked for again
+    response = get_agent_pipeline(app, "default").resume(task).get("call_gemini_api")
+    if response is not None:
+        context["resumed_steps"] = ["call_gemini_api"]
+    return response
+
+def _stream_checkpoint(task: dict, response: str, app=None) -> dict:
+    return get_agent_pipeline(app, "default").checkpoint_for(task, {"call_gemini_api": response})
+
+def stream_agent_for_task(task_id: str, user_id: str):
+    """
+    Streaming variant of run_agent_for_task. Yields ("chunk", text) as the
+    answer is generated, then ("done", context) or ("error", context) once the
+    result has been persisted to the task and logs exactly as run_agent_for_task does.
+    A cached or checkpointed answer is replayed as a single chunk. Streams
+    always use the default pipeline (one Gemini call), whatever AGENT_PIPELINE is.
+    """
+    events = _stream_agent_for_task(task_id, user_id)
+    outcome = "cancelled"
+    AGENT_RUNS_IN_FLIGHT.inc()
+    try:
+        for kind, payload in events:
+            if kind != "chunk":
+                outcome = agent_run_outcome(payload)
+            yield kind, payload
+    finally:
+        # Closing here runs the inner generator's cancellation handling now,
+        # inside the request's app context, rather than whenever it is collected
+        events.close()
+        AGENT_RUNS_IN_FLIGHT.dec()
+        AGENT_RUNS.inc(outcome)
+
+def _stream_agent_for_task(task_id: str, user_id: str):
+    context = new_agent_context(task_id, user_id)
+    try:
+        task = get_repositories().tasks.get(task_id, user_id)
+        if not task:
+            raise Exception("Task not found")
+
+        context["analysis"] = f"Analyzing task titled '{task.get('title', '')}'."
+        context["steps_completed"].append("analyze_task")
+
+        prompt = _task_prompt(task, context)
+        use_cache = current_app.config["AI_CACHE_ENABLED"] and task.get("use_cache", True)
+        cache_key = response_cache_key(prompt)
+        resumed = _stream_resume(task, context)
+        cached = get_response_cache().get(cache_key) if use_cache and resumed is None else None
+
+        if resumed is not None:
+            yield "chunk", resumed
+            response = resumed
+        elif cached is not None:
+            context["cached"] = True
+            yield "chunk", cached
+            response = cached
+        else:
+            chunks, usage = [], {}
+            for chunk in stream_gemini_response(prompt, user_id, tokens=usage):
+                chunks.append(chunk)
+                yield "chunk", chunk
+            add_token_usage(context, usage)
+            response = "".join(chunks)
+            if not response.strip():
+                raise Exception("Gemini API returned no response")
+            if use_cache:
+                get_response_cache().set(cache_key, response)
+
+        context["results"] = response
+        context["checkpoint"] = _stream_checkpoint(task, response)
+        context["steps_completed"].append("call_gemini_api")
+
+        context["results"] = context["results"].strip()
+        context["steps_completed"].append("postprocess_response")
+
+        persist_agent_result(context)
+        context["steps_completed"].append("finalize_task")
+
+        yield "done", context
+
+    except GeneratorExit:
+        # Client went away mid-stream: don't leave the task stuck in "running"
+        if "finalize_task" in context["steps_completed"]:
+            raise
+        context["error"] = "Stream cancelled by client"
+        try:
+            persist_agent_result(context)
+        except PyMongoError as log_error:
+            log_event(logger, logging.ERROR, "agent_result_persist_failed",
+                      task_id=context["task_id"], error=str(log_error))
+        raise
+
+    except Exception as e:
+        record_agent_error(context, e)
+        try:
+            persist_agent_result(context)
+        except PyMongoError as log_error:
+            log_event(logger, logging.ERROR, "agent_result_persist_failed",
+                      task_id=context["task_id"], error=str(log_error))
+        yield "error", context
+
+# -------------------- asyncio variants (ASGI mode) --------------------
+# Same steps and persistence as above. Gemini is awaited on the asyncio client,
+# so a run waiting on the model holds no thread; the short repository/model
+# calls run on worker threads inside an app context via run_in_app.
+
+async def aget_cached_gemini_response(app, prompt: str, use_cache: bool = True, user_id: str | None = None,
+                                      usage: dict | None = None) -> tuple[str | None, bool]:
+    # Not micro-batched: on the event loop a waiting run holds no thread anyway
+    if not (app.config["AI_CACHE_ENABLED"] and use_cache):
+        return await aget_gemini_response(app, prompt, user_id, usage), False
+
+    cache = get_response_cache(app)
+    key = response_cache_key(prompt, app)
+    cached = await run_in_app(app, cache.get, key)
+    if cached is not None:
+        return cached, True
+
+    response = await aget_gemini_response(app, prompt, user_id, usage)
+    if response:
+        await run_in_app(app, cache.set, key, response)
+    return response, False
+
+async def aexecute_agent_steps(app, task: dict, context: dict, save=None) -> dict:
+    return await get_agent_pipeline(app).arun(app, task, context, save=save)
+
+def _load_task(task_id: str, user_id: str) -> dict | None:
+    return get_repositories().tasks.get(task_id, user_id)
+
+async def arun_agent_for_task(app, task_id: str, user_id: str) -> dict:
+    """
+    run_agent_for_task for the event loop.
+    """
+    with track_in_flight(AGENT_RUNS_IN_FLIGHT):
+        context = new_agent_context(task_id, user_id)
+        try:
+            task = await run_in_app(app, _load_task, task_id, user_id)
+            if not task:
+                raise Exception("Task not found")
+
+            await aexecute_agent_steps(
+                app, task, context, save=lambda checkpoint: save_task_checkpoint(task_id, user_id, checkpoint)
+            )
+            await run_in_app(app, persist_agent_result, context)
+            context["steps_completed"].append("finalize_task")
+        except Exception as e:
+            record_agent_error(context, e)
+            try:
+                await run_in_app(app, persist_agent_result, context)
+            except PyMongoError as log_error:
+                log_event(logger, logging.ERROR, "agent_result_persist_failed",
+                          task_id=context["task_id"], error=str(log_error))
+    AGENT_RUNS.inc(agent_run_outcome(context))
+    return context
+
+async def astream_agent_for_task(app, task_id: str, user_id: str):
+    """
+    stream_agent_for_task for the event loop: yields ("chunk", text), then
+    ("done", context) or ("error", context). Cancelling the consuming task or
+    closing the generator saves the run as cancelled.
+    """
+    context = new_agent_context(task_id, user_id)
+    outcome = "cancelled"
+    AGENT_RUNS_IN_FLIGHT.inc()
+    try:
+        task = await run_in_app(app, _load_task, task_id, user_id)
+        if not task:
+            raise Exception("Task not found")
+
+        context["analysis"] = f"Analyzing task titled '{task.get('title', '')}'."
+        context["steps_completed"].append("analyze_task")
+
+        prompt = _task_prompt(task, context, app=app)
+        use_cache = app.config["AI_CACHE_ENABLED"] and task.get("use_cache", True)
+        cache_key = response_cache_key(prompt, app)
+        cache = get_response_cache(app)
+        resumed = _stream_resume(task, context, app)
+        cached = await run_in_app(app, cache.get, cache_key) if use_cache and resumed is None else None
+
+        if resumed is not None:
+            yield "chunk", resumed
+            response = resumed
+        elif cached is not None:
+            context["cached"] = True
+            yield "chunk", cached
+            response = cached
+        else:
+            chunks, usage = [], {}
+            async for chunk in astream_gemini_response(app, prompt, user_id, tokens=usage):
+                chunks.append(chunk)
+                yield "chunk", chunk
+            add_token_usage(context, usage)
+            response = "".join(chunks)
+            if not response.strip():
+                raise Exception("Gemini API returned no response")
+            if use_cache:
+                await run_in_app(app, cache.set, cache_key, response)
+
+        context["checkpoint"] = _stream_checkpoint(task, response, app)
+        context["results"] = response.strip()
+        context["steps_completed"] += ["call_gemini_api", "postprocess_response"]
+
+        await run_in_app(app, persist_agent_result, context)
+        context["steps_completed"].append("finalize_task")
+        outcome = "completed"
+        yield "done", context
+
+    except (GeneratorExit, asyncio.CancelledError):
+        # Client went away mid-stream: don't leave the task stuck in "running"
+        if "finalize_task" not in context["steps_completed"]:
+            context["error"] = "Stream cancelled by client"
+            try:
+                await run_in_app(app, persist_agent_result, context)
+            except PyMongoError as log_error:
+                log_event(logger, logging.ERROR, "agent_result_persist_failed",
+                          task_id=context["task_id"], error=str(log_error))
+        raise
+
+    except Exception as e:
+        record_agent_error(context, e)
+        outcome = agent_run_outcome(context)
+        try:
+            await run_in_app(app, persist_agent_result, context)
+        except PyMongoError as log_error:
+            log_event(logger, logging.ERROR, "agent_result_persist_failed",
+                      task_id=context["task_id"], error=str(log_error))
+        yield "error", context
+
+    finally:
+        AGENT_RUNS_IN_FLIGHT.dec()
+        AGENT_RUNS.inc(outcome)
+
 if __name__ == "__main__":
-    test_gemini_api()
+    from app import create_app
+    with create_app().app_context():
+        test_gemini_api()
+        log_event(logger, logging.INFO, "gemini_connection_pool", **get_http_client().stats.snapshot())
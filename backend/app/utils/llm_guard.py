@@ -0,0 +1,383 @@
+"""
+Admission control in front of the LLM backend.
+
+- AdaptiveLimiter: caps Gemini calls in flight. The cap follows AIMD: +1 per
+  `limit` fast successes, halved (at most once per `decrease_interval`) on an
+  error, an overload status (429/5xx) or a call slower than `latency_target`.
+  Callers over the cap wait in per-user queues; a freed slot goes to the
+  waiting user with the fewest calls in flight, so a tenant queueing hundreds
+  of runs cannot starve one that queues a single run.
+- CircuitBreaker: opens when at least `failure_rate` of the last `window`
+  calls failed (and `min_calls` were seen). While open every call fails at
+  once with LLMUnavailable instead of waiting on timeouts; after `cooldown`
+  a few probe calls are let through and the first success closes it again.
+
+LLMGuard combines the two; `with guard.slot(user_id) as permit:` around one
+call (or `async with guard.aslot(user_id)` on the event loop). LLMUnavailable
+means the call was not made: callers defer the task rather than fail it.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+__all__ = ["LLMUnavailable", "AdaptiveLimiter", "CircuitBreaker", "LLMGuard"]
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class LLMUnavailable(Exception):
+    """
+    The call was refused before reaching the backend (circuit open, or no
+    slot within the queue timeout). `retry_after` is a hint in seconds.
+    """
+    # Not worth retrying right away (see app.utils.agent_pipeline)
+    retryable = False
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"LLM backend unavailable ({reason}), retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    """
+    One waiter: `grant` wakes a thread or resolves an asyncio future.
+    """
+    __slots__ = ("user_id", "granted", "_event", "_loop", "_future")
+
+    def __init__(self, user_id, loop=None):
+        self.user_id = user_id
+        self.granted = False
+        self._loop = loop
+        self._event = None if loop else threading.Event()
+        self._future = loop.create_future() if loop else None
+
+    def grant(self):
+        self.granted = True
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self._future.done():
+            self._future.set_result(True)
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+    async def await_grant(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit with per-user fair queueing. Thread-safe; async
+    waiters are woken on their own event loop.
+    """
+
+    def __init__(self, initial=16, min_limit=1, max_limit=64, latency_target=5.0,
+                 decrease_interval=1.0, max_queue=1000):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_target = latency_target
+        self.decrease_interval = decrease_interval
+        self.max_queue = max_queue
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._user_in_flight = {}
+        self._waiters = OrderedDict()  # user_id -> deque of tickets, in order of first wait
+        self._waiting = 0
+        self._last_decrease = 0.0
+        self._counts = {"granted": 0, "queued": 0, "rejected": 0, "increased": 0, "decreased": 0}
+
+    # -------------------- slots --------------------
+    def _try_acquire(self, user_id, loop=None):
+        # Returns None if a slot was taken, else the queued ticket
+        with self._lock:
+            if not self._waiters and self._in_flight < int(self.limit):
+                self._take(user_id)
+                return None
+            if self._waiting >= self.max_queue:
+                self._counts["rejected"] += 1
+                raise LLMUnavailable("overloaded", 1.0)
+            ticket = _Ticket(user_id, loop)
+            self._waiters.setdefault(user_id, deque()).append(ticket)
+            self._waiting += 1
+            self._counts["queued"] += 1
+            return ticket
+
+    def _take(self, user_id):
+        # Caller holds self._lock
+        self._in_flight += 1
+        self._user_in_flight[user_id] = self._user_in_flight.get(user_id, 0) + 1
+        self._counts["granted"] += 1
+
+    def _dispatch(self):
+        # Caller holds self._lock. Fair share: the waiting user with the fewest
+        # calls in flight goes next (ties: whoever started waiting first).
+        while self._waiters and self._in_flight < int(self.limit):
+            user_id = min(self._waiters, key=lambda u: self._user_in_flight.get(u, 0))
+            queue = self._waiters[user_id]
+            ticket = queue.popleft()
+            if not queue:
+                del self._waiters[user_id]
+            else:
+                self._waiters.move_to_end(user_id)
+            self._waiting -= 1
+            self._take(user_id)
+            ticket.grant()
+
+    def _cancel(self, ticket):
+        # A waiter timed out; True if it was granted meanwhile (and now holds a slot)
+        with self._lock:
+            if ticket.granted:
+                return True
+            queue = self._waiters.get(ticket.user_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._waiting -= 1
+                if not queue:
+                    del self._waiters[ticket.user_id]
+            self._counts["rejected"] += 1
+            return False
+
+    def acquire(self, user_id, timeout):
+        ticket = self._try_acquire(user_id)
+        if ticket is None or ticket.wait(timeout) or self._cancel(ticket):
+            return
+        raise LLMUnavailable("overloaded", timeout)
+
+    async def aacquire(self, user_id, timeout):
+        ticket = self._try_acquire(user_id, asyncio.get_running_loop())
+        if ticket is None:
+            return
+        try:
+            granted = await ticket.await_grant(timeout)
+        except asyncio.CancelledError:
+            if self._cancel(ticket):
+                self.release(ticket.user_id)
+            raise
+        if granted or self._cancel(ticket):
+            return
+        raise LLMUnavailable("overloaded", timeout)
+
+    def release(self, user_id):
+        with self._lock:
+            self._in_flight -= 1
+            left = self._user_in_flight.get(user_id, 1) - 1
+            if left:
+                self._user_in_flight[user_id] = left
+            else:
+                self._user_in_flight.pop(user_id, None)
+            self._dispatch()
+
+    # -------------------- AIMD --------------------
+    def on_result(self, ok, latency):
+        with self._lock:
+            if ok and latency <= self.latency_target:
+                if self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                    self._counts["increased"] += 1
+                    self._dispatch()
+                return
+            now = time.monotonic()
+            # One decrease per interval: a burst of concurrent failures is one signal
+            if now - self._last_decrease >= self.decrease_interval:
+                self._last_decrease = now
+                self.limit = max(float(self.min_limit), self.limit / 2)
+                self._counts["decreased"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, limit=int(self.limit), in_flight=self._in_flight,
+                        waiting=self._waiting, waiting_users=len(self._waiters))
+
+
+class CircuitBreaker:
+    """
+    Failure-rate breaker over the last `window` calls.
+    """
+
+    def __init__(self, window=20, min_calls=10, failure_rate=0.5, cooldown=30.0, half_open_calls=2):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.half_open_calls = half_open_calls
+
+        self._lock = threading.Lock()
+        self._results = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._transitions = {OPEN: 0, HALF_OPEN: 0, CLOSED: 0}
+        self._rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        # Caller holds self._lock
+        if self._state == OPEN and now - self._opened_at >= self.cooldown:
+            self._set_state(HALF_OPEN)
+            self._probes = 0
+        return self._state
+
+    def _set_state(self, state):
+        self._state = state
+        self._transitions[state] += 1
+
+    def retry_after(self):
+        with self._lock:
+            if self._current_state(time.monotonic()) != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def allow(self):
+        """
+        Raise LLMUnavailable unless a call may go through now.
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            self._rejected += 1
+            retry_after = self.cooldown - (now - self._opened_at) if state == OPEN else 1.0
+            raise LLMUnavailable("circuit open", max(retry_after, 1.0))
+
+    def on_result(self, ok):
+        """
+        Record a call: True/False for success/failure, None for a call that
+        says nothing about the backend (or never reached it).
+        """
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if ok is None:
+                if state == HALF_OPEN:
+                    self._probes = max(0, self._probes - 1)
+                return
+            if state == HALF_OPEN:
+                if ok:
+                    self._results.clear()
+                    self._set_state(CLOSED)
+                else:
+                    self._open()
+                return
+            self._results.append(ok)
+            failures = self._results.count(False)
+            if (state == CLOSED and len(self._results) >= self.min_calls
+                    and failures >= self.failure_rate * len(self._results)):
+                self._open()
+
+    def _open(self):
+        # Caller holds self._lock
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        self._set_state(OPEN)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(time.monotonic()),
+                "opened": self._transitions[OPEN],
+                "closed": self._transitions[CLOSED],
+                "rejected": self._rejected,
+            }
+
+
+class Permit:
+    """
+    A slot for one call. Set `outcome` to "ok", "error" or "ignored" (a
+    client-side error that says nothing about backend health); it is
+    recorded when the slot is released, or earlier with done().
+    """
+
+    def __init__(self, guard, user_id):
+        self.guard = guard
+        self.user_id = user_id
+        self.outcome = "error"
+        self._start = time.perf_counter()
+        self._recorded = False
+
+    def done(self, outcome=None):
+        """
+        Record the outcome now (e.g. at the first byte of a stream) while the slot stays held.
+        """
+        if self._recorded:
+            return
+        self._recorded = True
+        if outcome is not None:
+            self.outcome = outcome
+        if self.outcome == "ignored":
+            self.guard.breaker.on_result(None)
+            return
+        ok = self.outcome == "ok"
+        self.guard.limiter.on_result(ok, time.perf_counter() - self._start)
+        self.guard.breaker.on_result(ok)
+
+
+class LLMGuard:
+    """
+    CircuitBreaker + AdaptiveLimiter around each backend call.
+    """
+
+    def __init__(self, limiter, breaker, queue_timeout=10.0):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.queue_timeout = queue_timeout
+
+    def check(self):
+        """
+        Fail fast (LLMUnavailable) while the circuit is open, without taking a probe.
+        """
+        retry_after = self.breaker.retry_after()
+        if retry_after:
+            raise LLMUnavailable("circuit open", max(retry_after, 1.0))
+
+    @contextmanager
+    def slot(self, user_id=None):
+        self.breaker.allow()
+        try:
+            self.limiter.acquire(user_id, self.queue_timeout)
+        except BaseException:
+            self.breaker.on_result(None)
+            raise
+        permit = Permit(self, user_id)
+        try:
+            yield permit
+        finally:
+            permit.done()
+            self.limiter.release(user_id)
+
+    @asynccontextmanager
+    async def aslot(self, user_id=None):
+        self.breaker.allow()
+        try:
+            await self.limiter.aacquire(user_id, self.queue_timeout)
+        except BaseException:
+            self.breaker.on_result(None)
+            raise
+        permit = Permit(self, user_id)
+        try:
+            yield permit
+        finally:
+            permit.done()
+            self.limiter.release(user_id)
+
+    def stats(self):
+        return {"limiter": self.limiter.stats(), "breaker": self.breaker.stats()}
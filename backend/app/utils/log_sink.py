@@ -0,0 +1,287 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+from pymongo.errors import BulkWriteError, PyMongoError
+from app.utils.logger import get_logger, log_event
+
+__all__ = ["BufferedLogSink", "init_log_sink", "get_log_sink", "BACKPRESSURE_POLICIES"]
+
+logger = get_logger(__name__)
+
+# What write() does when the buffer is full:
+# - block: wait up to block_timeout for room, then drop the entry
+# - drop_newest: drop the incoming entry
+# - drop_oldest: evict the oldest buffered entry to make room
+# - sync: bypass the buffer and insert the entry directly
+BACKPRESSURE_POLICIES = {"block", "drop_newest", "drop_oldest", "sync"}
+
+DUPLICATE_KEY = 11000
+
+
+class BufferedLogSink:
+    """
+    Buffers log entries in memory and writes them with insert_many from a
+    background thread once `batch_size` entries are waiting or
+    `flush_interval` seconds have passed. The buffer holds at most
+    `max_queue` entries; see BACKPRESSURE_POLICIES for what happens beyond that.
+    Failed entries are retried up to `max_retries` times before being counted
+    as failed; retries that no longer fit in the buffer are dropped. close()
+    (also registered with atexit) flushes what is left.
+    `on_written(docs)` is called after each batch that reached the database.
+    """
+
+    def __init__(self, collection_getter, batch_size=100, flush_interval=1.0, max_queue=10000,
+                 policy="block", block_timeout=1.0, ordered=False, max_retries=3, on_written=None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self._collection_getter = collection_getter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.ordered = ordered
+        self.max_retries = max_retries
+        self.on_written = on_written
+
+        self._buffer = deque()  # (entry, attempts)
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self._in_flight = 0
+        self._closed = False
+        self._thread = None
+        self._pid = None
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "retried": 0, "failed": 0, "batches": 0}
+
+    # -------------------- producer side --------------------
+    def write(self, entry):
+        """
+        Buffer one entry. Returns False if the entry was dropped.
+        """
+        self._ensure_thread()
+        write_through = False
+        with self._cond:
+            if self._closed:
+                self._stats["dropped"] += 1
+                return False
+
+            if len(self._buffer) >= self.max_queue:
+                if self.policy == "sync":
+                    write_through = True
+                elif self.policy == "drop_newest":
+                    self._stats["dropped"] += 1
+                    return False
+                elif self.policy == "drop_oldest":
+                    self._buffer.popleft()
+                    self._stats["dropped"] += 1
+                else:  # block
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._buffer) >= self.max_queue:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["dropped"] += 1
+                            return False
+                        self._cond.notify_all()
+                        self._cond.wait(remaining)
+
+            self._stats["enqueued"] += 1
+            if not write_through:
+                self._buffer.append((entry, 0))
+                if len(self._buffer) >= self.batch_size:
+                    self._cond.notify_all()
+
+        if write_through:
+            self._insert([(entry, 0)])
+        return True
+
+    def write_many(self, entries):
+        return sum(1 for entry in entries if self.write(entry))
+
+    def flush(self, timeout=5.0):
+        """
+        Ask the writer thread to write everything buffered and wait for it.
+        Returns True if the buffer drained within `timeout`.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return True
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._buffer or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        with self._cond:
+            if self._closed:
+                return
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._drain()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._buffer)
+        return stats
+
+    # -------------------- writer side --------------------
+    def _ensure_thread(self):
+        # Re-create the thread after a fork (e.g. gunicorn pre-fork workers)
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self):
+        batch = []
+        while self._buffer and len(batch) < self.batch_size:
+            batch.append(self._buffer.popleft())
+        self._in_flight = len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self._buffer) < self.batch_size and not self._flush_requested
+                       and not self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                batch = self._take_batch()
+                if not self._buffer:
+                    self._flush_requested = False
+
+            if batch:
+                self._insert(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _drain(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._insert(batch)
+            with self._cond:
+                self._in_flight = 0
+
+    def _insert(self, batch):
+        docs = [entry for entry, _ in batch]
+        try:
+            self._collection_getter().insert_many(docs, ordered=self.ordered)
+            self._count(written=len(docs), batches=1)
+            self._notify_written(docs)
+            return
+        except BulkWriteError as e:
+            details = e.details or {}
+            errors = {err["index"]: err for err in details.get("writeErrors", [])}
+            written = details.get("nInserted", 0)
+            retry, written_docs = [], []
+            for index, item in enumerate(batch):
+                err = errors.get(index)
+                if err is not None and err.get("code") == DUPLICATE_KEY:
+                    # Already written by an earlier attempt (insert_many sets _id client-side)
+                    written += 1
+                    written_docs.append(item[0])
+                elif err is not None or (self.ordered and errors and index > min(errors)):
+                    retry.append(item)
+                else:
+                    written_docs.append(item[0])
+            self._count(written=written, batches=1)
+            self._notify_written(written_docs)
+        except PyMongoError as e:
+            log_event(logger, logging.ERROR, "log_batch_write_failed", entries=len(batch), error=str(e))
+            retry = batch
+
+        self._requeue(retry)
+
+    def _notify_written(self, docs):
+        if self.on_written is None or not docs:
+            return
+        try:
+            self.on_written(docs)
+        except Exception as e:
+            log_event(logger, logging.ERROR, "log_sink_callback_failed", error=str(e))
+
+    def _requeue(self, items):
+        retry, failed = [], 0
+        for entry, attempts in items:
+            if attempts + 1 > self.max_retries:
+                failed += 1
+            else:
+                retry.append((entry, attempts + 1))
+        with self._cond:
+            self._stats["failed"] += failed
+            if self._closed:
+                self._stats["failed"] += len(retry)
+                return
+            # Retries go back in front of the buffer but never past max_queue
+            # (write-through batches of the "sync" policy arrive with it full)
+            room = max(0, self.max_queue - len(self._buffer))
+            if len(retry) > room:
+                self._stats["dropped"] += len(retry) - room
+                retry = retry[:room]
+            self._stats["retried"] += len(retry)
+            self._buffer.extendleft(reversed(retry))
+        if retry:
+            time.sleep(min(self.flush_interval, 0.1 * (2 ** max(a for _, a in retry))))
+
+    def _count(self, **amounts):
+        with self._cond:
+            for name, amount in amounts.items():
+                self._stats[name] += amount
+
+
+def init_log_sink(app):
+    """
+    Create the buffered log sink from config (LOG_SINK_*) unless disabled.
+    """
+    if not app.config.get("LOG_SINK_ENABLED", True):
+        app.extensions["log_sink"] = None
+        return None
+
+    from app.models.version_model import bump_versions_many
+
+    # The flush thread has no app context, so bind the repositories now
+    repos = app.extensions["repositories"]
+    logs = repos.logs
+    sink = BufferedLogSink(
+        lambda: logs,
+        batch_size=app.config.get("LOG_SINK_BATCH_SIZE", 100),
+        flush_interval=app.config.get("LOG_SINK_FLUSH_INTERVAL", 1.0),
+        max_queue=app.config.get("LOG_SINK_MAX_QUEUE", 10000),
+        policy=app.config.get("LOG_SINK_POLICY", "block"),
+        ordered=app.config.get("LOG_SINK_ORDERED", False),
+        max_retries=app.config.get("LOG_SINK_MAX_RETRIES", 3),
+        on_written=lambda docs: bump_versions_many([doc.get("user_id") for doc in docs], "logs", repos=repos),
+    )
+    app.extensions["log_sink"] = sink
+    atexit.register(sink.close)
+    return sink
+
+
+def get_log_sink():
+    return current_app.extensions.get("log_sink")
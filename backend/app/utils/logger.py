@@ -0,0 +1,91 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+__all__ = ["get_logger", "log_event"]
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of DEBUG/INFO events kept (WARNING and above are never sampled out)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+
+_listener = None
+_configured = False
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, event plus any structured fields.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+def _root_handler():
+    """
+    Records are handed to a QueueHandler and formatted/written to stdout by a
+    listener thread, so request threads never block on stdout.
+    """
+    global _listener
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    return handler
+
+
+def get_logger(name):
+    """
+    Levelled, sampled JSON logger under the "app" namespace (LOG_LEVEL, LOG_SAMPLE_RATE).
+    """
+    global _configured
+    base = logging.getLogger("app")
+    if not _configured:
+        _configured = True
+        # "app" is also Flask's app.logger (the package is named app); replace
+        # Flask's plain-text stderr handler so its records come out as JSON too
+        from flask.logging import default_handler
+        base.removeHandler(default_handler)
+        base.addHandler(_root_handler())
+        base.setLevel(LOG_LEVEL)
+        base.propagate = False
+    return logging.getLogger(name if name.split(".")[0] == "app" else f"app.{name}")
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Log `event` with structured fields; free when `level` is disabled.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
@@ -0,0 +1,360 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, request
+from pymongo import monitoring
+
+__all__ = [
+    "REGISTRY", "Counter", "Gauge", "Histogram", "MetricsRegistry",
+    "init_metrics", "mongo_event_listeners", "render_metrics", "track_in_flight",
+    "HTTP_REQUEST_DURATION", "HTTP_REQUESTS_IN_FLIGHT", "MONGO_COMMAND_DURATION",
+    "JWT_DECODE_DURATION", "LLM_REQUEST_DURATION", "LLM_TOKENS",
+    "AGENT_RUNS", "AGENT_RUNS_IN_FLIGHT", "AGENT_STEP_DURATION", "AGENT_STEPS", "SCHEDULED_RUNS", "record_llm_usage",
+]
+
+# Latency buckets (seconds) for requests and database commands
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# LLM calls take seconds, not milliseconds
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.labelnames and self.kind != "histogram":
+            self._values[()] = 0
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram. observe() is a bisect and one locked increment;
+    cumulative bucket counts are only computed when /metrics is scraped.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (last slot is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = _label_text(self.labelnames, labels, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {running}")
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {running}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics plus collectors: callables run at scrape time that
+    return (name, kind, documentation, [(labels dict, value)]) for state that
+    already lives elsewhere (log sink, caches, HTTP pool).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def set_collector(self, name, collector):
+        # Keyed so a second create_app() in one process replaces rather than duplicates
+        self._collectors[name] = collector
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in list(self._collectors.values()):
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_label_text(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route.", ["method", "route", "status"])
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being handled.")
+MONGO_COMMAND_DURATION = REGISTRY.histogram(
+    "mongo_command_duration_seconds", "MongoDB command round trips (pymongo command monitoring).",
+    ["command", "outcome"])
+JWT_DECODE_DURATION = REGISTRY.histogram(
+    "jwt_decode_duration_seconds", "jwt.decode calls on token cache misses.", ["outcome"])
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "llm_request_duration_seconds", "Gemini API calls, by mode (json/stream).", ["mode", "outcome"],
+    buckets=LLM_BUCKETS)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "Tokens reported by Gemini usageMetadata.", ["kind"])
+LLM_MICROBATCH = REGISTRY.counter(
+    "llm_microbatch_prompts_total", "Prompts sent through the micro-batcher, by how they were answered.",
+    ["outcome"])
+AI_PROMPT_TRIMMED = REGISTRY.counter(
+    "ai_prompt_trimmed_total", "Task prompts shortened to fit AI_PROMPT_MAX_TOKENS.", ["mode"])
+AGENT_RUNS = REGISTRY.counter(
+    "agent_runs_total", "Finished agent runs.", ["outcome"])
+AGENT_RUNS_IN_FLIGHT = REGISTRY.gauge(
+    "agent_runs_in_flight", "Agent runs currently executing.")
+AGENT_STEP_DURATION = REGISTRY.histogram(
+    "agent_step_duration_seconds", "Agent pipeline step attempts, by step.", ["step", "outcome"],
+    buckets=LLM_BUCKETS)
+AGENT_STEPS = REGISTRY.counter(
+    "agent_step_events_total", "Agent pipeline steps resumed from a checkpoint, retried or failed.",
+    ["step", "event"])
+SCHEDULED_RUNS = REGISTRY.counter(
+    "scheduled_runs_total", "Task scheduler dispatches, by outcome.", ["outcome"])
+
+
+@contextmanager
+def track_in_flight(gauge, *labels):
+    gauge.inc(*labels)
+    try:
+        yield
+    finally:
+        gauge.dec(*labels)
+
+
+def record_llm_usage(data):
+    """
+    Count prompt/completion tokens from a Gemini response body, if present.
+    """
+    usage = data.get("usageMetadata") if isinstance(data, dict) else None
+    if not usage:
+        return
+    if usage.get("promptTokenCount"):
+        LLM_TOKENS.inc("prompt", amount=usage["promptTokenCount"])
+    if usage.get("candidatesTokenCount"):
+        LLM_TOKENS.inc("completion", amount=usage["candidatesTokenCount"])
+
+
+# -------------------- MongoDB command monitoring --------------------
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6, event.command_name, "succeeded")
+
+    def failed(self, event):
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6, event.command_name, "failed")
+
+
+def mongo_event_listeners(app):
+    """
+    Listeners to pass to mongo.init_app (pymongo registers them per client).
+    """
+    return [MongoCommandMetrics()] if app.config.get("METRICS_ENABLED", True) else []
+
+
+# -------------------- Flask wiring --------------------
+def _start_request_timer():
+    g._metrics_start = time.perf_counter()
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+
+
+def _observe_request(response):
+    start = g.get("_metrics_start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, request.method, route, str(response.status_code))
+    return response
+
+
+def _end_request(exc=None):
+    if g.pop("_metrics_start", None) is not None:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+
+
+def _component_collector(app):
+    def collect():
+        sink = app.extensions.get("log_sink")
+        if sink is not None:
+            yield ("log_sink_entries_total", "counter", "Buffered log sink counters.",
+                   [({"event": k}, v) for k, v in sink.stats().items() if k != "queued"])
+            yield ("log_sink_queued", "gauge", "Log entries waiting to be written.",
+                   [({}, sink.stats().get("queued", 0))])
+
+        gemini = app.extensions.get("gemini") or {}
+        if gemini.get("http_client") is not None:
+            yield ("llm_http_pool_events_total", "counter", "Gemini connection pool counters.",
+                   [({"event": k}, v) for k, v in gemini["http_client"].stats.snapshot().items()])
+
+        if gemini.get("async_http_client") is not None:
+            yield ("llm_async_http_pool_events_total", "counter", "Gemini asyncio client counters (ASGI mode).",
+                   [({"event": k}, v) for k, v in gemini["async_http_client"].stats.snapshot().items()])
+
+        if gemini.get("llm_guard") is not None:
+            stats = gemini["llm_guard"].stats()
+            limiter, breaker = stats["limiter"], stats["breaker"]
+            yield ("llm_concurrency_limit", "gauge", "Adaptive limit on Gemini calls in flight.",
+                   [({}, limiter["limit"])])
+            yield ("llm_calls_in_flight", "gauge", "Gemini calls holding a limiter slot.",
+                   [({}, limiter["in_flight"])])
+            yield ("llm_calls_waiting", "gauge", "Gemini calls queued for a limiter slot.",
+                   [({}, limiter["waiting"])])
+            yield ("llm_limiter_events_total", "counter", "Limiter slots granted/queued/rejected and limit changes.",
+                   [({"event": k}, limiter[k]) for k in ("granted", "queued", "rejected", "increased", "decreased")])
+            yield ("llm_circuit_state", "gauge", "Circuit breaker state (1 = current).",
+                   [({"state": s}, int(breaker["state"] == s)) for s in ("closed", "half_open", "open")])
+            yield ("llm_circuit_events_total", "counter", "Circuit breaker transitions and fast failures.",
+                   [({"event": k}, breaker[k]) for k in ("opened", "closed", "rejected")])
+
+        if gemini.get("response_cache") is not None:
+            stats = gemini["response_cache"].stats()
+            yield ("ai_response_cache_events_total", "counter", "AI response cache counters.",
+                   [({"event": k}, v) for k, v in stats.items() if k != "size"])
+            yield ("ai_response_cache_size", "gauge", "Entries in the in-process AI response cache.",
+                   [({}, stats.get("size", 0))])
+
+        similar_index = app.extensions.get("similar_task_index")
+        if similar_index is not None:
+            stats = similar_index.stats()
+            yield ("similar_task_index_vectors", "gauge", "Task vectors held in memory.",
+                   [({}, stats["vectors"])])
+            yield ("similar_task_index_users", "gauge", "Users whose task vectors are in memory.",
+                   [({}, stats["users"])])
+
+        user_cache = app.extensions.get("user_cache")
+        if user_cache is not None:
+            stats = user_cache.stats()
+            yield ("user_cache_events_total", "counter", "User cache lookups, writes and removals.",
+                   [({"event": k}, stats[k]) for k in
+                    ("hits", "misses", "writes", "invalidations", "evictions", "expired", "skipped_fills")])
+            yield ("user_cache_hit_ratio", "gauge", "User cache hits / lookups since start.",
+                   [({}, stats["hit_rate"])])
+            yield ("user_cache_size", "gauge", "User documents in the in-process cache.",
+                   [({}, stats["size"])])
+
+        invalidator = app.extensions.get("user_cache_invalidator")
+        if invalidator is not None:
+            stats = invalidator.stats()
+            yield ("user_cache_invalidation_mode", "gauge", "How other processes' user writes are followed (1 = current).",
+                   [({"mode": m}, int(stats["mode"] == m)) for m in ("change_stream", "poll")])
+            yield ("user_cache_invalidation_events_total", "counter", "Change notifications, polls and errors.",
+                   [({"event": k}, stats[k]) for k in ("notifications", "polls", "errors")])
+
+        scheduler = app.extensions.get("task_scheduler")
+        if scheduler is not None:
+            yield ("scheduler_queued_runs", "gauge", "Runs waiting in the scheduler heap.",
+                   [({}, scheduler.queued)])
+    return collect
+
+
+def init_metrics(app):
+    """
+    Time every request and register the component collectors (METRICS_ENABLED).
+    """
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    app.before_request(_start_request_timer)
+    app.after_request(_observe_request)
+    app.teardown_request(_end_request)
+    REGISTRY.set_collector("components", _component_collector(app))
+
+
+def render_metrics():
+    return REGISTRY.render()
@@ -0,0 +1,111 @@
+"""
+Micro-batching of small independent calls.
+
+MicroBatcher collects items submitted from many threads and hands them to
+`send(key, items)` in groups: items with the same key (e.g. the same user)
+go together, and a group is sent once it holds `max_items` items or
+`max_weight` total weight (e.g. prompt tokens), or when its first item has
+waited `window` seconds. `send` returns one result per item, in order; each
+submit() gets a Future resolved with its own result (or the exception
+`send` raised). Groups are sent on a small pool, so a slow call does not
+hold up the next group.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+__all__ = ["MicroBatcher"]
+
+
+class _Group:
+    __slots__ = ("key", "items", "futures", "weight", "deadline")
+
+    def __init__(self, key, deadline):
+        self.key = key
+        self.items = []
+        self.futures = []
+        self.weight = 0
+        self.deadline = deadline
+
+
+class MicroBatcher:
+
+    def __init__(self, send, max_items=8, max_weight=None, window=0.02, max_in_flight=8, name="micro-batch"):
+        self.send = send
+        self.max_items = max(1, max_items)
+        self.max_weight = max_weight
+        self.window = window
+        self.name = name
+
+        self._lock = threading.Condition()
+        self._groups = {}  # key -> _Group still collecting
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=name)
+        self._flusher = None
+        self._stats = {"submitted": 0, "batches": 0, "batched_items": 0, "singles": 0}
+
+    def submit(self, item, key=None, weight=1):
+        """
+        Queue `item`; returns a Future with its result.
+        """
+        future = Future()
+        with self._lock:
+            self._stats["submitted"] += 1
+            group = self._groups.get(key)
+            if group is not None and self.max_weight is not None and group.weight + weight > self.max_weight:
+                # Would overflow: send what is there and start a new group
+                self._dispatch(self._groups.pop(key))
+                group = None
+            if group is None:
+                group = self._groups[key] = _Group(key, time.monotonic() + self.window)
+                self._ensure_flusher()
+            group.items.append(item)
+            group.futures.append(future)
+            group.weight += weight
+            if len(group.items) >= self.max_items:
+                self._dispatch(self._groups.pop(key))
+            else:
+                self._lock.notify()
+        return future
+
+    def _ensure_flusher(self):
+        # Caller holds self._lock
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name=f"{self.name}-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        with self._lock:
+            while True:
+                if not self._groups:
+                    self._lock.wait()
+                    continue
+                now = time.monotonic()
+                for key in [key for key, group in self._groups.items() if group.deadline <= now]:
+                    self._dispatch(self._groups.pop(key))
+                if self._groups:
+                    self._lock.wait(max(0.0, min(group.deadline for group in self._groups.values()) - now))
+
+    def _dispatch(self, group):
+        # Caller holds self._lock
+        if len(group.items) > 1:
+            self._stats["batches"] += 1
+            self._stats["batched_items"] += len(group.items)
+        else:
+            self._stats["singles"] += 1
+        self._pool.submit(self._run, group)
+
+    def _run(self, group):
+        try:
+            results = self.send(group.key, group.items)
+            if len(results) != len(group.items):
+                raise RuntimeError(f"{self.name}: send returned {len(results)} results for {len(group.items)} items")
+        except BaseException as e:
+            for future in group.futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(group.futures, results):
+            future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, collecting=sum(len(group.items) for group in self._groups.values()))
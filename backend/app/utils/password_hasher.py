@@ -0,0 +1,93 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+from flask import current_app
+
+__all__ = ["HasherBusy", "PasswordHasher", "init_password_hasher", "get_password_hasher"]
+
+
+class HasherBusy(Exception):
+    """
+    Raised when the hashing pool and its queue are full, or a hash waited
+    longer than the timeout; routes answer 429.
+    """
+
+    def __init__(self, retry_after=1):
+        super().__init__("Password hashing is saturated, try again shortly")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, fixed-size thread pool (bcrypt releases the GIL,
+    so hashes run in parallel) instead of on request threads. At most
+    `workers + max_queue` hashes may be running or waiting; beyond that
+    callers get HasherBusy straight away rather than queueing behind a login storm.
+    """
+
+    def __init__(self, rounds=12, workers=None, max_queue=None, timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers * 4 if max_queue is None else max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # Still queued: drop it so it does not run for a caller that is gone
+            future.cancel()
+            raise HasherBusy() from None
+
+    def hash_password(self, password: str) -> bytes:
+        return self._run(self._hash, password.encode("utf-8"), self.rounds)
+
+    def verify_password(self, password: str, hashed) -> bool:
+        if isinstance(hashed, str):
+            hashed = hashed.encode("utf-8")
+        return self._run(bcrypt.checkpw, password.encode("utf-8"), hashed)
+
+    def needs_rehash(self, hashed) -> bool:
+        """
+        True if `hashed` was made with a different work factor than configured.
+        """
+        if isinstance(hashed, str):
+            hashed = hashed.encode("utf-8")
+        try:
+            return int(hashed.split(b"$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    @staticmethod
+    def _hash(password, rounds):
+        return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def init_password_hasher(app):
+    hasher = PasswordHasher(
+        rounds=app.config.get("BCRYPT_ROUNDS", 12),
+        workers=app.config.get("BCRYPT_WORKERS"),
+        max_queue=app.config.get("BCRYPT_MAX_QUEUE"),
+        timeout=app.config.get("BCRYPT_TIMEOUT", 10.0),
+    )
+    app.extensions["password_hasher"] = hasher
+    return hasher
+
+
+def get_password_hasher():
+    return current_app.extensions["password_hasher"]
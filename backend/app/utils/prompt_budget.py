@@ -0,0 +1,181 @@
+"""
+Token counting and budgets for LLM prompts.
+
+Tokens are counted locally: with tiktoken when it is installed and its
+cl100k_base encoding file is already in tiktoken's cache (TIKTOKEN_CACHE_DIR;
+close enough to Gemini's tokenizer for budgeting), otherwise with an
+estimate of about one token per 4 characters of a word plus one per
+punctuation mark, which errs on the high side for English text. The
+encoding is never downloaded here: tiktoken would do that without a
+timeout on the request path. Fill the cache at build time instead, by
+calling tiktoken.get_encoding("cl100k_base") with TIKTOKEN_CACHE_DIR set.
+
+fit_to_budget shortens text that is over its budget, either by keeping the
+head and the tail ("truncate") or by keeping the highest-scoring sentences
+("summarize", extractive: no extra LLM call).
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from collections import Counter
+
+from app.utils.logger import get_logger, log_event
+from app.utils.text_search import tokenize
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to the local estimate
+    tiktoken = None
+
+__all__ = ["count_tokens", "truncate_to_tokens", "summarize_to_tokens", "fit_to_budget", "OVERFLOW_MODES"]
+
+logger = get_logger(__name__)
+
+OVERFLOW_MODES = ("truncate", "summarize")
+
+TRUNCATION_MARKER = "\n[...]\n"
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+_ENCODING_URL = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+
+_encoding = None  # False once loading it failed
+
+
+def _encoding_cached():
+    # Where tiktoken caches the encoding file (see tiktoken.load.read_file_cached)
+    cache_dir = os.getenv("TIKTOKEN_CACHE_DIR", os.getenv("DATA_GYM_CACHE_DIR"))
+    if cache_dir is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    return bool(cache_dir) and os.path.exists(
+        os.path.join(cache_dir, hashlib.sha1(_ENCODING_URL.encode()).hexdigest())
+    )
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        if tiktoken is None:
+            _encoding = False
+        elif not _encoding_cached():
+            log_event(logger, logging.WARNING, "tiktoken_unavailable", error="cl100k_base encoding is not cached")
+            _encoding = False
+        else:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # e.g. a corrupt cache file: estimate instead
+                log_event(logger, logging.WARNING, "tiktoken_unavailable", error=str(e))
+                _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    Number of tokens in `text` (exact with tiktoken, estimated without).
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(_piece_tokens(piece) for piece in _PIECE.findall(text))
+
+
+def _piece_tokens(piece):
+    return -(-len(piece) // 4)
+
+
+def _head(text, tokens):
+    # The first `tokens` tokens of text, cut at a token boundary
+    if tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+    kept, end = 0, 0
+    for match in _PIECE.finditer(text):
+        kept += _piece_tokens(match.group())
+        if kept > tokens:
+            break
+        end = match.end()
+    return text[:end]
+
+
+def _tail(text, tokens):
+    if tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[-tokens:])
+    kept, start = 0, len(text)
+    for match in reversed(list(_PIECE.finditer(text))):
+        kept += _piece_tokens(match.group())
+        if kept > tokens:
+            break
+        start = match.start()
+    return text[start:]
+
+
+def truncate_to_tokens(text, budget, tail_share=0.25):
+    """
+    `text` cut to at most `budget` tokens, keeping the beginning and (with
+    `tail_share` of the budget) the end, joined by a "[...]" marker.
+    """
+    if count_tokens(text) <= budget:
+        return text
+    budget -= count_tokens(TRUNCATION_MARKER)
+    if budget <= 0:
+        return ""
+    tail_tokens = int(budget * tail_share)
+    head = _head(text, budget - tail_tokens).rstrip()
+    tail = _tail(text, tail_tokens).lstrip()
+    return head + TRUNCATION_MARKER + tail if tail else head + TRUNCATION_MARKER.rstrip()
+
+
+def summarize_to_tokens(text, budget):
+    """
+    Extractive summary of `text` in at most `budget` tokens: the first
+    sentence, then the sentences whose words are most frequent in the whole
+    text, in their original order. Falls back to truncation when sentences
+    are too long to pick from.
+    """
+    if count_tokens(text) <= budget:
+        return text
+    sentences = [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+    if len(sentences) < 2:
+        return truncate_to_tokens(text, budget)
+
+    frequency = Counter(tokenize(text))
+
+    def score(sentence):
+        terms = tokenize(sentence)
+        return sum(frequency[term] for term in terms) / (len(terms) + 1) if terms else 0.0
+
+    costs = [count_tokens(sentence) + 1 for sentence in sentences]
+    order = [0] + sorted(range(1, len(sentences)), key=lambda i: score(sentences[i]), reverse=True)
+    chosen, used = set(), 0
+    for i in order:
+        if used + costs[i] <= budget:
+            chosen.add(i)
+            used += costs[i]
+    if not chosen:
+        return truncate_to_tokens(text, budget)
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+def fit_to_budget(text, budget, mode="truncate"):
+    """
+    `text` if it fits in `budget` tokens, else shortened with `mode`
+    ("truncate" or "summarize"). Returns (text, shortened).
+    """
+    if mode not in OVERFLOW_MODES:
+        raise ValueError(f"Unknown overflow mode: {mode}")
+    if count_tokens(text) <= budget:
+        return text, False
+    if mode == "summarize":
+        return summarize_to_tokens(text, budget), True
+    return truncate_to_tokens(text, budget), True
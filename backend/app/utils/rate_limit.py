@@ -0,0 +1,44 @@
+import threading
+import time
+
+__all__ = ["UserRateLimiter"]
+
+
+class UserRateLimiter:
+    """
+    Per-user token bucket. Each user may start up to `rate_per_minute` units
+    of work per minute, with bursts up to `burst` (defaults to the per-minute rate).
+    Buckets are process-local.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else rate_per_minute)
+        self._buckets = {}  # user_id -> (tokens, last_refill)
+        self._lock = threading.Lock()
+
+    def _refill(self, user_id, now):
+        tokens, last = self._buckets.get(user_id, (self.capacity, now))
+        return min(self.capacity, tokens + (now - last) * self.rate)
+
+    def acquire(self, user_id, requested=1):
+        """
+        Take up to `requested` tokens; returns how many were granted (0..requested).
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._refill(user_id, now)
+            granted = min(int(tokens), requested)
+            self._buckets[user_id] = (tokens - granted, now)
+            return granted
+
+    def retry_after(self, user_id):
+        """
+        Seconds until at least one token is available for the user.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._refill(user_id, now)
+        if tokens >= 1 or self.rate <= 0:
+            return 0
+        return (1 - tokens) / self.rate
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+from app.utils.logger import get_logger, log_event
+
+__all__ = ["ResponseCache", "make_cache_key"]
+
+logger = get_logger(__name__)
+
+
+def make_cache_key(prompt: str, model: str) -> str:
+    """
+    Hash of the model name and the whitespace-normalised prompt, so prompts
+    that differ only in spacing/line breaks share an entry.
+    """
+    normalized = " ".join((prompt or "").split())
+    return hashlib.sha256(f"{model or ''}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of LLM responses:
+    - a bounded in-memory LRU (per process)
+    - an optional Mongo collection shared by all processes, expired by a TTL index
+    Both tiers honour the same TTL. After a Mongo error the Mongo tier is
+    skipped for `mongo_retry_seconds`, so an outage doesn't cost every call a
+    server-selection timeout.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=86400, collection_getter=None, mongo_retry_seconds=30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._collection_getter = collection_getter
+        self.mongo_retry_seconds = mongo_retry_seconds
+        self._mongo_retry_at = 0.0  # monotonic; Mongo tier skipped until then
+        self._entries = OrderedDict()  # key -> (expires_at monotonic, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "mongo_hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def collection(self):
+        """
+        The Mongo tier, or None if there is none or it failed recently (the
+        cache then works from memory alone until the retry time). The TTL
+        index on expires_at is declared in app.models.indexes.
+        """
+        if self._collection_getter is None or time.monotonic() < self._mongo_retry_at:
+            return None
+        try:
+            return self._collection_getter()
+        except PyMongoError as e:
+            self._mongo_failed("response_cache_unavailable", e)
+            return None
+
+    def _mongo_failed(self, event, error):
+        self._mongo_retry_at = time.monotonic() + self.mongo_retry_seconds
+        log_event(logger, logging.WARNING, event, error=str(error), retry_in=self.mongo_retry_seconds)
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self._stats[name] += 1
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._entries[key]
+
+        value, ttl = self._get_from_mongo(key)
+        if value is not None:
+            self._count("hits", "mongo_hits")
+            # Only for what is left of the entry's TTL, not a fresh one
+            self._set_memory(key, value, ttl)
+            return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        self._set_memory(key, value)
+        collection = self.collection
+        if collection is None:
+            return
+        try:
+            collection.update_one(
+                {"_id": key},
+                {"$set": {
+                    "value": value,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+                }},
+                upsert=True,
+            )
+        except PyMongoError as e:
+            self._mongo_failed("response_cache_write_failed", e)
+
+    def _set_memory(self, key, value, ttl_seconds=None):
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _get_from_mongo(self, key):
+        """
+        (value, seconds until it expires), or (None, None) on a miss.
+        """
+        collection = self.collection
+        if collection is None:
+            return None, None
+        now = datetime.utcnow()
+        try:
+            # The TTL monitor only runs once a minute, so check expiry here too
+            doc = collection.find_one({"_id": key, "expires_at": {"$gt": now}})
+        except PyMongoError as e:
+            self._mongo_failed("response_cache_read_failed", e)
+            return None, None
+        if not doc:
+            return None, None
+        return doc.get("value"), (doc["expires_at"] - now).total_seconds()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        collection = self.collection
+        if collection is not None:
+            try:
+                collection.delete_one({"_id": key})
+            except PyMongoError as e:
+                self._mongo_failed("response_cache_write_failed", e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        return stats
@@ -0,0 +1,309 @@
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import click
+from flask import current_app
+
+from app.repositories import get_repositories
+from app.utils.metrics import SCHEDULED_RUNS
+from app.utils.logger import get_logger, log_event
+
+__all__ = [
+    "TaskScheduler", "init_scheduler", "start_scheduler", "ensure_scheduler_started", "retry_delay",
+    "schedule_task_run", "backfill_next_runs", "register_scheduler_commands",
+]
+
+logger = get_logger(__name__)
+
+# Fields the scheduler needs from a due task
+_DUE_FIELDS = ["task_id", "user_id", "next_run_at"]
+
+
+def retry_delay(attempt, base_seconds, max_seconds):
+    """
+    Exponential backoff for the n-th auto_retry (0-based): base * 2^n, capped.
+    """
+    return min(base_seconds * (2 ** attempt), max_seconds)
+
+
+class TaskScheduler:
+    """
+    Runs tasks whose `schedule` is recurring when their next_run_at comes due.
+
+    Upcoming runs sit in a heap ordered by next_run_at, so the loop sleeps
+    exactly until the earliest one instead of scanning the tasks collection.
+    The heap is (re)filled from the next_run_at index every horizon/2 seconds
+    with the tasks due within the horizon, which also picks up tasks created or
+    rescheduled by other processes.
+
+    Before running a task the scheduler takes a lease on it with one atomic
+    update (next_run_at unchanged, no live lease), so when several app
+    instances schedule the same collection each run happens exactly once.
+    """
+
+    def __init__(self, app, concurrency=4, lease_seconds=300, horizon_seconds=300,
+                 retry_max=5, retry_base_seconds=30, retry_max_seconds=3600):
+        self.app = app
+        self.concurrency = max(1, int(concurrency))
+        self.lease = timedelta(seconds=lease_seconds)
+        self.horizon = timedelta(seconds=horizon_seconds)
+        self.retry_max = retry_max
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+        self._cond = threading.Condition()
+        self._heap = []  # (next_run_at, task_id, user_id)
+        self._queued = {}  # task_id -> next_run_at of its live heap entry
+        self._running = set()
+        self._next_refresh = datetime.min
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def queued(self):
+        with self._cond:
+            return len(self._queued)
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="scheduler")
+        self._thread = threading.Thread(target=self._loop, name="task-scheduler", daemon=True)
+        self._thread.start()
+        log_event(logger, logging.INFO, "scheduler_started", concurrency=self.concurrency)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=timeout is None)
+
+    def join(self):
+        try:
+            while self.running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def schedule(self, task_id, user_id, run_at):
+        """
+        Put a run on the heap. A later call for the same task supersedes the
+        earlier entry, which is skipped when popped.
+        """
+        with self._cond:
+            if task_id in self._running or self._queued.get(task_id) == run_at:
+                return
+            self._queued[task_id] = run_at
+            heapq.heappush(self._heap, (run_at, task_id, user_id))
+            self._cond.notify()
+
+    def refresh(self, now=None):
+        now = now or datetime.utcnow()
+        limit = max(self.concurrency * 100, 500)
+        for task in get_repositories().tasks.find_due(now + self.horizon, limit=limit, fields=_DUE_FIELDS):
+            self.schedule(task["task_id"], task["user_id"], task["next_run_at"])
+        self._next_refresh = now + self.horizon / 2
+
+    # -------------------- Loop --------------------
+    def _loop(self):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                now = datetime.utcnow()
+                if now >= self._next_refresh:
+                    try:
+                        self.refresh(now)
+                    except Exception as e:
+                        log_event(logger, logging.ERROR, "scheduler_refresh_failed", error=str(e))
+                        self._next_refresh = now + timedelta(seconds=5)
+
+                with self._cond:
+                    due = self._pop_due(now)
+                    if not due:
+                        self._cond.wait(self._wait_seconds(now))
+
+                for run_at, task_id, user_id in due:
+                    self._executor.submit(self._dispatch, task_id, user_id, run_at)
+
+    def _pop_due(self, now):
+        # Caller holds self._cond
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(self._running) < self.concurrency:
+            run_at, task_id, user_id = heapq.heappop(self._heap)
+            if self._queued.get(task_id) != run_at:
+                continue  # superseded entry
+            del self._queued[task_id]
+            self._running.add(task_id)
+            due.append((run_at, task_id, user_id))
+        return due
+
+    def _wait_seconds(self, now):
+        # Caller holds self._cond; wake for the earliest run, a refresh, or a free slot
+        wake_at = self._next_refresh
+        if self._heap and len(self._running) < self.concurrency:
+            wake_at = min(wake_at, self._heap[0][0])
+        return max((wake_at - now).total_seconds(), 0.01)
+
+    # -------------------- One run --------------------
+    def _dispatch(self, task_id, user_id, run_at):
+        try:
+            with self.app.app_context():
+                self._run(task_id, user_id, run_at)
+        except Exception as e:
+            SCHEDULED_RUNS.inc("error")
+            log_event(logger, logging.ERROR, "scheduled_run_failed", task_id=task_id, error=str(e))
+        finally:
+            with self._cond:
+                self._running.discard(task_id)
+                self._cond.notify()
+
+    def _run(self, task_id, user_id, run_at):
+        # Imported here to avoid a circular import at app start-up
+        from app.models.task_model import set_task_status
+        from app.utils.langchain_tools import run_agent_for_task
+
+        tasks = get_repositories().tasks
+        now = datetime.utcnow()
+        task = tasks.claim_due(task_id, user_id, run_at, self.owner, now + self.lease, now)
+        if task is None:
+            # Rescheduled, deleted, or leased by another instance
+            SCHEDULED_RUNS.inc("skipped")
+            return
+
+        deferred_until = None
+        try:
+            set_task_status(task_id, user_id, "running", last_run=now)
+            context = run_agent_for_task(task_id, user_id)
+            failed, deferred_until = bool(context.get("error")), context.get("deferred_until")
+        except Exception as e:
+            log_event(logger, logging.ERROR, "scheduled_run_error", task_id=task_id, error=str(e))
+            failed = True
+
+        fields = self.next_run_fields(task, failed, datetime.utcnow(), deferred_until, run_at)
+        SCHEDULED_RUNS.inc("deferred" if deferred_until else "failed" if failed else "completed")
+        if tasks.release(task_id, user_id, self.owner, fields) and fields["next_run_at"] is not None:
+            if fields["next_run_at"] <= datetime.utcnow() + self.horizon:
+                with self._cond:
+                    self._running.discard(task_id)
+                self.schedule(task_id, user_id, fields["next_run_at"])
+
+    def next_run_fields(self, task, failed, now, deferred_until=None, run_at=None):
+        """
+        A deferred run (LLM backend unavailable) comes back at deferred_until
+        without using up an auto_retry. After a failed run with auto_retry,
+        back off and try again (up to retry_max times); otherwise the next
+        regular run per the schedule. Regular runs are counted from the slot
+        the run was scheduled for (`run_at`, or for a retry the run_slot it
+        stands in for), not from when it finished, so a daily task does not
+        drift later by its run time every day.
+        """
+        from app.models.task_model import next_scheduled_run
+
+        retries = task.get("retry_count") or 0
+        slot = task.get("run_slot") or run_at or now
+        if deferred_until is not None:
+            return {"next_run_at": deferred_until, "retry_count": retries, "run_slot": slot}
+        if failed and task.get("auto_retry") and retries < self.retry_max:
+            delay = retry_delay(retries, self.retry_base_seconds, self.retry_max_seconds)
+            return {"next_run_at": now + timedelta(seconds=delay), "retry_count": retries + 1, "run_slot": slot}
+        return {"next_run_at": next_scheduled_run(task.get("schedule"), slot, now), "retry_count": 0, "run_slot": None}
+
+
+# -------------------- App wiring --------------------
+def init_scheduler(app):
+    app.extensions["task_scheduler"] = None
+    if app.config.get("SCHEDULER_ENABLED", True) and app.config.get("SCHEDULER_IN_PROCESS", True):
+        app.before_request(ensure_scheduler_started)
+
+
+def start_scheduler(app):
+    scheduler = app.extensions.get("task_scheduler")
+    if scheduler is None:
+        scheduler = TaskScheduler(
+            app,
+            concurrency=app.config.get("SCHEDULER_CONCURRENCY", 4),
+            lease_seconds=app.config.get("SCHEDULER_LEASE_SECONDS", 300),
+            horizon_seconds=app.config.get("SCHEDULER_HORIZON_SECONDS", 300),
+            retry_max=app.config.get("AUTO_RETRY_MAX", 5),
+            retry_base_seconds=app.config.get("AUTO_RETRY_BASE_SECONDS", 30),
+            retry_max_seconds=app.config.get("AUTO_RETRY_MAX_SECONDS", 3600),
+        )
+        app.extensions["task_scheduler"] = scheduler
+    return scheduler.start()
+
+
+def schedule_task_run(task_id, user_id, run_at):
+    """
+    Tell this process's scheduler about a next_run_at just written (e.g. a
+    deferred run) so it need not wait for the next refresh. Other processes
+    pick it up from the index on their next refresh.
+    """
+    scheduler = current_app.extensions.get("task_scheduler")
+    if scheduler is not None and scheduler.running and run_at <= datetime.utcnow() + scheduler.horizon:
+        scheduler.schedule(task_id, user_id, run_at)
+
+
+_start_lock = threading.Lock()
+
+
+def ensure_scheduler_started():
+    """
+    Start the in-process scheduler on the first request. As with the agent
+    workers, starting lazily keeps CLI commands and the debug reloader's parent
+    process from scheduling runs.
+    """
+    app = current_app._get_current_object()
+    scheduler = app.extensions.get("task_scheduler")
+    if scheduler is not None and scheduler.running:
+        return
+    with _start_lock:
+        start_scheduler(app)
+
+
+# -------------------- Backfill --------------------
+def backfill_next_runs(batch_size=500):
+    """
+    Give recurring tasks written before next_run_at existed their next run:
+    the next slot after their last run (or creation) that is still ahead.
+    Returns the number of tasks scheduled.
+    """
+    from app.models.task_model import SCHEDULE_INTERVALS, next_scheduled_run
+
+    tasks = get_repositories().tasks
+    fields = ["task_id", "user_id", "schedule", "created_at", "last_run"]
+    scheduled = 0
+    while True:
+        batch = tasks.find_unscheduled(list(SCHEDULE_INTERVALS), limit=batch_size, fields=fields)
+        if not batch:
+            return scheduled
+        now = datetime.utcnow()
+        for task in batch:
+            after = task.get("last_run") or task.get("created_at") or now
+            run_at = next_scheduled_run(task["schedule"], after, now)
+            tasks.update(task["task_id"], task["user_id"], {"next_run_at": run_at, "retry_count": 0, "run_slot": None})
+            scheduled += 1
+
+
+def register_scheduler_commands(app):
+    @app.cli.command("backfill-task-schedules")
+    @click.option("--batch-size", default=500, show_default=True, help="Tasks read per query.")
+    def backfill_task_schedules_command(batch_size):
+        """Set next_run_at on daily/weekly tasks that have none."""
+        click.echo(f"Scheduled {backfill_next_runs(batch_size)} task(s)")
@@ -0,0 +1,126 @@
+"""
+Response serialization for the list endpoints.
+
+- Field specs: each response key maps to (document field, default, converter).
+  The document fields double as the Mongo projection, so only what a response
+  shows is fetched and copied.
+- Date formatting avoids strftime: day strings are cached (most documents in a
+  page share a few days) and timestamps use isoformat, ~4x faster.
+- FastJSONProvider encodes responses with orjson when it is installed and falls
+  back to the stdlib encoder otherwise; both produce the same JSON values.
+"""
+import json
+from datetime import datetime
+from functools import lru_cache
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+__all__ = [
+    "FastJSONProvider", "init_json_provider", "dumps",
+    "format_date", "format_datetime", "compile_serializer", "projection_for",
+]
+
+
+# -------------------- Dates --------------------
+@lru_cache(maxsize=4096)
+def _day_string(day):
+    return day.strftime("%Y-%m-%d")
+
+
+def format_date(value):
+    """
+    "%Y-%m-%d" of a date/datetime, cached per day.
+    """
+    return _day_string(value.date() if isinstance(value, datetime) else value)
+
+
+def format_datetime(value):
+    """
+    "%Y-%m-%d %H:%M:%S" of a datetime.
+    """
+    if value.tzinfo is None and value.year >= 1000:
+        return value.isoformat(" ", "seconds")
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# -------------------- Field specs --------------------
+def compile_serializer(spec, fields):
+    """
+    Build doc -> response dict for the given response keys of `spec`
+    ({key: (document field, default, converter or None)}). Plain fields are a
+    dict lookup, and `str` is only called on values that are not strings yet;
+    other converters are called for every document.
+    """
+    plan = [(name,) + tuple(spec[name]) for name in fields]
+    plain = [(name, field, default) for name, field, default, convert in plan if convert is None]
+    if len(plain) == len(plan):
+        def serialize(doc):
+            get = doc.get
+            return {name: get(field, default) for name, field, default in plain}
+        return serialize
+
+    def serialize(doc):
+        get = doc.get
+        out = {}
+        for name, field, default, convert in plan:
+            value = get(field, default)
+            if convert is None or (convert is str and value.__class__ is str):
+                out[name] = value
+            else:
+                out[name] = convert(value)
+        return out
+    return serialize
+
+
+def projection_for(spec, fields, always=()):
+    """
+    Document fields needed to serialize `fields`, plus `always`, in order.
+    """
+    return list(dict.fromkeys(list(always) + [spec[name][0] for name in fields]))
+
+
+# -------------------- JSON --------------------
+_ORJSON_OPTIONS = (
+    (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS)
+    if orjson else 0
+)
+_COMPACT = {"separators": (",", ":")}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider with orjson for encoding. Datetimes, dataclasses and
+    anything orjson rejects go through Flask's own `default`, so values are
+    rendered exactly as before (e.g. datetimes as HTTP dates).
+    """
+
+    def dumps(self, obj, **kwargs):
+        # orjson only writes compact output; indent (debug mode) and other
+        # json.dumps arguments use the stdlib encoder
+        if orjson is None or kwargs not in ({}, _COMPACT):
+            return super().dumps(obj, **kwargs)
+        options = _ORJSON_OPTIONS | (orjson.OPT_SORT_KEYS if self.sort_keys else 0)
+        try:
+            return orjson.dumps(obj, default=self.default, option=options).decode("utf-8")
+        except (orjson.JSONEncodeError, TypeError):
+            # e.g. ints beyond 64 bits or mixed-type keys with sort_keys
+            return super().dumps(obj, **kwargs)
+
+
+def init_json_provider(app):
+    if app.config.get("JSON_FAST_ENCODER", True):
+        app.json = FastJSONProvider(app)
+
+
+def dumps(obj):
+    """
+    Compact JSON text for streamed payloads (NDJSON lines).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
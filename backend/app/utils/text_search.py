@@ -0,0 +1,56 @@
+"""
+Text handling shared by task search (GET /tasks/search) and the similar-task
+index: which task fields are searched and how much each counts, and the
+tokenizer the in-memory storage engine and the embeddings use.
+"""
+import re
+from collections import Counter
+
+__all__ = ["TASK_TEXT_WEIGHTS", "tokenize", "parse_search_query", "task_text_terms"]
+
+# Searched task fields and their weight in the relevance score (Mongo text index weights)
+TASK_TEXT_WEIGHTS = {"title": 10, "description": 4, "result": 1}
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+# Common English words Mongo's text index ignores (a subset of its list)
+STOP_WORDS = frozenset("""
+a about after all also an and any are as at be because been but by can could did do does
+for from had has have he her his how i if in into is it its just me more my no not of on
+or our out over she so some than that the their them then there these they this to up us
+was we were what when which who will with would you your
+""".split())
+
+
+def tokenize(text):
+    """
+    Lower-cased word tokens of `text` without stop words.
+    """
+    if not text:
+        return []
+    return [token for token in _TOKEN.findall(str(text).lower()) if token not in STOP_WORDS]
+
+
+def parse_search_query(query):
+    """
+    Split a search string like Mongo's $text does: "quoted phrases" must
+    appear, -terms must not, other terms match if any of them appear.
+    Returns (terms, phrases, excluded).
+    """
+    phrases = [phrase.lower() for phrase in re.findall(r'"([^"]+)"', query)]
+    rest = re.sub(r'"[^"]*"', " ", query).split()
+    excluded = {token for word in rest if word.startswith("-") for token in tokenize(word[1:])}
+    terms = [token for word in rest if not word.startswith("-") for token in tokenize(word)]
+    terms += [token for phrase in phrases for token in tokenize(phrase)]
+    return list(dict.fromkeys(terms)), phrases, excluded
+
+
+def task_text_terms(task):
+    """
+    {term: weighted frequency} over the searched fields of a task document.
+    """
+    terms = Counter()
+    for field, weight in TASK_TEXT_WEIGHTS.items():
+        for token in tokenize(task.get(field)):
+            terms[token] += weight
+    return terms
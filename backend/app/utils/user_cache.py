@@ -0,0 +1,251 @@
+"""
+Per-process cache of user documents (profile reads, login lookups by email).
+
+UserCache is a bounded LRU with a TTL, keyed by user_id with a secondary
+index on email. Writers update it in place (write-through), so a process
+reads its own writes. A lookup that missed only fills the cache if no write
+or invalidation happened while it was reading the database, so a slow read
+cannot put back a document that was just replaced.
+
+UserCacheInvalidator drops entries that other processes changed. Every user
+write bumps the user's "profile" counter in `user_versions`; the invalidator
+follows those bumps with a change stream (needs a replica set) or, failing
+that, by polling the changed_at.profile index. The TTL bounds staleness if
+notifications are missed.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo.errors import OperationFailure, PyMongoError
+from app.utils.logger import get_logger, log_event
+
+__all__ = ["UserCache", "UserCacheInvalidator", "INVALIDATION_MODES"]
+
+logger = get_logger(__name__)
+
+INVALIDATION_MODES = ("auto", "change_stream", "poll", "none")
+
+
+class UserCache:
+
+    def __init__(self, max_entries=10000, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # user_id -> (expires_at monotonic, doc)
+        self._emails = {}  # email -> user_id
+        self._generation = 0  # bumped by every write/invalidation
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "invalidations": 0, "evictions": 0,
+                       "expired": 0, "skipped_fills": 0}
+
+    # -------------------- reads --------------------
+    def get_by_id(self, user_id, loader):
+        """
+        The user document for `user_id`, from the cache or `loader(user_id)`.
+        """
+        return self._get(user_id, None, loader)
+
+    def get_by_email(self, email, loader):
+        return self._get(None, email, loader)
+
+    def _get(self, user_id, email, loader):
+        now = time.monotonic()
+        with self._lock:
+            key = user_id if email is None else self._emails.get(email)
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return dict(entry[1])
+                self._drop(key)
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            generation = self._generation
+
+        doc = loader(user_id if email is None else email)
+        if doc is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._store(doc)
+                else:
+                    self._stats["skipped_fills"] += 1
+        return doc
+
+    # -------------------- writes --------------------
+    def put(self, doc):
+        """
+        Cache a document just written (a new user).
+        """
+        with self._lock:
+            self._generation += 1
+            self._stats["writes"] += 1
+            self._store(doc)
+
+    def update(self, user_id, fields):
+        """
+        Apply `fields` (a $set just written) to the cached document, if any.
+        """
+        with self._lock:
+            self._generation += 1
+            self._stats["writes"] += 1
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._store(dict(entry[1], **fields))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generation += 1
+            if self._drop(user_id):
+                self._stats["invalidations"] += 1
+
+    def invalidate_all(self):
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._emails.clear()
+
+    def _store(self, doc):
+        # Caller holds self._lock
+        user_id = doc["user_id"]
+        self._drop(user_id)
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(doc))
+        if doc.get("email"):
+            self._emails[doc["email"]] = user_id
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _drop(self, user_id):
+        # Caller holds self._lock
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        email = entry[1].get("email")
+        if email and self._emails.get(email) == user_id:
+            del self._emails[email]
+        return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, size=len(self._entries),
+                        hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0)
+
+
+class UserCacheInvalidator:
+    """
+    Background thread that invalidates cache entries changed by other
+    processes. mode: "change_stream", "poll", or "auto" (change stream,
+    polling where the server has none). `versions` is the versions repository.
+    """
+
+    def __init__(self, cache, versions, mode="auto", poll_seconds=2.0, overlap_seconds=5.0, scope="profile"):
+        if mode not in INVALIDATION_MODES or mode == "none":
+            raise ValueError(f"Unknown invalidation mode: {mode}")
+        self.cache = cache
+        self.versions = versions
+        self.mode = mode
+        self.poll_seconds = poll_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.scope = scope
+        self.active_mode = None  # what is actually running: change_stream | poll
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"notifications": 0, "polls": 0, "errors": 0}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="user-cache-invalidator", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        if self.mode in ("auto", "change_stream"):
+            try:
+                self._watch()
+            except Exception as e:
+                # Unexpected failure of the stream itself: keep invalidating by polling
+                self._stats["errors"] += 1
+                log_event(logger, logging.WARNING, "user_cache_stream_failed", fallback="poll", error=repr(e))
+                self.cache.invalidate_all()
+        if not self._stop.is_set():
+            self._poll()
+
+    # -------------------- change stream --------------------
+    def _watch(self):
+        """
+        Follow the change stream until stopped. Returns if the server has no
+        change streams and polling may take over (mode "auto"), or if the
+        versions repository has none at all.
+        """
+        if not self.versions.supports_change_streams:
+            log_event(logger, logging.INFO, "user_cache_polling", poll_seconds=self.poll_seconds,
+                      reason="storage engine has no change streams")
+            return
+        resume_token = None
+        while not self._stop.is_set():
+            try:
+                with self.versions.watch(self.scope, resume_after=resume_token) as stream:
+                    self.active_mode = "change_stream"
+                    while not self._stop.is_set() and stream.alive:
+                        change = stream.try_next()
+                        resume_token = stream.resume_token
+                        if change is not None:
+                            self._stats["notifications"] += 1
+                            self.cache.invalidate(change["documentKey"]["_id"])
+            except OperationFailure as e:
+                if self.active_mode is None and self.mode == "auto":
+                    log_event(logger, logging.INFO, "user_cache_polling", poll_seconds=self.poll_seconds, reason=str(e))
+                    return
+                self._on_error(e)
+                resume_token = None
+            except PyMongoError as e:
+                self._on_error(e)
+
+    def _on_error(self, error):
+        # Changes may have been missed: start over from an empty cache
+        self._stats["errors"] += 1
+        log_event(logger, logging.WARNING, "user_cache_invalidation_error", error=str(error))
+        self.cache.invalidate_all()
+        self._stop.wait(self.poll_seconds)
+
+    # -------------------- polling --------------------
+    def _poll(self):
+        self.active_mode = "poll"
+        since = datetime.utcnow() - self.overlap
+        seen = {}  # user_id -> (counter, changed_at), for changes inside the overlap window
+        while not self._stop.wait(self.poll_seconds):
+            started = datetime.utcnow()
+            try:
+                changed = self.versions.changed_since(self.scope, since)
+            except Exception as e:
+                self._on_error(e)
+                continue
+            self._stats["polls"] += 1
+            for doc in changed:
+                version = (doc.get(self.scope, 0), doc["changed_at"])
+                # Docs re-read because of the overlap are only new if their counter moved
+                if seen.get(doc["_id"]) != version:
+                    seen[doc["_id"]] = version
+                    self._stats["notifications"] += 1
+                    self.cache.invalidate(doc["_id"])
+            since = started - self.overlap
+            seen = {user_id: version for user_id, version in seen.items() if version[1] > since}
+
+    def stats(self):
+        return dict(self._stats, mode=self.active_mode or "starting")
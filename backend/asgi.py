@@ -0,0 +1,12 @@
+from app.asgi import create_asgi_app
+
+# ASGI entry point: `uvicorn asgi:app` (uvicorn is not a dependency of run.py).
+# Same routes as run.py; agent runs await Gemini on the event loop.
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    import os
+
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", 8000)))
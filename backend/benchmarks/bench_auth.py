@@ -0,0 +1,115 @@
+"""
+Per-request cost of token_required, before and after the verified-token cache.
+
+    python -m benchmarks.bench_auth --requests 20000
+
+Drives a trivial protected route through Flask's test client and reports the
+mean time per request minus an unprotected route, i.e. the auth overhead:
+- legacy: the previous decorator (jwt.decode + four print() calls per request)
+- uncached: current decorator with JWT_CACHE_ENABLED=False
+- cached: current decorator with the verified-token cache
+print() output goes to os.devnull, as it would to a log file or pipe.
+"""
+import argparse
+import contextlib
+import datetime
+import os
+import time
+from functools import wraps
+
+import jwt
+from flask import Flask, current_app, g, jsonify, request
+
+from app.utils.jwt_helper import token_required
+
+SECRET = "bench-secret"
+
+
+def legacy_token_required(f):
+    # The decorator as it was before the token cache and structured logging
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        secret = current_app.config.get("JWT_SECRET", "default_secret_key")
+        auth_header = request.headers.get("Authorization", "")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            print("❌ Missing or malformed Authorization header")
+            return jsonify({"error": "Authorization header must start with 'Bearer'"}), 401
+        token = auth_header.split("Bearer ")[1].strip()
+        try:
+            print(f"🔑 [token_required] Using JWT_SECRET: {secret}")
+            print(f"🪪 Received Token: {token}")
+            decoded = jwt.decode(token, secret, algorithms=["HS256"])
+            print(f"✅ Token Decoded: {decoded}")
+            g.user_id = decoded.get("user_id")
+        except jwt.InvalidTokenError:
+            return jsonify({"error": "Invalid token"}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+
+def make_app(cache_enabled):
+    app = Flask("bench_auth")
+    app.config.update(
+        JWT_SECRET=SECRET,
+        JWT_CACHE_ENABLED=cache_enabled,
+        JWT_REVOCATION_BACKEND="memory",
+    )
+
+    @app.route("/open")
+    def open_route():
+        return "ok"
+
+    @app.route("/legacy")
+    @legacy_token_required
+    def legacy_route():
+        return "ok"
+
+    @app.route("/protected")
+    @token_required
+    def protected_route():
+        return "ok"
+
+    return app
+
+
+def time_requests(client, path, headers, n):
+    for _ in range(min(n, 200)):  # warm-up
+        client.get(path, headers=headers)
+    start = time.perf_counter()
+    for _ in range(n):
+        client.get(path, headers=headers)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10000)
+    args = parser.parse_args()
+
+    token = jwt.encode(
+        {"user_id": "bench-user", "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+        SECRET,
+        algorithm="HS256",
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for label, cache_enabled, path in [
+            ("baseline (no auth)", True, "/open"),
+            ("legacy", True, "/legacy"),
+            ("uncached", False, "/protected"),
+            ("cached", True, "/protected"),
+        ]:
+            client = make_app(cache_enabled).test_client()
+            results[label] = time_requests(client, path, headers, args.requests)
+
+    baseline = results["baseline (no auth)"]
+    print(f"{'mode':<20} {'per request':>12} {'auth overhead':>14}")
+    for label, per_request in results.items():
+        overhead = per_request - baseline
+        print(f"{label:<20} {per_request * 1e6:>10.1f}us {overhead * 1e6:>12.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Auth hashing throughput against the size of the bcrypt worker pool.
+
+    python -m benchmarks.bench_bcrypt --rounds 10 --ops 200
+
+For each pool size (1, 2, 4, ... up to the core count) a burst of concurrent
+callers hashes and then verifies passwords through PasswordHasher, and the
+hashes/second and verifies/second are reported with the speed-up over one worker.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.password_hasher import PasswordHasher
+
+
+def pool_sizes(cores):
+    size = 1
+    while size < cores:
+        yield size
+        size *= 2
+    yield cores
+
+
+def measure(hasher, fn, ops, callers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as callers_pool:
+        list(callers_pool.map(lambda _: fn(), range(ops)))
+    return ops / (time.perf_counter() - start)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt work factor")
+    parser.add_argument("--ops", type=int, default=100, help="operations per measurement")
+    parser.add_argument("--max-workers", type=int, default=cores)
+    args = parser.parse_args()
+
+    print(f"cores={cores} rounds={args.rounds} ops={args.ops}")
+    print(f"{'workers':>7} {'hash/s':>9} {'verify/s':>9} {'speed-up':>9}")
+    single = None
+    for workers in pool_sizes(args.max_workers):
+        # Queue deep enough that no call is shed: this measures capacity, not admission
+        hasher = PasswordHasher(rounds=args.rounds, workers=workers, max_queue=args.ops)
+        hashed = hasher.hash_password("benchmark-password")
+        hash_rate = measure(hasher, lambda: hasher.hash_password("benchmark-password"), args.ops, workers * 2)
+        verify_rate = measure(hasher, lambda: hasher.verify_password("benchmark-password", hashed), args.ops, workers * 2)
+        hasher.shutdown()
+
+        single = single or hash_rate
+        print(f"{workers:>7} {hash_rate:>9.1f} {verify_rate:>9.1f} {hash_rate / single:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
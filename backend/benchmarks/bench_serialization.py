@@ -0,0 +1,183 @@
+"""
+Cost of turning task and log documents into a JSON response body.
+
+    python -m benchmarks.bench_serialization --docs 50000
+
+For GET /tasks (all list fields), the single-task shape and GET /logs, times:
+- legacy: the previous per-document formatters (lambda per field, strftime)
+  encoded by Flask's stdlib JSON provider
+- current: compiled field specs and cached date formatting, encoded by
+  FastJSONProvider (orjson when installed)
+Both paths are checked to produce the same JSON values before timing.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.models.log_model import format_log
+from app.models.task_model import TASK_LIST_FIELDS, TASK_DETAIL_FIELDS, _serialize_task_detail
+from app.utils.serializers import FastJSONProvider, compile_serializer, orjson
+
+
+# The formatters as they were before app.utils.serializers
+LEGACY_TASK_FIELDS = {
+    "task_id": lambda t: t.get("task_id", ""),
+    "title": lambda t: t.get("title", ""),
+    "description": lambda t: t.get("description", ""),
+    "status": lambda t: t.get("status", "pending"),
+    "progress": lambda t: t.get("progress", 0),
+    "type": lambda t: t.get("type", "General"),
+    "priority": lambda t: t.get("priority", "Medium"),
+    "schedule": lambda t: t.get("schedule", "None"),
+    "notify": lambda t: t.get("notify", False),
+    "auto_retry": lambda t: t.get("auto_retry", False),
+    "createdAt": lambda t: t.get("created_at", datetime.utcnow()).strftime("%Y-%m-%d"),
+    "lastRun": lambda t: t.get("last_run").strftime("%Y-%m-%d %H:%M:%S") if t.get("last_run") else "Never",
+}
+
+
+def legacy_task_list(docs, fields):
+    formatters = [(f, LEGACY_TASK_FIELDS[f]) for f in fields]
+    return [{name: fmt(task) for name, fmt in formatters} for task in docs]
+
+
+def legacy_task_detail(task):
+    return {
+        "task_id": task.get("task_id", ""),
+        "title": task.get("title", ""),
+        "description": task.get("description", ""),
+        "status": task.get("status", "pending"),
+        "progress": task.get("progress", 0),
+        "type": task.get("type", "General"),
+        "priority": task.get("priority", "Medium"),
+        "schedule": task.get("schedule", "None"),
+        "notify": task.get("notify", False),
+        "auto_retry": task.get("auto_retry", False),
+        "use_cache": task.get("use_cache", True),
+        "createdAt": task.get("created_at", datetime.utcnow()).strftime("%Y-%m-%d"),
+        "lastRun": task.get("last_run").strftime("%Y-%m-%d %H:%M:%S") if task.get("last_run") else "Never"
+    }
+
+
+def legacy_log(log):
+    ts = log.get("timestamp")
+    if isinstance(ts, datetime):
+        ts_str = ts.strftime("%Y-%m-%d %H:%M:%S")
+    elif isinstance(ts, str):
+        ts_str = ts
+    else:
+        ts_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        "id": str(log.get("_id", "")),
+        "timestamp": ts_str,
+        "task": str(log.get("task_id", "Unknown Task")),
+        "type": str(log.get("type", "SYSTEM")),
+        "status": str(log.get("status", "SUCCESS")),
+        "duration": str(log.get("duration", "N/A")),
+        "details": str(log.get("ai_response", "")),
+        "user": str(log.get("user", "System")),
+        # Added to the /logs shape with agent-run token counts; passed through as stored
+        "tokens": log.get("tokens"),
+    }
+
+
+def make_docs(n, seed=42):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    tasks, logs = [], []
+    for i in range(n):
+        created = now - timedelta(seconds=rng.randint(0, 90 * 86400))
+        tasks.append({
+            "task_id": f"task-{i:06d}",
+            "user_id": "bench-user",
+            "title": f"Task {i}",
+            "description": "Summarize the quarterly report and draft follow-ups " * rng.randint(1, 3),
+            "status": rng.choice(["pending", "running", "completed", "error"]),
+            "progress": rng.randint(0, 100),
+            "type": rng.choice(["General", "Research", "Ops"]),
+            "priority": rng.choice(["Low", "Medium", "High"]),
+            "schedule": rng.choice(["None", "daily", "weekly"]),
+            "notify": rng.random() < 0.5,
+            "auto_retry": rng.random() < 0.5,
+            "use_cache": True,
+            "created_at": created,
+            "last_run": created + timedelta(minutes=5) if rng.random() < 0.7 else None,
+        })
+        logs.append({
+            "_id": ObjectId(),
+            "user_id": "bench-user",
+            "task_id": f"task-{i:06d}",
+            "ai_response": "Answer: " + "lorem ipsum " * rng.randint(5, 40),
+            "status": rng.choice(["completed", "error"]),
+            "timestamp": created + timedelta(minutes=6),
+        })
+        if rng.random() < 0.7:  # logs written before token counting have no "tokens"
+            logs[-1]["tokens"] = {"prompt": rng.randint(50, 800), "completion": rng.randint(20, 400),
+                                  "calls": 1, "estimated": False}
+    return tasks, logs
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask("bench_serialization")
+    stdlib_json, fast_json = DefaultJSONProvider(app), FastJSONProvider(app)
+    tasks, logs = make_docs(args.docs)
+
+    list_fields = list(TASK_LIST_FIELDS)
+    serialize_list = compile_serializer(TASK_LIST_FIELDS, list_fields)
+    cases = [
+        ("GET /tasks (all fields)",
+         lambda: legacy_task_list(tasks, list_fields),
+         lambda: [serialize_list(t) for t in tasks]),
+        ("task detail",
+         lambda: [legacy_task_detail(t) for t in tasks],
+         lambda: [_serialize_task_detail(t) for t in tasks]),
+        ("GET /logs",
+         lambda: [legacy_log(log) for log in logs],
+         lambda: [format_log(log) for log in logs]),
+    ]
+
+    print(f"{args.docs} documents, best of {args.repeat}; encoder: {'orjson' if orjson else 'stdlib'}")
+    print(f"{'payload':<24} {'path':<8} {'format':>9} {'encode':>9} {'total':>9} {'speed-up':>9}")
+    for label, legacy_format, current_format in cases:
+        legacy_body, current_body = legacy_format(), current_format()
+        assert json.loads(stdlib_json.dumps(legacy_body)) == json.loads(fast_json.dumps(current_body)), label
+        if label == "task detail":
+            assert list(current_body[0]) == TASK_DETAIL_FIELDS
+
+        timings = {}
+        for path, fmt, provider, body in (
+            ("legacy", legacy_format, stdlib_json, legacy_body),
+            ("current", current_format, fast_json, current_body),
+        ):
+            format_time = best_of(args.repeat, fmt)
+            encode_time = best_of(args.repeat, lambda: provider.dumps(body, separators=(",", ":")))
+            timings[path] = (format_time, encode_time, format_time + encode_time)
+
+        for path, (format_time, encode_time, total) in timings.items():
+            speedup = timings["legacy"][2] / total
+            print(f"{label:<24} {path:<8} {format_time * 1e3:>7.1f}ms {encode_time * 1e3:>7.1f}ms "
+                  f"{total * 1e3:>7.1f}ms {speedup:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
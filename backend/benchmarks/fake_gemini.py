@@ -0,0 +1,186 @@
+"""
+Local stand-in for the Gemini generateContent / streamGenerateContent API.
+
+    python -m benchmarks.fake_gemini --port 8089 --latency 0.2 --chunk-delay 0.05 --error-rate 0.05
+
+Point the app at it with
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089/v1beta/models/fake:generateContent
+(the streaming endpoint is derived from it). Any POST path containing
+"streamGenerateContent" answers as an SSE stream, everything else with a
+single JSON body. With --error-rate, that fraction of requests fails with
+--error-status (default 503) instead, after the same latency.
+
+Faults can be changed while the server runs, e.g. to take the backend down
+and bring it back during a test:
+    curl -X POST localhost:8089/_faults -d '{"error_rate": 1.0, "latency": 5}'
+In-process, start_fake_gemini's server has the live config as `server.config`.
+
+A multi-part request whose parts after the first start with a "[[TASK n]]"
+marker line (micro-batched prompts, see app.utils.langchain_tools) gets one
+answer per part, each headed by its marker, like the real model is asked to.
+
+Like the real API, bodies are raw UTF-8 (non-ASCII text is not escaped)
+and the SSE stream's Content-Type has no charset.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGeminiConfig:
+    # Settings POST /_faults may change
+    FAULTS = ("latency", "chunk_delay", "chunks", "error_rate", "error_status")
+
+    def __init__(self, latency=0.0, chunk_delay=0.0, chunks=5, error_rate=0.0, error_status=503):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def update(self, **faults):
+        for name, value in faults.items():
+            if name not in self.FAULTS:
+                raise ValueError(f"Unknown fault setting: {name}")
+            setattr(self, name, type(getattr(self, name))(value))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FAULTS}
+
+
+def _prompt_parts(body):
+    try:
+        return [part.get("text", "") for part in body["contents"][0]["parts"]]
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return []
+
+
+def _prompt_text(body):
+    parts = _prompt_parts(body)
+    return parts[0] if parts else ""
+
+
+def _batched_prompts(body):
+    # [(marker, prompt)] of a micro-batched request, [] for a plain one
+    parts = _prompt_parts(body)[1:]
+    if not parts or not all(part.startswith("[[TASK ") for part in parts):
+        return []
+    return [tuple(part.split("\n", 1)) if "\n" in part else (part, "") for part in parts]
+
+
+def _answer_for(prompt, chunks):
+    words = f"Fake answer for: {' '.join(prompt.split()[:12])}".split()
+    size = max(1, -(-len(words) // chunks))
+    return [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+
+def make_handler(config):
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/_faults":
+                self._json(config.to_dict())
+            else:
+                self._json({"error": {"code": 404, "message": "Not found"}}, 404)
+
+        def do_POST(self):
+            body = self._read_body()
+            if self.path == "/_faults":
+                try:
+                    config.update(**body)
+                except (ValueError, TypeError) as e:
+                    self._json({"error": {"code": 400, "message": str(e)}}, 400)
+                    return
+                self._json(config.to_dict())
+                return
+
+            time.sleep(config.latency)
+            if config.error_rate and random.random() < config.error_rate:
+                self._json({"error": {"code": config.error_status, "message": "Injected error"}}, config.error_status)
+                return
+            batched = _batched_prompts(body)
+            if batched:
+                answer = "\n".join(f"{marker}\n{''.join(_answer_for(prompt, 1))}" for marker, prompt in batched)
+                parts = [answer]
+            else:
+                parts = _answer_for(_prompt_text(body), config.chunks)
+
+            usage = {
+                "promptTokenCount": sum(len(text.split()) for text in _prompt_parts(body)),
+                "candidatesTokenCount": len("".join(parts).split()),
+            }
+            if "streamGenerateContent" in self.path:
+                self._stream(parts, usage)
+            else:
+                self._json({"candidates": [{"content": {"parts": [{"text": "".join(parts)}]}}], "usageMetadata": usage})
+
+        def _json(self, payload, status=200):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, parts, usage):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, part in enumerate(parts):
+                event = {"candidates": [{"content": {"parts": [{"text": part}]}}]}
+                if i == len(parts) - 1:
+                    event["usageMetadata"] = usage
+                self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+                time.sleep(config.chunk_delay)
+            self._write_chunk(b"")
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return FakeGeminiHandler
+
+
+def start_fake_gemini(host="127.0.0.1", port=0, **options):
+    """
+    Start the fake server on a background thread. Returns (server, base_url);
+    call server.shutdown() to stop it. port=0 picks a free port. Change
+    faults on the fly with server.config.update(error_rate=..., latency=...).
+    """
+    config = FakeGeminiConfig(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.config = config
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first byte")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--chunks", type=int, default=5, help="chunks per streamed answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port),
+        make_handler(FakeGeminiConfig(args.latency, args.chunk_delay, args.chunks, args.error_rate, args.error_status)),
+    )
+    print(f"Fake Gemini listening on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,129 @@
+"""
+Fault-injection run for the LLM guard (app.utils.llm_guard) against the fake
+Gemini server: how the adaptive limit, the circuit breaker and per-user
+fairness behave when the backend degrades and recovers.
+
+    python -m benchmarks.llm_faults --phase-seconds 5 --heavy-threads 24 --light-threads 2
+
+Two tenants call get_gemini_response in closed loops: a heavy one with many
+threads and a light one with a few. The fake server goes through the phases
+healthy -> failing (--outage-error-rate) -> slow (--slow-latency, above the
+latency target) -> healthy. For each phase it reports per tenant the calls
+that succeeded, failed at the backend, or were refused by the guard
+(LLMUnavailable, i.e. the task would be deferred), and how long refused
+calls took. It also reports the concurrency limit and the breaker state at
+the end of the phase.
+"""
+import argparse
+import os
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.fake_gemini import start_fake_gemini
+
+PHASES = ("healthy", "failing", "slow", "recovered")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phase-seconds", type=float, default=5)
+    parser.add_argument("--heavy-threads", type=int, default=24)
+    parser.add_argument("--light-threads", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.1, help="fake Gemini latency when healthy")
+    parser.add_argument("--outage-error-rate", type=float, default=1.0)
+    parser.add_argument("--slow-latency", type=float, default=1.5)
+    parser.add_argument("--latency-target", type=float, default=1.0)
+    parser.add_argument("--initial-limit", type=int, default=8)
+    parser.add_argument("--max-limit", type=int, default=32)
+    parser.add_argument("--queue-timeout", type=float, default=5)
+    parser.add_argument("--breaker-cooldown", type=float, default=2)
+    args = parser.parse_args()
+
+    server, gemini_url = start_fake_gemini(latency=args.latency)
+
+    # Injected Gemini errors are logged as warnings; keep the report readable
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    from app import create_app
+    from app.utils import langchain_tools
+    from app.utils.llm_guard import LLMUnavailable
+
+    app = create_app({
+        "STORAGE_BACKEND": "memory",
+        "SCHEDULER_ENABLED": False,
+        "LOG_SINK_ENABLED": False,
+        "GEMINI_API_ENDPOINT": f"{gemini_url}/v1beta/models/fake:generateContent",
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "fault-test",
+        "GEMINI_POOL_SIZE": args.max_limit,
+        "GEMINI_MAX_RETRIES": 0,
+        "LLM_CONCURRENCY_INITIAL": args.initial_limit,
+        "LLM_CONCURRENCY_MAX": args.max_limit,
+        "LLM_LATENCY_TARGET_SECONDS": args.latency_target,
+        "LLM_QUEUE_TIMEOUT_SECONDS": args.queue_timeout,
+        "LLM_BREAKER_COOLDOWN_SECONDS": args.breaker_cooldown,
+    })
+
+    phase = {"name": PHASES[0]}
+    stats = defaultdict(lambda: defaultdict(list))  # (phase, tenant) -> outcome -> [seconds]
+    stop = threading.Event()
+
+    def client(tenant):
+        with app.app_context():
+            call_loop(tenant)
+
+    def call_loop(tenant):
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                outcome = "ok" if langchain_tools.get_gemini_response("Fault test", tenant) else "failed"
+            except LLMUnavailable:
+                outcome = "refused"
+            stats[(phase["name"], tenant)][outcome].append(time.perf_counter() - start)
+            if outcome == "refused":
+                # A refused run is deferred, not retried in a tight loop
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=client, args=("heavy",), daemon=True) for _ in range(args.heavy_threads)]
+    threads += [threading.Thread(target=client, args=("light",), daemon=True) for _ in range(args.light_threads)]
+    for thread in threads:
+        thread.start()
+
+    faults = {
+        "healthy": {"latency": args.latency, "error_rate": 0.0},
+        "failing": {"latency": args.latency, "error_rate": args.outage_error_rate},
+        "slow": {"latency": args.slow_latency, "error_rate": 0.0},
+        "recovered": {"latency": args.latency, "error_rate": 0.0},
+    }
+    guard = langchain_tools.get_llm_guard(app)
+    try:
+        for name in PHASES:
+            server.config.update(**faults[name])
+            phase["name"] = name
+            time.sleep(args.phase_seconds)
+            snapshot = guard.stats()
+            print(f"\n== {name}: limit {snapshot['limiter']['limit']}, breaker {snapshot['breaker']['state']}, "
+                  f"waiting {snapshot['limiter']['waiting']}")
+            for tenant in ("heavy", "light"):
+                outcomes = stats[(name, tenant)]
+                refused = outcomes.get("refused", [])
+                print(f"  {tenant:5}  ok {len(outcomes.get('ok', [])):5}  failed {len(outcomes.get('failed', [])):5}  "
+                      f"refused {len(refused):5} (p95 {percentile(refused, 95) * 1000:7.1f}ms)  "
+                      f"ok p95 {percentile(outcomes.get('ok', []), 95) * 1000:7.1f}ms")
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=args.queue_timeout + 5)
+        server.shutdown()
+    print("\nFinal guard stats:", guard.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Load test for the Flask API: auth, task CRUD, /logs and /run-ai.
+
+    python -m benchmarks.load_test --concurrency 16 --duration 20
+    python -m benchmarks.load_test --scenarios tasks,logs --transport inproc
+    python -m benchmarks.load_test --compare benchmarks/results/<earlier run>.json
+
+create_app runs against the in-memory storage engine (STORAGE_BACKEND=memory,
+or --storage mongo with MONGO_URI) and a fake Gemini server started in-process
+(benchmarks.fake_gemini) with --gemini-latency / --gemini-error-rate.
+
+Each scenario runs for --duration seconds with --concurrency client threads,
+each signed in as its own user, and reports per-operation throughput and
+p50/p95/p99 latency. Transports:
+- http: a threaded werkzeug server on a local port, driven with requests
+- inproc: Flask's test client, i.e. the app's own overhead without sockets
+
+Results are written to benchmarks/results/<UTC timestamp>.json (or --output);
+--compare prints the p50/p95/throughput change against an earlier file.
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import subprocess
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from benchmarks.fake_gemini import start_fake_gemini
+
+SCENARIOS = ("auth", "tasks", "logs", "run-ai")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+# -------------------- clients --------------------
+class InProcessClient:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, json=None, headers=None):
+        response = self._client.open(path, method=method, json=json, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPClient:
+    def __init__(self, base_url):
+        import requests
+        self._base_url = base_url
+        self._session = requests.Session()
+
+    def request(self, method, path, json=None, headers=None):
+        response = self._session.request(method, self._base_url + path, json=json, headers=headers, timeout=60)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+def start_http_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# -------------------- measurement --------------------
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)  # op -> [seconds]
+        self.errors = defaultdict(int)
+
+    def timed(self, op, client, method, path, ok=(200, 201, 202), **kwargs):
+        start = time.perf_counter()
+        status, body = client.request(method, path, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[op].append(elapsed)
+            if status not in ok:
+                self.errors[op] += 1
+        return status, body
+
+    def record(self, op, elapsed, ok):
+        with self._lock:
+            self.samples[op].append(elapsed)
+            if not ok:
+                self.errors[op] += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(recorder, wall_seconds):
+    ops = {}
+    for op, samples in sorted(recorder.samples.items()):
+        samples = sorted(samples)
+        ops[op] = {
+            "count": len(samples),
+            "errors": recorder.errors[op],
+            "throughput": round(len(samples) / wall_seconds, 2),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+            "p50_ms": round(percentile(samples, 50) * 1000, 3),
+            "p95_ms": round(percentile(samples, 95) * 1000, 3),
+            "p99_ms": round(percentile(samples, 99) * 1000, 3),
+            "max_ms": round(samples[-1] * 1000, 3),
+        }
+    return ops
+
+
+# -------------------- scenarios --------------------
+# Each scenario is (setup, step): setup(client, user) runs once per client
+# thread before the clock starts; step(client, user, recorder) is one iteration.
+
+def _auth_step(client, user, recorder):
+    recorder.timed("POST /login", client, "POST", "/login",
+                   json={"email": user["email"], "password": user["password"]})
+
+
+def _tasks_setup(client, user):
+    client.request("POST", "/tasks/bulk", headers=user["headers"],
+                   json={"tasks": [{"title": f"seed {i}", "description": "load test"} for i in range(100)]})
+
+
+def _tasks_step(client, user, recorder):
+    headers = user["headers"]
+    status, body = recorder.timed("POST /tasks", client, "POST", "/tasks", headers=headers,
+                                  json={"title": "load test task", "description": "created by load_test"})
+    recorder.timed("GET /tasks", client, "GET", "/tasks?limit=20", headers=headers)
+    if status != 201:
+        return
+    task_id = body["task_id"]
+    recorder.timed("PUT /tasks/<id>", client, "PUT", f"/tasks/{task_id}", headers=headers,
+                   json={"status": "completed"})
+    recorder.timed("DELETE /tasks/<id>", client, "DELETE", f"/tasks/{task_id}", headers=headers)
+
+
+def _logs_setup(app, logs_per_user):
+    def setup(client, user):
+        from app.models.log_model import write_logs
+        from app.utils.log_sink import get_log_sink
+        now = datetime.utcnow()
+        with app.app_context():
+            write_logs({
+                "user_id": user["user_id"],
+                "task_id": f"task-{i % 20}",
+                "status": "success" if i % 10 else "error",
+                "ai_response": f"load test response {i}",
+                "timestamp": now - timedelta(seconds=i),
+            } for i in range(logs_per_user))
+            sink = get_log_sink()
+            if sink is not None:
+                sink.flush()
+    return setup
+
+
+def _logs_step(client, user, recorder):
+    headers = user["headers"]
+    recorder.timed("GET /logs", client, "GET", "/logs?limit=100", headers=headers)
+    recorder.timed("GET /logs?status", client, "GET", "/logs?limit=100&status=error", headers=headers)
+
+
+def _run_ai_setup(client, user):
+    _, body = client.request("POST", "/tasks", headers=user["headers"],
+                             json={"title": "load test run", "description": "summarise the load test",
+                                   "use_cache": False})
+    user["run_task_id"] = body["task_id"]
+
+
+def _run_ai_step(client, user, recorder):
+    headers = user["headers"]
+    start = time.perf_counter()
+    status, body = recorder.timed("POST /tasks/<id>/run-ai", client, "POST",
+                                  f"/tasks/{user['run_task_id']}/run-ai", headers=headers)
+    if status != 202:
+        return
+    job_status = None
+    while True:
+        _, job = client.request("GET", f"/ai-jobs/{body['job_id']}", headers=headers)
+        job_status = (job or {}).get("status")
+        if job_status in ("completed", "error", None):
+            break
+        time.sleep(0.01)
+    ok = job_status == "completed"
+    recorder.record("run-ai end-to-end", time.perf_counter() - start, ok)
+
+
+def run_scenario(name, setup, step, clients, users, duration):
+    for client, user in zip(clients, users):
+        if setup:
+            setup(client, user)
+
+    recorder = Recorder()
+    stop = threading.Event()
+
+    def loop(client, user):
+        while not stop.is_set():
+            step(client, user, recorder)
+
+    threads = [threading.Thread(target=loop, args=pair, daemon=True) for pair in zip(clients, users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return {"wall_seconds": round(wall, 3), "ops": summarize(recorder, wall)}
+
+
+# -------------------- app wiring --------------------
+def build_app(args, gemini_url):
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from app import create_app
+    return create_app({
+        "STORAGE_BACKEND": args.storage,
+        "BCRYPT_ROUNDS": args.bcrypt_rounds,
+        "AI_WORKER_CONCURRENCY": args.ai_workers,
+        "AI_BATCH_RATE_PER_MINUTE": 10 ** 9,
+        "GEMINI_API_ENDPOINT": f"{gemini_url}/v1beta/models/fake:generateContent",
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "load-test",
+        "AI_CACHE_ENABLED": args.ai_cache,
+        "JWT_SECRET": os.getenv("JWT_SECRET") or "load-test-secret",
+    })
+
+
+def sign_up_users(client, count, password):
+    users = []
+    for _ in range(count):
+        email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        status, body = client.request("POST", "/signup", json={"email": email, "password": password, "name": "Load"})
+        if status != 201:
+            raise SystemExit(f"Sign-up failed ({status}): {body}")
+        users.append({
+            "email": email,
+            "password": password,
+            "user_id": body["user_id"],
+            "headers": {"Authorization": f"Bearer {body['token']}"},
+        })
+    return users
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(__file__)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nvs {previous_path} ({previous.get('git_commit')} @ {previous.get('started_at')})")
+    print(f"{'operation':<32} {'p50':>9} {'p95':>9} {'throughput':>11}")
+    for scenario, result in current["scenarios"].items():
+        old_ops = previous.get("scenarios", {}).get(scenario, {}).get("ops", {})
+        for op, stats in result["ops"].items():
+            old = old_ops.get(op)
+            if not old:
+                continue
+
+            def change(key):
+                return f"{(stats[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+            print(f"{op:<32} {change('p50_ms'):>9} {change('p95_ms'):>9} {change('throughput'):>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads (one user each)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--transport", choices=["http", "inproc"], default="http")
+    parser.add_argument("--storage", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--logs-per-user", type=int, default=1000)
+    parser.add_argument("--ai-workers", type=int, default=8, help="in-process agent workers")
+    parser.add_argument("--ai-cache", action="store_true", help="keep the AI response cache on")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="fake Gemini seconds per call")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="fraction of fake Gemini calls that fail")
+    parser.add_argument("--gemini-error-status", type=int, default=503)
+    parser.add_argument("--output", help="result file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's print() output")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    gemini, gemini_url = start_fake_gemini(
+        latency=args.gemini_latency, error_rate=args.gemini_error_rate, error_status=args.gemini_error_status,
+    )
+    app = build_app(args, gemini_url)
+
+    server = None
+    if args.transport == "http":
+        server, base_url = start_http_server(app)
+        make_client = lambda: HTTPClient(base_url)
+    else:
+        make_client = lambda: InProcessClient(app)
+
+    clients = [make_client() for _ in range(args.concurrency)]
+    users = sign_up_users(clients[0], args.concurrency, password="load-test-password")
+
+    plan = {
+        "auth": (None, _auth_step),
+        "tasks": (_tasks_setup, _tasks_step),
+        "logs": (_logs_setup(app, args.logs_per_user), _logs_step),
+        "run-ai": (_run_ai_setup, _run_ai_step),
+    }
+
+    result = {
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    for name in scenarios:
+        setup, step = plan[name]
+        print(f"-- {name}: {args.concurrency} clients for {args.duration:g}s")
+        # Stray stdout writes during the run go to devnull, as they would go to a log file
+        with open(os.devnull, "w") as devnull, \
+                (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+            outcome = run_scenario(name, setup, step, clients, users, args.duration)
+        result["scenarios"][name] = outcome
+        print(f"{'operation':<32} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for op, stats in outcome["ops"].items():
+            print(f"{op:<32} {stats['throughput']:>9.1f} {stats['p50_ms']:>9.2f} "
+                  f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['errors']:>7}")
+
+    if server is not None:
+        server.shutdown()
+    gemini.shutdown()
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.utcnow().strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Micro-batching run against the fake Gemini server: how many requests and how
+much time many small prompts cost sent one by one vs. micro-batched
+(AI_MICROBATCH_ENABLED, see app.utils.langchain_tools).
+
+    python -m benchmarks.prompt_batching --prompts 200 --threads 32 --latency 0.3
+
+Each mode sends --prompts distinct small prompts for one user from --threads
+threads (through get_cached_gemini_response with the cache off, like agent
+runs do), and reports wall time, latency percentiles, HTTP requests made and
+the tokens recorded per prompt. The fake server answers batched requests
+per part, so every prompt gets its own answer back.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_gemini import start_fake_gemini
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.3, help="fake Gemini latency per request")
+    parser.add_argument("--window-ms", type=float, default=25)
+    parser.add_argument("--max-prompts", type=int, default=8, help="prompts per batched request")
+    args = parser.parse_args()
+
+    server, gemini_url = start_fake_gemini(latency=args.latency)
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from app import create_app
+    from app.utils import langchain_tools
+
+    app = create_app({
+        "STORAGE_BACKEND": "memory",
+        "SCHEDULER_ENABLED": False,
+        "LOG_SINK_ENABLED": False,
+        "GEMINI_API_ENDPOINT": f"{gemini_url}/v1beta/models/fake:generateContent",
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "batch-test",
+        "GEMINI_POOL_SIZE": args.threads,
+        "LLM_CONCURRENCY_INITIAL": args.threads,
+        "AI_MICROBATCH_WINDOW_MS": args.window_ms,
+        "AI_MICROBATCH_MAX_PROMPTS": args.max_prompts,
+    })
+
+    def ask(i):
+        usage = {}
+        start = time.perf_counter()
+        with app.app_context():
+            response, _ = langchain_tools.get_cached_gemini_response(
+                f"Task {i}: summarize the status of ticket {i} in one line.", use_cache=False,
+                user_id="bench", usage=usage,
+            )
+        return time.perf_counter() - start, bool(response), usage
+
+    try:
+        for batched in (False, True):
+            app.config["AI_MICROBATCH_ENABLED"] = batched
+            before = langchain_tools.get_http_client(app).stats.snapshot()["requests"]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as executor:
+                results = list(executor.map(ask, range(args.prompts)))
+            elapsed = time.perf_counter() - start
+            requests = langchain_tools.get_http_client(app).stats.snapshot()["requests"] - before
+
+            latencies = [latency for latency, _, _ in results]
+            answered = sum(1 for _, ok, _ in results if ok)
+            tokens = sum(usage.get("prompt", 0) + usage.get("completion", 0) for _, _, usage in results)
+            print(f"{'batched' if batched else 'single':8}  {elapsed:6.2f}s  requests {requests:5}  "
+                  f"answered {answered}/{args.prompts}  p50 {percentile(latencies, 50) * 1000:7.1f}ms  "
+                  f"p95 {percentile(latencies, 95) * 1000:7.1f}ms  tokens/prompt {tokens / max(1, answered):6.1f}")
+    finally:
+        server.shutdown()
+    print("\nMicro-batcher:", langchain_tools.get_micro_batcher(app).stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Fixtures shared by the tests: the app on the in-memory storage engine
+(STORAGE_BACKEND=memory), with Gemini answered by benchmarks.fake_gemini.
+"""
+import os
+
+import pytest
+
+from benchmarks.fake_gemini import start_fake_gemini
+
+# Logging is configured when app.utils.logger is first imported, before any app exists
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from app import create_app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def gemini_url():
+    server, url = start_fake_gemini()
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture
+def app(gemini_url):
+    return create_app({
+        "STORAGE_BACKEND": "memory",
+        "SCHEDULER_ENABLED": False,
+        "LOG_SINK_ENABLED": False,
+        "BCRYPT_ROUNDS": 4,
+        "JWT_SECRET": "test-secret",
+        "GEMINI_API_KEY": "test",
+        "GEMINI_API_ENDPOINT": f"{gemini_url}/v1beta/models/fake:generateContent",
+    })
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(client):
+    """
+    A signed-up user: {"user_id", "headers"} with a bearer token.
+    """
+    response = client.post("/signup", json={"email": "ada@example.com", "password": "pw", "name": "Ada"})
+    assert response.status_code == 201
+    headers = {"Authorization": f"Bearer {response.json['token']}"}
+    return {"user_id": client.get("/profile/", headers=headers).json["user_id"], "headers": headers}
+
@@ -0,0 +1,37 @@
+def test_unchanged_tasks_get_304(client, user):
+    headers = user["headers"]
+    task_id = client.post("/tasks", json={"title": "t"}, headers=headers).json["task_id"]
+
+    first = client.get("/tasks", headers=headers)
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    not_modified = client.get("/tasks", headers={**headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+
+    # Another representation (query string) has its own ETag
+    assert client.get("/tasks?limit=1", headers={**headers, "If-None-Match": etag}).status_code == 200
+
+    client.put(f"/tasks/{task_id}", json={"status": "completed"}, headers=headers)
+    changed = client.get("/tasks", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_etags_are_per_user(client, user):
+    etag = client.get("/tasks", headers=user["headers"]).headers["ETag"]
+    token = client.post("/signup", json={"email": "bob@example.com", "password": "pw", "name": "Bob"}).json["token"]
+    other = {"Authorization": f"Bearer {token}", "If-None-Match": etag}
+    assert client.get("/tasks", headers=other).status_code == 200
+
+
+def test_new_logs_change_the_etag(client, user):
+    headers = user["headers"]
+    task_id = client.post("/tasks", json={"title": "t"}, headers=headers).json["task_id"]
+    client.post(f"/tasks/{task_id}/run-ai/stream", headers=headers).get_data()
+    logs = client.get("/logs", headers=headers)
+    assert logs.status_code == 200
+    assert client.get("/logs", headers={**headers, "If-None-Match": logs.headers["ETag"]}).status_code == 304
+
+    client.post(f"/tasks/{task_id}/run-ai/stream", headers=headers).get_data()
+    assert client.get("/logs", headers={**headers, "If-None-Match": logs.headers["ETag"]}).status_code == 200
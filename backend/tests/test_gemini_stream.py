@@ -0,0 +1,33 @@
+import json
+
+from app.utils.langchain_tools import gemini_stream_frame, stream_gemini_response
+
+
+def test_stream_frame_parses_data_lines():
+    data, texts = gemini_stream_frame('data: {"candidates": [{"content": {"parts": [{"text": "hé"}]}}]}')
+    assert texts == ["hé"]
+    assert data["candidates"]
+    assert gemini_stream_frame("") == (None, [])
+    assert gemini_stream_frame(": keep-alive") == (None, [])
+
+
+def test_stream_decodes_utf8(app):
+    # The fake server, like Gemini, sends raw UTF-8 with no charset on text/event-stream
+    tokens = {}
+    with app.app_context():
+        chunks = list(stream_gemini_response("héllo — ✓ naïve", user_id="u1", tokens=tokens))
+    assert "".join(chunks).strip() == "Fake answer for: héllo — ✓ naïve"
+    assert len(chunks) > 1
+    assert tokens["completion"] > 0
+
+
+def test_stream_route_sends_utf8_events(client, user):
+    task_id = client.post("/tasks", json={"title": "Café ✓", "description": "crème brûlée"},
+                          headers=user["headers"]).json["task_id"]
+    response = client.post(f"/tasks/{task_id}/run-ai/stream", headers=user["headers"])
+    assert response.status_code == 200
+    events = [block.split("\n", 1) for block in response.get_data(as_text=True).strip().split("\n\n")]
+    assert events[0][0] == "event: chunk"
+    assert events[-1][0] == "event: done"
+    done = json.loads(events[-1][1][len("data:"):])
+    assert "Café ✓" in done["ai_response"]
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.llm_guard import AdaptiveLimiter, CircuitBreaker, LLMGuard, LLMUnavailable
+
+
+def test_limiter_caps_calls_in_flight():
+    limiter = AdaptiveLimiter(initial=2, max_limit=2)
+    limiter.acquire("a", timeout=0.01)
+    limiter.acquire("a", timeout=0.01)
+    with pytest.raises(LLMUnavailable):
+        limiter.acquire("a", timeout=0.01)
+    limiter.release("a")
+    limiter.acquire("a", timeout=0.01)
+    assert limiter.stats()["in_flight"] == 2
+
+
+def test_limiter_aimd():
+    limiter = AdaptiveLimiter(initial=8, max_limit=16, latency_target=1.0, decrease_interval=60)
+    limiter.on_result(True, 0.1)
+    assert limiter.limit == pytest.approx(8.125)
+    limiter.on_result(False, 0.1)
+    assert limiter.limit == pytest.approx(4.0625)
+    # A burst of failures within decrease_interval halves the limit once
+    limiter.on_result(False, 0.1)
+    limiter.on_result(True, 5.0)
+    assert limiter.limit == pytest.approx(4.0625)
+
+
+def test_limiter_hands_freed_slots_to_the_least_busy_user():
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    limiter.acquire("heavy", timeout=0.01)
+    order = []
+
+    def wait(user_id):
+        limiter.acquire(user_id, timeout=2)
+        order.append(user_id)
+        limiter.release(user_id)
+
+    threads = []
+    for user_id in ("heavy", "heavy", "light"):
+        threads.append(threading.Thread(target=wait, args=(user_id,)))
+        threads[-1].start()
+        time.sleep(0.02)  # queue in this order
+    limiter.release("heavy")
+    for thread in threads:
+        thread.join(2)
+    # "light" queued last but had nothing in flight, so it is not stuck behind "heavy"'s queue
+    assert order.index("light") < 2
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, cooldown=0.05, half_open_calls=1)
+    for ok in (True, False, True, False):
+        breaker.allow()
+        breaker.on_result(ok)
+    assert breaker.state == "open"
+    with pytest.raises(LLMUnavailable):
+        breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    breaker.allow()  # the one probe
+    with pytest.raises(LLMUnavailable):
+        breaker.allow()
+    breaker.on_result(False)
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.on_result(True)
+    assert breaker.state == "closed"
+    assert breaker.stats()["opened"] == 2
+
+
+def test_breaker_ignores_client_errors():
+    breaker = CircuitBreaker(window=4, min_calls=4, cooldown=60)
+    for _ in range(4):
+        breaker.on_result(None)
+    assert breaker.state == "closed"
+
+
+def test_guard_fails_fast_while_open():
+    guard = LLMGuard(AdaptiveLimiter(initial=2), CircuitBreaker(window=2, min_calls=2, cooldown=60))
+    for _ in range(2):
+        with guard.slot("u") as permit:
+            permit.outcome = "error"
+    with pytest.raises(LLMUnavailable) as raised:
+        guard.check()
+    assert raised.value.retry_after > 1
+    with pytest.raises(LLMUnavailable):
+        with guard.slot("u"):
+            pass
+    assert guard.stats()["limiter"]["in_flight"] == 0
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.repositories import get_repositories
+
+
+def _follow(client, url, headers):
+    # Every log across the pages, following X-Next-Cursor
+    logs, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""), headers=headers)
+        assert response.status_code == 200
+        logs += response.json
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return logs
+
+
+def test_log_pages_cover_every_log_once(app, client, user):
+    start = datetime(2026, 1, 1)
+    with app.app_context():
+        logs = [{"_id": ObjectId(), "user_id": user["user_id"], "timestamp": start + timedelta(minutes=i)}
+                for i in range(5)]
+        # Legacy logs: string timestamps, or none
+        logs += [{"_id": ObjectId(), "user_id": user["user_id"], "timestamp": f"2025-01-0{i + 1} 10:00:00"}
+                 for i in range(3)]
+        logs.append({"_id": ObjectId(), "user_id": user["user_id"]})
+        get_repositories().logs.insert_many(logs)
+
+    ids = [log["id"] for log in _follow(client, "/logs?limit=2", user["headers"])]
+    assert len(ids) == len(set(ids)) == 9
+    assert ids[:5] == [str(log["_id"]) for log in logs[4::-1]]
+
+
+def test_bad_log_limit(client, user):
+    assert client.get("/logs?limit=abc", headers=user["headers"]).status_code == 400
+    assert client.get("/logs?limit=0", headers=user["headers"]).status_code == 400
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+from app.models.task_model import next_scheduled_run
+from app.repositories import get_repositories
+from app.repositories.memory import MemoryTaskRepository
+from app.utils.scheduler import TaskScheduler
+
+
+def _scheduled_task(repo, run_at, **fields):
+    repo.insert(dict({"task_id": "t1", "user_id": "u", "title": "daily", "schedule": "daily",
+                      "next_run_at": run_at, "retry_count": 0}, **fields))
+
+
+def test_one_claim_per_run():
+    repo = MemoryTaskRepository()
+    now = datetime(2026, 1, 10, 9, 0)
+    _scheduled_task(repo, now)
+    assert [task["task_id"] for task in repo.find_due(now + timedelta(seconds=1))] == ["t1"]
+
+    assert repo.claim_due("t1", "u", now, "a", now + timedelta(minutes=5), now) is not None
+    # Leased: another instance cannot take the same run
+    assert repo.claim_due("t1", "u", now, "b", now + timedelta(minutes=5), now) is None
+    # Only the lease owner may release it
+    assert not repo.release("t1", "u", "b", {"next_run_at": now + timedelta(days=1)})
+    assert repo.release("t1", "u", "a", {"next_run_at": now + timedelta(days=1)})
+    # The run moved on, so a claim for the old due time misses
+    assert repo.claim_due("t1", "u", now, "b", now + timedelta(minutes=5), now) is None
+    assert repo.find_due(now + timedelta(hours=1)) == []
+
+
+def test_expired_lease_can_be_claimed():
+    repo = MemoryTaskRepository()
+    now = datetime(2026, 1, 10, 9, 0)
+    _scheduled_task(repo, now)
+    repo.claim_due("t1", "u", now, "a", now + timedelta(minutes=5), now)
+    later = now + timedelta(minutes=6)
+    assert repo.claim_due("t1", "u", now, "b", later + timedelta(minutes=5), later)["lease_owner"] == "b"
+
+
+def test_next_run_counts_from_the_scheduled_slot():
+    slot = datetime(2026, 1, 10, 9, 0)
+    assert next_scheduled_run("daily", slot, slot + timedelta(minutes=5)) == slot + timedelta(days=1)
+    # Missed runs are skipped, keeping the time of day
+    assert next_scheduled_run("Daily", slot, slot + timedelta(days=3, hours=1)) == slot + timedelta(days=4)
+    assert next_scheduled_run("manual", slot) is None
+
+
+def test_retries_keep_the_regular_slot(app):
+    scheduler = TaskScheduler(app, retry_base_seconds=30)
+    slot = datetime(2026, 1, 10, 9, 0)
+    task = {"schedule": "daily", "auto_retry": True}
+    retry = scheduler.next_run_fields(task, True, slot + timedelta(minutes=1), run_at=slot)
+    assert retry == {"next_run_at": slot + timedelta(minutes=1, seconds=30), "retry_count": 1, "run_slot": slot}
+
+    task.update(retry_count=1, run_slot=slot)
+    after = scheduler.next_run_fields(task, False, slot + timedelta(minutes=2), run_at=retry["next_run_at"])
+    assert after == {"next_run_at": slot + timedelta(days=1), "retry_count": 0, "run_slot": None}
+
+
+def test_scheduled_run(app):
+    run_at = datetime.utcnow() - timedelta(seconds=1)
+    with app.app_context():
+        tasks = get_repositories().tasks
+        _scheduled_task(tasks, run_at, status="pending", description="check")
+        TaskScheduler(app)._run("t1", "u", run_at)
+        task = tasks.get("t1", "u")
+    assert task["status"] == "completed"
+    assert task["next_run_at"] == run_at + timedelta(days=1)
+    assert task["lease_owner"] is None
+
+
+def test_backfill_command(app):
+    with app.app_context():
+        tasks = get_repositories().tasks
+        tasks.insert({"task_id": "w", "user_id": "u", "schedule": "Weekly", "created_at": datetime(2025, 1, 1)})
+        tasks.insert({"task_id": "m", "user_id": "u", "schedule": "manual", "created_at": datetime(2025, 1, 1)})
+
+    result = app.test_cli_runner().invoke(args=["backfill-task-schedules"])
+    assert "Scheduled 1 task(s)" in result.output
+    with app.app_context():
+        next_run = get_repositories().tasks.get("w", "u")["next_run_at"]
+        assert datetime.utcnow() < next_run <= datetime.utcnow() + timedelta(weeks=1)
+        assert next_run.weekday() == datetime(2025, 1, 1).weekday()
+        assert get_repositories().tasks.get("m", "u").get("next_run_at") is None
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from app.models.stats_model import get_task_stats, rebuild_task_stats
+from app.repositories import get_repositories
+
+
+def _stats(client, user):
+    stats = client.get("/tasks/stats", headers=user["headers"]).json
+    stats.pop("updated_at")
+    return stats
+
+
+def test_counters_match_a_rebuild(app, client, user):
+    headers = user["headers"]
+    ids = [
+        client.post("/tasks", json={"title": f"t{i}", "type": kind, "priority": priority},
+                    headers=headers).json["task_id"]
+        for i, (kind, priority) in enumerate([("Bug", "High"), ("Bug", "Low"), ("", "Medium"), ("Docs", "High")])
+    ]
+    client.put(f"/tasks/{ids[0]}", json={"status": "completed"}, headers=headers)
+    client.put(f"/tasks/{ids[1]}", json={"status": "error"}, headers=headers)
+    client.post("/tasks/bulk", json={"tasks": [{"title": "b1", "status": "running"}, {"title": ""}]}, headers=headers)
+    client.put("/tasks/bulk", json={"updates": [{"task_id": ids[2], "status": "completed"}]}, headers=headers)
+    client.delete(f"/tasks/{ids[3]}", headers=headers)
+    client.delete("/tasks/bulk", json={"task_ids": [ids[1]]}, headers=headers)
+
+    counted = _stats(client, user)
+    assert counted["total"] == 3
+    assert counted["by_status"]["completed"] == 2
+    assert counted["by_status"]["running"] == 1
+
+    with app.app_context():
+        rebuild_task_stats(user["user_id"])
+    assert _stats(client, user) == counted
+
+
+def test_empty_values_count_like_a_rebuild(app, client, user):
+    # "" counts under the same default ("General") whether counted on write or rebuilt
+    client.post("/tasks", json={"title": "t", "type": ""}, headers=user["headers"])
+    counted = _stats(client, user)
+    assert counted["by_type"] == {"General": 1}
+    with app.app_context():
+        rebuild_task_stats(user["user_id"])
+    assert _stats(client, user) == counted
+
+
+def test_partial_counters_are_rebuilt(app):
+    # Tasks written before the counters existed, then one $inc: the upserted
+    # document has no built_at, so the next read counts everything
+    with app.app_context():
+        repos = get_repositories()
+        now = datetime.utcnow()
+        for i in range(3):
+            repos.tasks.insert({"task_id": f"old{i}", "user_id": "u", "title": "old", "status": "pending",
+                                "created_at": now})
+        repos.task_stats.increment("u", {"total": 1, "status.pending": 1}, now)
+        assert get_task_stats("u")["total"] == 3
@@ -0,0 +1,33 @@
+from app.repositories import get_repositories
+
+
+def _follow(client, url, headers):
+    # Every task across the pages, following next_cursor
+    tasks, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""), headers=headers)
+        assert response.status_code == 200
+        tasks += response.json["tasks"]
+        cursor = response.json["next_cursor"]
+        if not cursor:
+            return tasks
+
+
+def test_task_pages_cover_every_task_once(app, client, user):
+    created = [client.post("/tasks", json={"title": f"t{i}"}, headers=user["headers"]).json["task_id"]
+               for i in range(7)]
+    with app.app_context():
+        # Tasks from before created_at was stored come last
+        for i in range(2):
+            get_repositories().tasks.insert({"task_id": f"legacy{i}", "user_id": user["user_id"], "title": "old"})
+
+    tasks = _follow(client, "/tasks?limit=3", user["headers"])
+    ids = [task["task_id"] for task in tasks]
+    assert len(ids) == len(set(ids)) == 9
+    assert set(ids[:7]) == set(created)
+    assert sorted(ids[7:]) == ["legacy0", "legacy1"]
+
+
+def test_bad_task_cursor_and_limit(client, user):
+    assert client.get("/tasks?cursor=nope", headers=user["headers"]).status_code == 400
+    assert client.get("/tasks?limit=abc", headers=user["headers"]).status_code == 400
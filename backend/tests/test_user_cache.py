@@ -0,0 +1,108 @@
+import time
+from datetime import datetime
+
+from app.repositories.memory import MemoryVersionRepository
+from app.utils.user_cache import UserCache, UserCacheInvalidator
+
+
+def _loader(docs, calls):
+    def load(key):
+        calls.append(key)
+        return docs.get(key)
+    return load
+
+
+def test_reads_are_cached_and_writes_go_through():
+    docs, calls = {"u1": {"user_id": "u1", "email": "a@example.com", "name": "A"}}, []
+    cache = UserCache()
+    assert cache.get_by_id("u1", _loader(docs, calls))["name"] == "A"
+    assert cache.get_by_email("a@example.com", _loader({}, calls))["user_id"] == "u1"
+    assert calls == ["u1"]
+
+    cache.update("u1", {"name": "B"})
+    assert cache.get_by_id("u1", _loader({}, calls))["name"] == "B"
+    cache.put({"user_id": "u2", "email": "b@example.com"})
+    assert cache.get_by_email("b@example.com", _loader({}, calls))["user_id"] == "u2"
+    assert calls == ["u1"]
+    assert cache.stats()["hit_rate"] == 0.75
+
+
+def test_invalidate_and_ttl():
+    docs, calls = {"u1": {"user_id": "u1", "email": "a@example.com"}}, []
+    cache = UserCache(ttl_seconds=0.05)
+    cache.get_by_id("u1", _loader(docs, calls))
+    cache.invalidate("u1")
+    assert cache.get_by_email("a@example.com", _loader({}, calls)) is None
+    cache.get_by_id("u1", _loader(docs, calls))
+    time.sleep(0.06)
+    cache.get_by_id("u1", _loader(docs, calls))
+    assert calls == ["u1", "a@example.com", "u1", "u1"]
+    assert cache.stats()["expired"] == 1
+
+
+def test_slow_read_does_not_undo_a_write():
+    cache = UserCache()
+
+    def stale_loader(user_id):
+        # A write lands while this read is in flight
+        cache.update(user_id, {"name": "new"})
+        return {"user_id": user_id, "name": "old"}
+
+    assert cache.get_by_id("u1", stale_loader)["name"] == "old"
+    assert cache.stats()["skipped_fills"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_eviction():
+    cache = UserCache(max_entries=2)
+    for user_id in ("u1", "u2", "u3"):
+        cache.put({"user_id": user_id})
+    assert cache.stats()["evictions"] == 1
+    assert cache.get_by_id("u1", lambda _: None) is None
+
+
+def test_invalidator_polls_other_processes_writes():
+    versions = MemoryVersionRepository()
+    cache = UserCache()
+    cache.put({"user_id": "u1"})
+    invalidator = UserCacheInvalidator(cache, versions, mode="auto", poll_seconds=0.02).start()
+    try:
+        # Another process bumps u1's profile version
+        versions.bump("u1", ["profile"], datetime.utcnow())
+        deadline = time.monotonic() + 2
+        while cache.stats()["size"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert cache.stats()["size"] == 0
+        assert invalidator.stats()["mode"] == "poll"
+    finally:
+        invalidator.stop()
+
+
+def test_profile_read_writes_nothing(app, client, user):
+    cache = app.extensions["user_cache"]
+    writes = cache.stats()["writes"]
+    etag = client.get("/profile/", headers=user["headers"]).headers["ETag"]
+    assert client.get("/profile/", headers=user["headers"]).headers["ETag"] == etag
+    assert cache.stats()["writes"] == writes
+
+    assert client.put("/profile/", json={"firstName": "Ada"}, headers=user["headers"]).status_code == 200
+    profile = client.get("/profile/", headers=user["headers"])
+    assert profile.json["firstName"] == "Ada"
+    assert profile.headers["ETag"] != etag
+
+
+def test_first_profile_save_creates_one_document(app, client):
+    with app.app_context():
+        from app.repositories import get_repositories
+        from app.utils.jwt_helper import generate_jwt_token
+        headers = {"Authorization": f"Bearer {generate_jwt_token('no-profile-yet')}"}
+        users = get_repositories().users
+
+    assert client.get("/profile/", headers=headers).json["firstName"] == ""
+    assert users.get_by_user_id("no-profile-yet") is None
+
+    assert client.put("/profile/", json={"firstName": "Ada"}, headers=headers).status_code == 200
+    assert client.put("/profile/", json={"lastName": "Lovelace"}, headers=headers).status_code == 200
+    stored = users.get_by_user_id("no-profile-yet")
+    assert (stored["firstName"], stored["lastName"], stored["role"]) == ("Ada", "Lovelace", "user")
+    assert client.get("/profile/", headers=headers).json["lastName"] == "Lovelace"
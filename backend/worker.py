@@ -0,0 +1,14 @@
+from app import create_app
+from app.utils.job_queue import start_worker_pool
+from app.utils.scheduler import start_scheduler
+
+# Standalone agent worker process: drains the Mongo-backed AI job queue and,
+# with SCHEDULER_ENABLED, runs scheduled tasks (leases keep several workers from
+# double-running one). Run alongside the API with AI_WORKERS_IN_PROCESS=false
+# and SCHEDULER_IN_PROCESS=false.
+app = create_app({"AI_WORKERS_IN_PROCESS": False, "SCHEDULER_IN_PROCESS": False})
+
+if __name__ == "__main__":
+    if app.config["SCHEDULER_ENABLED"]:
+        start_scheduler(app)
+    start_worker_pool(app).join()
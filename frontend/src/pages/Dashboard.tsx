@@ -31,6 +31,14 @@ interface Task {
   type: string;
 }
 
+interface TaskStats {
+  total: number;
+  by_status: Record<string, number>;
+  by_type: Record<string, number>;
+  by_priority: Record<string, number>;
+  completion_rate: number;
+}
+
 export default function Dashboard() {
   const [recentTasks, setRecentTasks] = useState<Task[]>([]);
   const [stats, setStats] = useState<any[]>([]);
@@ -49,24 +57,25 @@ export default function Dashboard() {
       if (!token) return;
 
       try {
-        const response = await axios.get(`${import.meta.env.VITE_API_URL}/tasks`, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        });
+        const headers = { Authorization: `Bearer ${token}` };
+        const [tasksResponse, statsResponse] = await Promise.all([
+          axios.get(`${import.meta.env.VITE_API_URL}/tasks`, { headers, params: { limit: 4 } }),
+          axios.get(`${import.meta.env.VITE_API_URL}/tasks/stats`, { headers }),
+        ]);
 
-        const tasks = (response.data as { tasks: Task[] }).tasks;
+        const tasks = (tasksResponse.data as { tasks: Task[] }).tasks;
+        const taskStats = statsResponse.data as TaskStats;
 
         setRecentTasks(tasks.slice(0, 4)); // First 4 tasks
 
-        const running = tasks.filter((t) => t.status === "running").length;
-        const completed = tasks.filter((t) => t.status === "completed").length;
-        const pending = tasks.filter((t) => t.status === "pending").length;
+        const running = taskStats.by_status.running ?? 0;
+        const completed = taskStats.by_status.completed ?? 0;
+        const pending = taskStats.by_status.pending ?? 0;
 
         setStats([
           {
             title: "Active Tasks",
-            value: `${tasks.length}`,
+            value: `${taskStats.total}`,
             change: "+12%",
             icon: CheckSquare,
             color: "text-primary",
@@ -38,26 +38,34 @@ export default function RunAI() {
   const [inputText, setInputText] = useState("");
   const [results, setResults] = useState<any>(null);
 
-  // Fetch tasks from backend on mount
+  // Fetch tasks from backend on mount, following next_cursor through every page
   useEffect(() => {
     const fetchTasks = async () => {
       const token = localStorage.getItem("token");
       try {
-        const res = await fetch(`${import.meta.env.VITE_API_URL}/tasks`, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        });
-        const data = await res.json();
-        if (res.ok) {
-          setTasks(data.tasks || []);
-        } else {
-          toast({
-            title: "Failed to fetch tasks",
-            description: data.error || "Unknown error",
-            variant: "destructive",
+        let all: any[] = [];
+        let cursor: string | null = null;
+        do {
+          const url = new URL(`${import.meta.env.VITE_API_URL}/tasks`, window.location.origin);
+          if (cursor) url.searchParams.set("cursor", cursor);
+          const res = await fetch(url.toString(), {
+            headers: {
+              Authorization: `Bearer ${token}`,
+            },
           });
-        }
+          const data = await res.json();
+          if (!res.ok) {
+            toast({
+              title: "Failed to fetch tasks",
+              description: data.error || "Unknown error",
+              variant: "destructive",
+            });
+            return;
+          }
+          all = all.concat(data.tasks || []);
+          cursor = data.next_cursor || null;
+        } while (cursor);
+        setTasks(all);
       } catch (error: any) {
         toast({
           title: "Error",
@@ -107,10 +115,29 @@ export default function RunAI() {
         }
       );
 
-      const data = await response.json();
-      clearInterval(progressInterval);
+      let data = await response.json();
 
       if (!response.ok) {
+        clearInterval(progressInterval);
+        throw new Error(data.error || "AI processing failed");
+      }
+
+      // The run is queued (202): poll the job until a worker finishes it
+      while (data.status === "queued" || data.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobResponse = await fetch(
+          `${import.meta.env.VITE_API_URL}/ai-jobs/${data.job_id}`,
+          { headers: { Authorization: `Bearer ${token}` } }
+        );
+        data = await jobResponse.json();
+        if (!jobResponse.ok) {
+          clearInterval(progressInterval);
+          throw new Error(data.error || "AI processing failed");
+        }
+      }
+      clearInterval(progressInterval);
+
+      if (data.status === "error") {
         throw new Error(data.error || "AI processing failed");
       }
 
@@ -43,25 +43,39 @@ type Task = {
 
 export default function Tasks() {
   const [tasks, setTasks] = useState<Task[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState("");
   const [statusFilter, setStatusFilter] = useState("all");
 
-  const fetchTasks = async () => {
+  // GET /tasks returns one page at a time; pass `cursor` to append the next page
+  const fetchTasks = async (cursor?: string) => {
     try {
       const token = localStorage.getItem("token");
-      const response = await axios.get<{ tasks: Task[] }>(
+      const params: Record<string, string> = statusFilter !== "all" ? { status: statusFilter } : {};
+      if (cursor) params.cursor = cursor;
+      const response = await axios.get<{ tasks: Task[]; next_cursor?: string | null }>(
         `${import.meta.env.VITE_API_URL}/tasks`,
         {
           headers: { Authorization: `Bearer ${token}` },
-          params: statusFilter !== "all" ? { status: statusFilter } : {},
+          params,
         }
       );
-      setTasks(response.data.tasks || []);
+      const page = response.data.tasks || [];
+      setTasks((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(response.data.next_cursor || null);
     } catch (err) {
       console.error("Failed to fetch tasks:", err);
     }
   };
 
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    await fetchTasks(nextCursor);
+    setLoadingMore(false);
+  };
+
   const handleDeleteTask = async (taskId: string) => {
     try {
       const token = localStorage.getItem("token");
@@ -219,6 +233,15 @@ export default function Tasks() {
         ))}
       </div>
 
+      {/* Next page */}
+      {nextCursor && (
+        <div className="flex justify-center">
+          <Button variant="outline" onClick={handleLoadMore} disabled={loadingMore}>
+            {loadingMore ? "Loading..." : "Load more tasks"}
+          </Button>
+        </div>
+      )}
+
       {/* Empty state */}
       {filteredTasks.length === 0 && (
         <Card className="bg-card border-border">